@@ -0,0 +1,3 @@
+"""
+Benchmarks running the real FastAPI app against local stand-ins
+"""
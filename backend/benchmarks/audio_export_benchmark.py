@@ -0,0 +1,93 @@
+"""
+Measure encode time and size of podcast audio renditions
+
+Builds a FLAC master from an audio file (or synthetic speech-like audio),
+then encodes every rendition in config.AUDIO_RENDITIONS from it, plus the
+single 256k VBR MP3 the podcast pipeline used to export, for comparison.
+
+Usage (from backend/):
+    python -m benchmarks.audio_export_benchmark [--input talk.wav] [--minutes 10]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_speech(seconds: float, sample_rate: int) -> bytes:
+    """Mono 16-bit PCM of voiced bursts with drifting pitch, noise and pauses"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 140 + 40 * np.sin(2 * np.pi * 0.3 * t) + 20 * np.sin(2 * np.pi * 2.1 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    
+    # Syllables of ~200 ms, with a short pause every few seconds
+    envelope = np.clip(np.sin(2 * np.pi * 2.5 * t), 0, None) * (np.sin(2 * np.pi * 0.2 * t) > -0.8)
+    audio = envelope * (0.25 * voiced + 0.05 * rng.standard_normal(len(t)))
+    return (np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="Audio file to use instead of synthetic speech")
+    parser.add_argument("--minutes", type=float, default=10, help="Length of synthetic audio")
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix="pdf_podcast_audio_")
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+    
+    import config
+    from db.storage import get_local_path
+    from services import audio_export
+    
+    if args.input:
+        pcm_path = os.path.join(workdir, "input.pcm")
+        audio_export.run_ffmpeg(["-i", os.path.abspath(args.input), *audio_export.PCM_INPUT, pcm_path])
+        with open(pcm_path, "rb") as f:
+            pcm = f.read()
+    else:
+        pcm = synthetic_speech(args.minutes * 60, config.SAMPLE_RATE)
+    
+    seconds = len(pcm) / (config.SAMPLE_RATE * audio_export.PCM_SAMPLE_WIDTH * audio_export.PCM_CHANNELS)
+    master_path = f"{config.AUDIO_DIR}/benchmark.flac"
+    
+    started = time.perf_counter()
+    audio_export.write_master([pcm], master_path)
+    master_seconds = time.perf_counter() - started
+    master_size = os.path.getsize(get_local_path(master_path))
+    print(f"{seconds / 60:.1f} min of audio, {len(pcm) / 1e6:.1f} MB PCM")
+    
+    header = f"{'rendition':<14} {'seconds':>8} {'realtime':>9} {'MB':>7} {'vs master':>9}"
+    print(header)
+    print("-" * len(header))
+    
+    def report(name: str, elapsed: float, size: int) -> None:
+        print(f"{name:<14} {elapsed:>8.2f} {seconds / elapsed:>8.0f}x {size / 1e6:>7.2f} {size / master_size:>8.0%}")
+    
+    report("flac master", master_seconds, master_size)
+    
+    # What every podcast used to be exported as
+    legacy_path = os.path.join(workdir, "legacy.mp3")
+    started = time.perf_counter()
+    audio_export.run_ffmpeg([
+        "-i", get_local_path(master_path), "-c:a", "libmp3lame", "-b:a", "256k", "-q:a", "0", legacy_path
+    ])
+    report("mp3 256k q0", time.perf_counter() - started, os.path.getsize(legacy_path))
+    
+    for audio_format, bitrates in config.AUDIO_RENDITIONS.items():
+        for bitrate in sorted(bitrates, key=lambda b: int(b.rstrip("k"))):
+            started = time.perf_counter()
+            path = audio_export.transcode(master_path, audio_format, bitrate)
+            report(f"{audio_format} {bitrate}", time.perf_counter() - started, os.path.getsize(get_local_path(path)))
+    
+    print(f"\nArtifacts in {workdir}")
+
+
+if __name__ == "__main__":
+    main()
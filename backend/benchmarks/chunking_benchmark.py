@@ -0,0 +1,149 @@
+"""
+Compare the layout chunker with the recursive character splitter
+
+For each PDF reports chunking throughput, chunk sizes in tokens (and how
+many exceed the embedder's 256 word-piece input limit) and retrieval
+quality on synthetic queries: sentences sampled from the PDF, searched
+with the configured embedder. A query counts as a hit at k if one of the
+top-k chunks contains the whole sentence (context was not split) and as a
+page hit if one of them is on the sentence's page.
+
+Usage (from backend/):
+    python -m benchmarks.chunking_benchmark [--pdf paper.pdf] [--queries 50]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from typing import Callable, Dict, List
+import fitz  # PyMuPDF
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+DEFAULT_PDFS = [
+    os.path.join(REPO_DIR, "Attention is All you Need.pdf"),
+    os.path.join(REPO_DIR, "Apollo_OnCampus_Paarth.pdf"),
+]
+EMBEDDER_MAX_TOKENS = 256
+
+
+def squash(text: str) -> str:
+    """Lowercase text without whitespace (line breaks differ between extractors)"""
+    return re.sub(r"\s+", "", text).lower()
+
+
+def sample_queries(doc: fitz.Document, count: int, seed: int) -> List[Dict]:
+    """Pick sentences of 8-40 words with the page they appear on"""
+    sentences = []
+    for page_num, page in enumerate(doc, 1):
+        text = re.sub(r"\s+", " ", page.get_text())
+        for sentence in re.split(r"(?<=[.!?])\s+", text):
+            if 8 <= len(sentence.split()) <= 40:
+                sentences.append({"text": sentence, "page": page_num})
+    
+    random.Random(seed).shuffle(sentences)
+    return sentences[:count]
+
+
+def evaluate(chunks: List[Dict], queries: List[Dict], top_k: int) -> Dict[str, float]:
+    """Embed chunks and measure sentence and page hit rates for the queries"""
+    import config
+    import faiss
+    
+    embeddings = config.embedder.encode([c["text"] for c in chunks]).astype("float32")
+    index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(embeddings)
+    
+    query_embeddings = config.embedder.encode([q["text"] for q in queries]).astype("float32")
+    _, hits = index.search(query_embeddings, top_k)
+    
+    squashed = [squash(c["text"]) for c in chunks]
+    sentence_hits = 0
+    page_hits = 0
+    reciprocal_ranks = []
+    for query, row in zip(queries, hits):
+        target = squash(query["text"])
+        ranks = [rank for rank, idx in enumerate(row, 1) if idx >= 0 and target in squashed[idx]]
+        sentence_hits += bool(ranks)
+        reciprocal_ranks.append(1 / ranks[0] if ranks else 0.0)
+        page_hits += any(idx >= 0 and chunks[idx]["page"] == query["page"] for idx in row)
+    
+    total = max(len(queries), 1)
+    return {
+        f"sentence@{top_k}": sentence_hits / total,
+        "mrr": float(np.mean(reciprocal_ranks)) if reciprocal_ranks else 0.0,
+        f"page@{top_k}": page_hits / total,
+    }
+
+
+def run_chunker(name: str, chunk: Callable[[], List[Dict]], pages: int, repeats: int) -> Dict:
+    """Time a chunker over several runs"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        chunks = chunk()
+        timings.append(time.perf_counter() - started)
+    
+    from utils.text import count_tokens
+    tokens = np.array([count_tokens(c["text"]) for c in chunks] or [0])
+    best = min(timings)
+    return {
+        "chunker": name,
+        "chunks": chunks,
+        "ms": best * 1000,
+        "pages_per_s": pages / best if best else 0.0,
+        "mean_tokens": float(tokens.mean()),
+        "max_tokens": int(tokens.max()),
+        "over_limit": int((tokens > EMBEDDER_MAX_TOKENS).sum()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", action="append", help="PDF to test (repeatable, defaults to the bundled PDFs)")
+    parser.add_argument("--queries", type=int, default=50, help="Synthetic queries per PDF")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=3, help="Timing runs per chunker")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    
+    sys.path.insert(0, BACKEND_DIR)
+    from services import chunker, layout, page_store, pdf_service
+    
+    header = (f"{'document':<32} {'chunker':<10} {'chunks':>6} {'ms':>8} {'pages/s':>8} "
+              f"{'tok avg':>7} {'tok max':>7} {'>256':>5} {'sent@k':>7} {'mrr':>6} {'page@k':>7}")
+    print(header)
+    print("-" * len(header))
+    
+    for pdf in [os.path.abspath(p) for p in (args.pdf or DEFAULT_PDFS)]:
+        doc = fitz.open(pdf)
+        queries = sample_queries(doc, args.queries, args.seed)
+        label = os.path.basename(pdf)[:32]
+
+        def recursive() -> List[Dict]:
+            text = "\n\n".join(f"[PAGE {n}]\n{page.get_text()}" for n, page in enumerate(doc, 1))
+            return pdf_service.chunk_text(text)
+
+        def layout_chunks() -> List[Dict]:
+            # The ingestion path: page records, then blocks rebuilt from them
+            pages = [layout.extract_page(page, n) for n, page in enumerate(doc, 1)]
+            return chunker.chunk_blocks(page_store.pages_to_blocks(pages))
+        
+        for name, chunk in (("recursive", recursive), ("layout", layout_chunks)):
+            result = run_chunker(name, chunk, doc.page_count, args.repeats)
+            quality = evaluate(result["chunks"], queries, args.top_k)
+            values = list(quality.values())
+            print(
+                f"{label:<32} {name:<10} {len(result['chunks']):>6} {result['ms']:>8.1f} "
+                f"{result['pages_per_s']:>8.1f} {result['mean_tokens']:>7.1f} {result['max_tokens']:>7} "
+                f"{result['over_limit']:>5} {values[0]:>7.2f} {values[1]:>6.2f} {values[2]:>7.2f}"
+            )
+        
+        doc.close()
+
+
+if __name__ == "__main__":
+    main()
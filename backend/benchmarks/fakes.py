@@ -0,0 +1,284 @@
+"""
+Deterministic local stand-ins for Gemini, Cartesia and MongoDB
+"""
+import asyncio
+import io
+import json
+import math
+import re
+import struct
+import time
+import wave
+from types import SimpleNamespace
+from typing import Iterator
+from mongomock_motor import AsyncMongoMockClient
+import config
+from db import mongodb
+
+# Exchanges generated per podcast duration
+SCRIPT_LINES = {"short": 16, "medium": 32, "long": 64}
+
+# Exchanges per chapter
+CHAPTER_LINES = 8
+
+# Synthetic speech rate used to size fake TTS output
+SECONDS_PER_CHAR = 0.06
+
+# Simulated setup time of a TTS WebSocket connection
+CONNECT_SECONDS = 0.05
+
+
+class FakeGeminiModel:
+    """
+    Stand-in for genai.GenerativeModel returning canned responses
+    
+    Scripts are returned as structured JSON. The next `malformed` scripts
+    give one turn to a speaker outside the roster; repairs fix it unless
+    `stubborn` is set.
+    """
+    
+    def __init__(self, latency_s: float = 0.5):
+        self.latency_s = latency_s
+        self.calls = 0
+        self.malformed = 0
+        self.stubborn = False
+    
+    def _respond(self, prompt: str) -> SimpleNamespace:
+        self.calls += 1
+        
+        if "STANDALONE QUESTION:" in prompt:
+            match = re.search(r"FOLLOW-UP QUESTION: (.*)", prompt)
+            text = match.group(1) if match else "question"
+        elif "failed validation" in prompt:
+            text = self._repair(prompt)
+        elif "CHAPTER TO REWRITE" in prompt:
+            names = self._speakers(prompt)
+            text = self._script({"turns": [
+                self._turn(names, i, f"Rewritten line {i} of this chapter, now with a fresh example from the document.")
+                for i in range(4)
+            ]})
+        elif "podcast script" in prompt:
+            text = self._podcast_script(prompt)
+        else:
+            text = "According to page 1, the document answers the question. " * 5
+        
+        return SimpleNamespace(
+            text=text,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=len(prompt) // 4,
+                candidates_token_count=len(text) // 4
+            )
+        )
+    
+    def _speakers(self, prompt: str) -> list:
+        """Host names of a script prompt"""
+        return re.findall(r"^- Host \d+ \((.+?)\):", prompt, re.MULTILINE) or ["Alex", "Sam"]
+    
+    def _turn(self, names: list, i: int, text: str) -> dict:
+        turn = {"speaker": names[i % len(names)], "text": text}
+        if i % 3 == 2:
+            turn["emotion"] = "curious"
+        return turn
+    
+    def _script(self, script: dict) -> str:
+        """Serialize a script, spoiling one turn while malformed scripts are due"""
+        if self.malformed:
+            self.malformed -= 1
+            turns = script["turns"] if "turns" in script else script["chapters"][0]["turns"]
+            turns[0]["speaker"] = "Narrator"
+        return json.dumps(script)
+    
+    def _repair(self, prompt: str) -> str:
+        """Give turns of unknown speakers to the first speaker of the roster"""
+        broken = prompt.split("JSON:\n", 1)[1]
+        if self.stubborn:
+            return broken
+        
+        names = re.search(r"^SPEAKERS: (.*)$", prompt, re.MULTILINE).group(1).split(", ")
+        script = json.loads(broken)
+        for chapter in script.get("chapters", [script]):
+            for turn in chapter["turns"]:
+                if turn["speaker"] not in names:
+                    turn["speaker"] = names[0]
+        return json.dumps(script)
+    
+    def _podcast_script(self, prompt: str) -> str:
+        lines = SCRIPT_LINES["medium"]
+        for duration, desc in config.DURATION_MAP.items():
+            if desc in prompt:
+                lines = SCRIPT_LINES[duration]
+        
+        names = self._speakers(prompt)
+        chapters = []
+        for i in range(lines):
+            if i % CHAPTER_LINES == 0:
+                chapters.append({"title": f"Part {i // CHAPTER_LINES + 1}", "turns": []})
+            chapters[-1]["turns"].append(self._turn(
+                names,
+                i,
+                f"This is line {i} of the discussion, covering one more idea from the document in a sentence or two."
+            ))
+        return self._script({"chapters": chapters})
+    
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(self.latency_s)
+        return self._respond(prompt)
+    
+    async def generate_content_async(self, prompt, **kwargs):
+        await asyncio.sleep(self.latency_s)
+        return self._respond(prompt)
+
+
+def synthetic_pcm(duration_s: float, sample_rate: int = config.SAMPLE_RATE) -> bytes:
+    """
+    Build mono 16-bit PCM with a quiet tone
+    
+    Args:
+        duration_s: Audio duration in seconds
+        sample_rate: Sample rate in Hz
+    
+    Returns:
+        Raw PCM bytes
+    """
+    frames = int(duration_s * sample_rate)
+    period = sample_rate // 220
+    cycle = b"".join(
+        struct.pack("<h", int(3000 * math.sin(2 * math.pi * i / period)))
+        for i in range(period)
+    )
+    return (cycle * (frames // period + 1))[:frames * 2]
+
+
+def synthetic_wav(duration_s: float, sample_rate: int = config.SAMPLE_RATE) -> bytes:
+    """
+    Build a mono 16-bit PCM WAV with a quiet tone
+    
+    Args:
+        duration_s: Audio duration in seconds
+        sample_rate: Sample rate in Hz
+        
+    Returns:
+        WAV file bytes
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(synthetic_pcm(duration_s, sample_rate))
+    
+    return buffer.getvalue()
+
+
+class FakeCartesiaContext:
+    """Stand-in for a Cartesia WebSocket context"""
+    
+    def __init__(self, tts: "FakeCartesiaTTS", output_format: dict):
+        self.tts = tts
+        self.sample_rate = output_format.get("sample_rate", config.SAMPLE_RATE)
+        self.pending = []
+        self.lines = 0
+        self.finished = False
+    
+    def push(self, transcript: str, flush: bool = False, **kwargs) -> None:
+        self.tts.calls += 1
+        self.tts.continued += 1 if self.lines else 0
+        self.lines += 1
+        self.pending.append(transcript)
+    
+    def no_more_inputs(self) -> None:
+        self.finished = True
+    
+    def receive(self) -> Iterator[SimpleNamespace]:
+        if self.pending:
+            time.sleep(self.tts.latency_s)
+            audio = synthetic_pcm(len("".join(self.pending)) * SECONDS_PER_CHAR, self.sample_rate)
+            self.pending = []
+            for start in range(0, len(audio), 16 * 1024):
+                yield SimpleNamespace(type="chunk", audio=audio[start:start + 16 * 1024])
+            yield SimpleNamespace(type="flush_done")
+        
+        if self.finished:
+            yield SimpleNamespace(type="done")
+
+
+class FakeCartesiaSocket:
+    """Stand-in for a Cartesia TTS WebSocket connection"""
+    
+    def __init__(self, tts: "FakeCartesiaTTS"):
+        self.tts = tts
+    
+    def context(self, output_format: dict, **kwargs) -> FakeCartesiaContext:
+        return FakeCartesiaContext(self.tts, output_format)
+    
+    def close(self) -> None:
+        pass
+
+
+class FakeCartesiaTTS:
+    """Stand-in for Cartesia's tts resource"""
+    
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+        self.calls = 0
+        self.continued = 0
+        self.connections = 0
+    
+    def bytes(self, model_id: str, transcript: str, voice: dict, output_format: dict, **kwargs) -> Iterator[bytes]:
+        self.calls += 1
+        time.sleep(self.latency_s)
+        
+        audio = synthetic_wav(
+            len(transcript) * SECONDS_PER_CHAR,
+            output_format.get("sample_rate", config.SAMPLE_RATE)
+        )
+        
+        # Stream in chunks like the real client
+        for start in range(0, len(audio), 64 * 1024):
+            yield audio[start:start + 64 * 1024]
+    
+    def websocket_connect(self) -> SimpleNamespace:
+        def enter() -> FakeCartesiaSocket:
+            self.connections += 1
+            time.sleep(CONNECT_SECONDS)
+            return FakeCartesiaSocket(self)
+        
+        return SimpleNamespace(enter=enter)
+
+
+class FakeCartesiaClient:
+    """Stand-in for cartesia.Cartesia"""
+    
+    def __init__(self, latency_s: float = 0.3):
+        self.tts = FakeCartesiaTTS(latency_s)
+
+
+def install_fakes(gemini_latency_s: float, tts_latency_s: float) -> SimpleNamespace:
+    """
+    Replace Gemini, Cartesia and MongoDB with local stand-ins
+    
+    Args:
+        gemini_latency_s: Simulated latency per Gemini call
+        tts_latency_s: Simulated latency per TTS segment
+        
+    Returns:
+        Namespace with the installed fakes
+    """
+    fakes = SimpleNamespace(
+        gemini=FakeGeminiModel(gemini_latency_s),
+        cartesia=FakeCartesiaClient(tts_latency_s),
+        mongo=AsyncMongoMockClient()
+    )
+    
+    config.gemini_model = fakes.gemini
+    config.cartesia_client = fakes.cartesia
+    config.CARTESIA_API_KEY = config.CARTESIA_API_KEY or "fake"
+    
+    db = fakes.mongo[config.DATABASE_NAME]
+    mongodb._mongo_client = fakes.mongo
+    mongodb._db = db
+    mongodb._projects_collection = db[config.COLLECTION_NAME]
+    mongodb._chat_sessions_collection = db[config.CHAT_SESSIONS_COLLECTION]
+    mongodb._documents_collection = db[config.DOCUMENTS_COLLECTION]
+    
+    return fakes
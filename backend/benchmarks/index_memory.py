@@ -0,0 +1,79 @@
+"""
+Measure worker memory as the number of hot FAISS indexes grows
+
+Builds synthetic indexes, then loads and searches them one by one, both
+fully deserialized (faiss.read_index) and through vector_service's
+memory-mapped cache, printing private (anonymous) and file-backed resident
+memory. Mapped vectors show up as file-backed pages, which the kernel
+shares between workers, so private memory should stay flat.
+
+Usage (from backend/):
+    python -m benchmarks.index_memory [--indexes 16] [--vectors 20000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import faiss
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def resident_mb() -> tuple[float, float]:
+    """Private and file-backed resident memory of this process in MB (Linux)"""
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                name, amount, _ = line.split()
+                values[name] = int(amount) / 1024
+    return values.get("RssAnon:", 0.0), values.get("RssFile:", 0.0)
+
+
+def run(label: str, keys: list, load, dimension: int) -> None:
+    print(f"\n{label}")
+    print(f"  {'indexes':>7} {'private MB':>11} {'file MB':>9}")
+    
+    query = np.random.rand(1, dimension).astype("float32")
+    held = []
+    for i, key in enumerate(keys, 1):
+        index = load(key)
+        index.search(query, 5)
+        held.append(index)
+        
+        anon, file_backed = resident_mb()
+        print(f"  {i:>7} {anon:>11.1f} {file_backed:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--indexes", type=int, default=16, help="Number of hot indexes")
+    parser.add_argument("--vectors", type=int, default=20000, help="Vectors per index")
+    parser.add_argument("--dimension", type=int, default=384, help="Embedding dimension")
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix="pdf_podcast_index_")
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+    
+    from services import vector_service
+    
+    keys = []
+    for i in range(args.indexes):
+        index = faiss.IndexFlatL2(args.dimension)
+        index.add(np.random.rand(args.vectors, args.dimension).astype("float32"))
+        keys.append(vector_service.save_faiss_index(index, f"uploads/documents/bench_{i}/index.faiss"))
+        del index
+    
+    size_mb = args.vectors * args.dimension * 4 / (1024 * 1024)
+    print(f"{args.indexes} indexes of {args.vectors} x {args.dimension} ({size_mb:.1f} MB each)")
+    
+    run("memory-mapped (vector_service.load_faiss_index)", keys, vector_service.load_faiss_index, args.dimension)
+    run("fully loaded (faiss.read_index)", keys, faiss.read_index, args.dimension)
+    
+    print(f"\nArtifacts in {workdir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compare the loudness stage with per-segment pydub peak normalization
+
+Builds a dialogue of synthetic segments where the two voices differ in
+level and crest factor (one has plosive-like transients), then levels it
+both ways: the former pydub loop (normalize() per segment and
+concatenation) and loudness.normalize_programme. Reports time, the
+loudness spread between segments and the programme's true peak.
+
+Usage (from backend/):
+    python -m benchmarks.loudness_benchmark [--minutes 10] [--segment-seconds 6]
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def dialogue(minutes: float, segment_seconds: float, sample_rate: int) -> list:
+    """16-bit PCM segments alternating between a quiet voice and a louder, peakier one"""
+    from benchmarks.audio_export_benchmark import synthetic_speech
+    
+    rng = np.random.default_rng(1)
+    speech = np.frombuffer(synthetic_speech(segment_seconds * 4, sample_rate), dtype="<i2") / 32768
+    length = int(segment_seconds * sample_rate)
+    segments = []
+    for i in range(int(minutes * 60 / segment_seconds)):
+        start = rng.integers(0, len(speech) - length)
+        x = speech[start:start + length] * rng.uniform(0.6, 1.0)
+        if i % 2:
+            x = x * 1.8
+            x[rng.integers(0, length, 20)] += rng.choice([-0.6, 0.6], 20)
+        else:
+            x = x * 0.35
+        segments.append((np.clip(x, -1, 32767 / 32768) * 32768).astype("<i2").tobytes())
+    return segments
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=10, help="Programme length")
+    parser.add_argument("--segment-seconds", type=float, default=6, help="Length of each line")
+    args = parser.parse_args()
+    
+    sys.path.insert(0, BACKEND_DIR)
+    import config
+    from pydub import AudioSegment
+    from services import loudness
+    
+    rate = config.SAMPLE_RATE
+    segments = dialogue(args.minutes, args.segment_seconds, rate)
+    
+    def measure(pcm: bytes) -> tuple[float, float]:
+        x = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768
+        length = len(x) // len(segments)
+        levels = [loudness.integrated_loudness(x[i * length:(i + 1) * length], rate) for i in range(len(segments))]
+        true_peak = 20 * np.log10(loudness.true_peak_envelope(x).max())
+        return float(np.ptp(levels)), float(true_peak)
+    
+    header = f"{'stage':<16} {'seconds':>8} {'spread LU':>10} {'peak dBTP':>10}"
+    print(f"{len(segments)} segments, {args.minutes:.0f} min")
+    print(header)
+    print("-" * len(header))
+    
+    started = time.perf_counter()
+    programme = AudioSegment.empty()
+    for pcm in segments:
+        programme += AudioSegment(data=pcm, sample_width=2, frame_rate=rate, channels=1).normalize()
+    elapsed = time.perf_counter() - started
+    spread, peak = measure(programme.raw_data)
+    print(f"{'pydub normalize':<16} {elapsed:>8.2f} {spread:>10.2f} {peak:>10.2f}")
+    
+    started = time.perf_counter()
+    pcm, stats = loudness.normalize_programme(segments, rate)
+    elapsed = time.perf_counter() - started
+    spread, peak = measure(pcm)
+    print(f"{'loudness stage':<16} {elapsed:>8.2f} {spread:>10.2f} {peak:>10.2f}")
+    print(f"\nProgramme {stats['input_lufs']} -> {stats['output_lufs']} LUFS, limiter up to {stats['limited_db']} dB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Measure OCR throughput on a mixed scanned/digital PDF
+
+Builds a PDF from the first pages of a source PDF, rasterizing every
+--scan-every'th page into an image-only "scan", then extracts it through
+page_store.extract_pages with growing OCR pool sizes. Each pool size runs
+on a cold OCR cache; a final run shows the cached re-ingest. Requires
+Tesseract language data (TESSDATA_PREFIX or a tesseract install).
+
+Usage (from backend/):
+    python -m benchmarks.ocr_benchmark [--pdf paper.pdf] [--pages 8] [--workers 1 2 4]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import fitz  # PyMuPDF
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+DEFAULT_PDF = os.path.join(REPO_DIR, "Attention is All you Need.pdf")
+
+
+def build_mixed_pdf(source: str, target: str, pages: int, scan_every: int, scan_dpi: int) -> int:
+    """Copy digital pages and rasterize every scan_every'th one; returns the scan count"""
+    src = fitz.open(source)
+    out = fitz.open()
+    scans = 0
+    for i in range(min(pages, src.page_count)):
+        if i % scan_every == scan_every - 1:
+            page = out.new_page(width=src[i].rect.width, height=src[i].rect.height)
+            page.insert_image(page.rect, pixmap=src[i].get_pixmap(dpi=scan_dpi))
+            scans += 1
+        else:
+            out.insert_pdf(src, from_page=i, to_page=i)
+    
+    out.save(target)
+    out.close()
+    src.close()
+    return scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="Source PDF")
+    parser.add_argument("--pages", type=int, default=8, help="Pages taken from the source")
+    parser.add_argument("--scan-every", type=int, default=2, help="Rasterize every n-th page")
+    parser.add_argument("--scan-dpi", type=int, default=150, help="Resolution of the simulated scans")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="OCR pool sizes to try")
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix="pdf_podcast_ocr_")
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+    
+    import config
+    from services import ocr_service, page_store
+    
+    if ocr_service.get_tessdata() is None:
+        sys.exit("Tesseract language data not found; set TESSDATA_PREFIX")
+    
+    pdf_key = f"{config.UPLOAD_DIR}/blobs/ocr_benchmark.pdf"
+    os.makedirs(os.path.dirname(pdf_key), exist_ok=True)
+    scans = build_mixed_pdf(os.path.abspath(args.pdf), pdf_key, args.pages, args.scan_every, args.scan_dpi)
+    print(f"{args.pages} pages, {scans} scanned, OCR at {config.OCR_DPI} dpi ({config.OCR_LANGUAGE})")
+    
+    header = f"{'workers':>7} {'cache':>6} {'seconds':>8} {'scans/s':>8} {'chars':>8}"
+    print(header)
+    print("-" * len(header))
+
+    def run(workers: int, cache: str) -> None:
+        started = time.perf_counter()
+        pages = page_store.extract_pages(pdf_key)
+        elapsed = time.perf_counter() - started
+        chars = sum(len(page["text"].strip()) for page in pages)
+        print(f"{workers:>7} {cache:>6} {elapsed:>8.2f} {scans / elapsed:>8.2f} {chars:>8}")
+    
+    for workers in args.workers:
+        config.OCR_WORKERS = workers
+        ocr_service.reset_ocr_pool()
+        shutil.rmtree(f"{config.UPLOAD_DIR}/ocr", ignore_errors=True)
+        
+        # Start the workers before timing, as a long-running server would have
+        ocr_service.get_ocr_pool().submit(os.getpid).result()
+        run(workers, "cold")
+    
+    run(args.workers[-1], "warm")
+    ocr_service.reset_ocr_pool()
+    print(f"\nArtifacts in {workdir}")
+
+
+if __name__ == "__main__":
+    main()
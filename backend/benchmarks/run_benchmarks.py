@@ -0,0 +1,305 @@
+"""
+End-to-end benchmarks for upload_pdf, /chat and /generate_podcast
+
+The podcast_stream scenario reports time to first audio of streamed
+podcasts instead of full request latency.
+
+Runs the real FastAPI app in-process against local stand-ins for Gemini,
+Cartesia and MongoDB, using the bundled PDFs as fixtures.
+
+Usage (from backend/):
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.run_benchmarks --concurrency 1,4,16 --pages 1,5,all
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List
+import fitz  # PyMuPDF
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+DEFAULT_PDFS = [
+    os.path.join(REPO_DIR, "Attention is All you Need.pdf"),
+    os.path.join(REPO_DIR, "Apollo_OnCampus_Paarth.pdf"),
+]
+
+CHAT_QUERIES = [
+    "What is the main contribution of the document?",
+    "How does the attention mechanism work?",
+    "What results are reported?",
+    "Which datasets are used?",
+    "What are the limitations?",
+]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="upload,chat,podcast",
+                        help="Comma-separated scenarios to run")
+    parser.add_argument("--concurrency", default="1,4,16",
+                        help="Comma-separated concurrency levels")
+    parser.add_argument("--pages", default="1,5,all",
+                        help="Comma-separated document sizes in pages ('all' for full PDF)")
+    parser.add_argument("--pdf", action="append",
+                        help="Fixture PDF (repeatable, defaults to the bundled PDFs)")
+    parser.add_argument("--requests", type=int, default=32,
+                        help="Requests per scenario/size/concurrency run")
+    parser.add_argument("--podcast-requests", type=int, default=4,
+                        help="Requests per podcast run (each synthesizes many segments)")
+    parser.add_argument("--podcast-duration", default="short", choices=["short", "medium", "long"])
+    parser.add_argument("--gemini-latency", type=float, default=0.5,
+                        help="Simulated seconds per Gemini call")
+    parser.add_argument("--tts-latency", type=float, default=0.2,
+                        help="Simulated seconds per TTS segment")
+    parser.add_argument("--llm-rpm", type=int, default=6000,
+                        help="Gateway rate limit used during the run")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    return parser.parse_args()
+
+
+def build_fixtures(pdfs: List[str], sizes: List[str], workdir: str) -> Dict[str, str]:
+    """
+    Create page-truncated copies of the fixture PDFs
+    
+    Returns:
+        Mapping of fixture label to PDF path
+    """
+    fixtures = {}
+    for pdf in pdfs:
+        source = fitz.open(pdf)
+        stem = os.path.splitext(os.path.basename(pdf))[0].replace(" ", "_")
+        
+        for size in sizes:
+            pages = source.page_count if size == "all" else min(int(size), source.page_count)
+            label = f"{stem}[{pages}p]"
+            if label in fixtures:
+                continue
+            
+            path = os.path.join(workdir, f"{stem}_{pages}p.pdf")
+            subset = fitz.open()
+            subset.insert_pdf(source, from_page=0, to_page=pages - 1)
+            subset.save(path)
+            subset.close()
+            fixtures[label] = path
+        
+        source.close()
+    
+    return fixtures
+
+
+def summarize(latencies: List[float], errors: int, wall_s: float) -> Dict[str, float]:
+    """Compute throughput and latency percentiles (ms)"""
+    data = np.array(latencies) * 1000 if latencies else np.array([0.0])
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": len(latencies) / wall_s if wall_s else 0.0,
+        "p50_ms": float(np.percentile(data, 50)),
+        "p95_ms": float(np.percentile(data, 95)),
+        "p99_ms": float(np.percentile(data, 99)),
+    }
+
+
+async def run_load(
+    total: int,
+    concurrency: int,
+    make_request: Callable[[int], Awaitable[httpx.Response]]
+) -> Dict[str, float]:
+    """Issue `total` requests with at most `concurrency` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await make_request(i)
+            elapsed = time.perf_counter() - started
+            
+            if response.status_code == 200:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+                print(f"  request {i} failed: {response.status_code} {response.text[:200]}")
+    
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(total)])
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def create_project(client: httpx.AsyncClient, name: str) -> str:
+    response = await client.post("/projects", json={"name": name})
+    response.raise_for_status()
+    return response.json()["project_id"]
+
+
+async def upload(client: httpx.AsyncClient, project_id: str, pdf_path: str) -> httpx.Response:
+    with open(pdf_path, "rb") as f:
+        content = f.read()
+    
+    return await client.post(
+        f"/projects/{project_id}/upload_pdf",
+        files={"file": (os.path.basename(pdf_path), content, "application/pdf")}
+    )
+
+
+async def bench_upload(client, pdf_path, concurrency, args) -> Dict[str, float]:
+    projects = [await create_project(client, f"upload-{i}") for i in range(args.requests)]
+    return await run_load(
+        args.requests,
+        concurrency,
+        lambda i: upload(client, projects[i], pdf_path)
+    )
+
+
+async def bench_chat(client, pdf_path, concurrency, args) -> Dict[str, float]:
+    project_id = await create_project(client, "chat")
+    (await upload(client, project_id, pdf_path)).raise_for_status()
+    
+    return await run_load(
+        args.requests,
+        concurrency,
+        lambda i: client.post("/chat", json={
+            "project_id": project_id,
+            "query": f"{CHAT_QUERIES[i % len(CHAT_QUERIES)]} (#{i})",
+            "top_k": 5
+        })
+    )
+
+
+async def bench_podcast(client, pdf_path, concurrency, args) -> Dict[str, float]:
+    project_id = await create_project(client, "podcast")
+    (await upload(client, project_id, pdf_path)).raise_for_status()
+    
+    # Distinct topics so requests are not deduplicated into one job
+    return await run_load(
+        args.podcast_requests,
+        concurrency,
+        lambda i: client.post("/generate_podcast", json={
+            "project_id": project_id,
+            "topic": f"benchmark topic {i}",
+            "duration": args.podcast_duration
+        })
+    )
+
+
+async def bench_podcast_stream(client, pdf_path, concurrency, args) -> Dict[str, float]:
+    """Time to first audio of streamed podcasts (latencies are until the first chunk)"""
+    project_id = await create_project(client, "podcast-stream")
+    (await upload(client, project_id, pdf_path)).raise_for_status()
+    
+    from routes import podcast_routes
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+    
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/generate_podcast/stream", json={
+                "project_id": project_id,
+                "topic": f"stream topic {i}",
+                "duration": args.podcast_duration
+            })
+            if response.status_code != 200:
+                errors += 1
+                return
+            
+            # The in-process transport buffers bodies, so read the stream directly
+            stream = podcast_routes._audio_streams.get(response.json()["podcast_id"])
+            first = None
+            async for _ in stream.iter_chunks():
+                first = first or time.perf_counter() - started
+            
+            if first is None:
+                errors += 1
+            else:
+                latencies.append(first)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(args.podcast_requests)])
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+SCENARIOS = {
+    "upload": bench_upload,
+    "chat": bench_chat,
+    "podcast": bench_podcast,
+    "podcast_stream": bench_podcast_stream,
+}
+
+
+async def main_async(args: argparse.Namespace) -> List[Dict]:
+    workdir = tempfile.mkdtemp(prefix="pdf_podcast_bench_")
+    pdfs = [os.path.abspath(p) for p in (args.pdf or DEFAULT_PDFS)]
+    sizes = [s.strip() for s in args.pages.split(",")]
+    fixtures = build_fixtures(pdfs, sizes, workdir)
+    
+    # Keep uploads/outputs of the run out of the working tree
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+    
+    import config
+    config.LLM_REQUESTS_PER_MINUTE = args.llm_rpm
+    config.LLM_BURST = max(config.LLM_BURST, args.llm_rpm // 60)
+    config.LLM_MAX_CONCURRENCY = max(config.LLM_MAX_CONCURRENCY, 64)
+    
+    from benchmarks.fakes import install_fakes
+    from main import app
+    
+    fakes = install_fakes(args.gemini_latency, args.tts_latency)
+    
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for scenario in [s.strip() for s in args.scenarios.split(",")]:
+            for label, pdf_path in fixtures.items():
+                for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                    print(f"Running {scenario} on {label} at concurrency {concurrency}...")
+                    stats = await SCENARIOS[scenario](client, pdf_path, concurrency, args)
+                    results.append({
+                        "scenario": scenario,
+                        "document": label,
+                        "concurrency": concurrency,
+                        **stats
+                    })
+    
+    print(f"\nGemini calls: {fakes.gemini.calls}, TTS calls: {fakes.cartesia.tts.calls}")
+    print(f"Artifacts in {workdir}")
+    return results
+
+
+def print_report(results: List[Dict]) -> None:
+    header = f"{'scenario':<14} {'document':<40} {'conc':>4} {'reqs':>5} {'err':>4} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print("\n" + header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['scenario']:<14} {r['document']:<40} {r['concurrency']:>4} {r['requests']:>5} "
+            f"{r['errors']:>4} {r['throughput_rps']:>8.2f} {r['p50_ms']:>9.1f} "
+            f"{r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}"
+        )
+
+
+def main():
+    args = parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+    results = asyncio.run(main_async(args))
+    print_report(results)
+    
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Compare the throughput of TTS providers and Cartesia transports
+
+Synthesizes the same podcast lines with every provider available on this
+node (Cartesia, Piper, espeak-ng) at growing concurrency and reports line
+latency, characters per second and the real-time factor (seconds of audio
+per second of wall time). Without CARTESIA_API_KEY, Cartesia is replaced by
+the benchmark stand-in with --cartesia-latency per line.
+
+The lines are then voiced as podcasts through tts_service, once with a
+request per line and once over pooled WebSocket connections (speakers'
+lines sent as continuations), reporting per-line and first-audio latency
+and how often connections were reused. With --outage the stand-in stops
+answering, showing the cost of failing over to espeak-ng.
+
+Usage (from backend/):
+    python -m benchmarks.tts_benchmark [--lines 24] [--concurrency 1 4] [--podcasts 3] [--outage]
+"""
+import argparse
+import asyncio
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LINES = [
+    "Welcome back to the show. Today we are looking at a paper that changed how we build language models.",
+    "So what problem were the authors actually trying to solve?",
+    "Recurrent networks process tokens one after another, which makes training slow on long sequences.",
+    "And attention lets every position look at every other position at once.",
+    "Exactly, and because there is no recurrence, the whole sequence can be processed in parallel.",
+    "That sounds expensive for long inputs, though.",
+    "It is quadratic in the sequence length, which is why so much later work tries to approximate it.",
+    "Let's talk about the results on machine translation.",
+]
+
+
+def audio_seconds(wav: bytes) -> float:
+    """Duration of WAV audio (tolerates the open-ended headers of streamed WAV)"""
+    from pydub import AudioSegment
+    return len(AudioSegment.from_wav(io.BytesIO(wav))) / 1000
+
+
+def run_provider(provider, voice: str, lines: list, concurrency: int) -> dict:
+    """Synthesize lines with one provider and measure throughput"""
+    def synthesize(text: str) -> tuple[float, float]:
+        started = time.perf_counter()
+        wav = provider.synthesize(text, voice)
+        return time.perf_counter() - started, audio_seconds(wav)
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(synthesize, lines))
+    elapsed = time.perf_counter() - started
+    
+    latencies = sorted(latency for latency, _ in results)
+    audio = sum(seconds for _, seconds in results)
+    return {
+        "elapsed": elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "chars_per_s": sum(len(line) for line in lines) / elapsed,
+        "realtime": audio / elapsed,
+    }
+
+
+def sample(name: str, **labels) -> float:
+    """Current value of a Prometheus sample (0 if not recorded yet)"""
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+async def run_podcasts(lines: list, podcasts: int) -> dict:
+    """Voice lines as podcasts through tts_service, one podcast after another"""
+    from services import podcast_service, tts_service
+    
+    speakers = podcast_service.build_roster()
+    segments = [{"speaker": speakers[i % len(speakers)]["key"], "text": text} for i, text in enumerate(lines)]
+    names = [
+        ("tts_request_duration_seconds_sum", {"provider": "cartesia"}),
+        ("tts_request_duration_seconds_count", {"provider": "cartesia"}),
+        ("tts_first_audio_seconds_sum", {"provider": "cartesia"}),
+        ("tts_first_audio_seconds_count", {"provider": "cartesia"}),
+        ("tts_websocket_connections_total", {"event": "opened"}),
+        ("tts_websocket_connections_total", {"event": "reused"}),
+    ]
+    before = [sample(name, **labels) for name, labels in names]
+    
+    used = {}
+    started = time.perf_counter()
+    for podcast in range(podcasts):
+        records, _ = await tts_service.synthesize_segments(segments, f"benchmark-{time.time_ns()}", speakers)
+        used["failed"] = used.get("failed", 0) + sum(1 for record in records if not record["audio_path"])
+    elapsed = time.perf_counter() - started
+    
+    line_sum, lines_done, first_sum, first_count, opened, reused = [
+        sample(name, **labels) - value for (name, labels), value in zip(names, before)
+    ]
+    return {
+        "elapsed": elapsed,
+        "line": line_sum / max(lines_done, 1),
+        "first": first_sum / max(first_count, 1),
+        "opened": int(opened),
+        "reused": int(reused),
+        "failed": used["failed"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=24, help="Lines synthesized per run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="Concurrent requests to try")
+    parser.add_argument("--providers", nargs="+", default=["cartesia", "piper", "espeak"], help="Providers to compare")
+    parser.add_argument("--cartesia-latency", type=float, default=0.4, help="Latency of the Cartesia stand-in")
+    parser.add_argument("--podcasts", type=int, default=3, help="Podcasts voiced per Cartesia transport")
+    parser.add_argument("--outage", action="store_true", help="Route lines while Cartesia hangs")
+    parser.add_argument("--attempt-timeout", type=float, help="Override TTS_ATTEMPT_TIMEOUT_S for --outage")
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix="pdf_podcast_tts_")
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+    import config
+    from benchmarks.fakes import FakeCartesiaClient
+    from services.tts_providers import get_tts_provider
+    
+    stand_in = not config.CARTESIA_API_KEY
+    if stand_in:
+        print(f"No CARTESIA_API_KEY: Cartesia is a stand-in with {args.cartesia_latency}s per line")
+        config.cartesia_client = FakeCartesiaClient(args.cartesia_latency)
+        config.CARTESIA_API_KEY = "fake"
+    
+    # Repeated lines get a suffix: segments of the same text would be reused
+    lines = [
+        LINES[i % len(LINES)] + (f" Take {i // len(LINES) + 1}." if i >= len(LINES) else "")
+        for i in range(args.lines)
+    ]
+    header = f"{'provider':<10} {'workers':>7} {'seconds':>8} {'p50 s':>7} {'p95 s':>7} {'chars/s':>8} {'x realtime':>10}"
+    print(f"{len(lines)} lines, {sum(len(line) for line in lines)} characters")
+    print(header)
+    print("-" * len(header))
+    
+    for name in args.providers:
+        provider = get_tts_provider(name)
+        voice = config.DEFAULT_SPEAKERS[0]["voices"].get(name)
+        if not voice or not provider.available():
+            print(f"{name:<10} skipped ({'no voice configured' if not voice else 'not installed'})")
+            continue
+        
+        for concurrency in args.concurrency:
+            result = run_provider(provider, voice, lines, concurrency)
+            print(
+                f"{name:<10} {concurrency:>7} {result['elapsed']:>8.2f} {result['p50']:>7.2f} {result['p95']:>7.2f} "
+                f"{result['chars_per_s']:>8.0f} {result['realtime']:>10.1f}"
+            )
+    
+    header = f"{'cartesia':<10} {'seconds':>8} {'line s':>7} {'first s':>7} {'opened':>7} {'reused':>7} {'failed':>7}"
+    print(f"\n{args.podcasts} podcasts of {len(lines)} lines through tts_service")
+    print(header)
+    print("-" * len(header))
+    for transport, websocket in (("requests", False), ("websocket", True)):
+        config.CARTESIA_WEBSOCKET = websocket
+        result = asyncio.run(run_podcasts(lines, args.podcasts))
+        print(
+            f"{transport:<10} {result['elapsed']:>8.2f} {result['line']:>7.3f} {result['first']:>7.3f} "
+            f"{result['opened']:>7} {result['reused']:>7} {result['failed']:>7}"
+        )
+    
+    if args.outage and not stand_in:
+        print("\n--outage needs the Cartesia stand-in (unset CARTESIA_API_KEY)")
+    elif args.outage:
+        if args.attempt_timeout:
+            config.TTS_ATTEMPT_TIMEOUT_S = args.attempt_timeout
+        fallback = get_tts_provider("espeak")
+        requests_before = sample("tts_requests_total", provider=fallback.name, result="ok")
+        
+        # Every line hangs past the attempt timeout, on new and pooled connections alike
+        config.cartesia_client.tts.latency_s = config.TTS_ATTEMPT_TIMEOUT_S * 2
+        result = asyncio.run(run_podcasts(lines, 1))
+        print(
+            f"\nCartesia outage: {len(lines)} lines in {result['elapsed']:.2f}s "
+            f"(timeout {config.TTS_ATTEMPT_TIMEOUT_S}s, {config.TTS_FAILURE_THRESHOLD} failures before skipping), "
+            f"{int(sample('tts_requests_total', provider=fallback.name, result='ok') - requests_before)} voiced by "
+            f"{fallback.name}, {result['failed']} failed"
+        )
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -16,14 +16,36 @@ from cartesia import Cartesia
 UPLOAD_DIR = "uploads"
 AUDIO_DIR = "outputs"
 
+# Node-local scratch files (TTS segments, index builds) and remote-object cache
+SCRATCH_DIR = "scratch"
+STORAGE_CACHE_DIR = "cache"
+
 # Create directories if they don't exist
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(AUDIO_DIR, exist_ok=True)
+os.makedirs(SCRATCH_DIR, exist_ok=True)
+
+# ========== Uploads ==========
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Uploads are streamed to storage in chunks of this size
+
+# ========== Storage ==========
+# "local" stores keys under STORAGE_ROOT; "s3" uses an S3-compatible bucket
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_ROOT = "."
+S3_BUCKET = os.getenv("S3_BUCKET", "pdf-podcast")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None  # e.g. http://localhost:9000 for MinIO
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID", "")
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY", "")
+S3_MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024  # Part size for multipart uploads
 
 # ========== Database ==========
 MONGO_URL = "mongodb://localhost:27017"
 DATABASE_NAME = "pdf_podcast_db"
 COLLECTION_NAME = "projects"
+CHAT_SESSIONS_COLLECTION = "chat_sessions"
+DOCUMENTS_COLLECTION = "documents"
 
 # ========== API Configuration ==========
 # Load API keys from environment
@@ -44,21 +66,77 @@ genai.configure(api_key=GOOGLE_API_KEY)
 gemini_model = genai.GenerativeModel('gemini-2.0-flash-exp')
 
 # Embedding model for semantic search
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+embedder = SentenceTransformer(EMBEDDING_MODEL)
 
-# Configure Cartesia TTS client
-cartesia_client = Cartesia(api_key=CARTESIA_API_KEY)
+# Configure Cartesia TTS client (a request that hangs longer fails instead of holding its thread)
+CARTESIA_REQUEST_TIMEOUT_S = 30
+cartesia_client = Cartesia(api_key=CARTESIA_API_KEY, timeout=CARTESIA_REQUEST_TIMEOUT_S)
+
+# ========== LLM Gateway ==========
+LLM_MAX_CONCURRENCY = 4          # Gemini calls executing at once
+LLM_REQUESTS_PER_MINUTE = 60     # Token bucket refill rate
+LLM_BURST = 10                   # Token bucket capacity
+LLM_ATTEMPT_TIMEOUT_S = 60       # Timeout for a single Gemini attempt
+LLM_DEADLINE_S = 180             # Overall deadline including retries
+LLM_MAX_RETRIES = 4
+LLM_RETRY_BASE_DELAY_S = 1.0     # Exponential backoff base (full jitter)
+LLM_RETRY_MAX_DELAY_S = 20.0
+LLM_RATE_LIMIT_COOLDOWN_S = 5.0  # Pause new calls after a 429
+LLM_SCRIPT_REPAIR_ATTEMPTS = 2   # Invalid structured scripts sent back with their errors before salvaging
 
 # ========== Voice Configuration ==========
 # Cartesia Voice IDs
 CARTESIA_VOICE_ALEX = "6ccbfb76-1fc6-48f7-b71d-91ac6298247b"
 CARTESIA_VOICE_SAM = "00967b2f-88a6-4a31-8153-110a92134b9f"
 
+# ========== TTS Providers ==========
+# Each speaker is voiced by the first healthy provider of its route that has
+# a voice for it. Piper and espeak-ng run locally on CPU (outages, air-gapped
+# setups); a Piper voice is the path of its .onnx model.
+TTS_DEFAULT_ROUTE = os.getenv("TTS_ROUTE", "cartesia,piper,espeak")
+TTS_ATTEMPT_TIMEOUT_S = 15     # Slower lines fail over to the next provider (or fail, on the last one)
+TTS_FAILURE_THRESHOLD = 3      # Failures in a row before a provider is skipped
+TTS_COOLDOWN_S = 60            # How long a failing provider is skipped
+TTS_PROVIDER_WORKERS = 4       # Threads per provider; lines beyond them wait, so a hung provider cannot starve others
+CARTESIA_WEBSOCKET = os.getenv("CARTESIA_WEBSOCKET", "1") == "1"  # Stream lines over pooled WebSockets instead of one request each
+CARTESIA_WS_POOL_SIZE = 4      # Idle WebSocket connections kept open
+CARTESIA_WS_IDLE_S = 60        # Idle connections older than this are closed instead of reused
+PIPER_BINARY = os.getenv("PIPER_BINARY", "piper")
+ESPEAK_BINARY = os.getenv("ESPEAK_BINARY", "espeak-ng")
+ESPEAK_WORDS_PER_MINUTE = 165
+# Emotions a script line can carry ("Alex (curious): ..."); Cartesia Sonic 3
+# renders them, the local providers ignore them
+TTS_EMOTIONS = [
+    "neutral", "happy", "excited", "enthusiastic", "amazed", "surprised", "curious", "calm",
+    "sympathetic", "skeptical", "confused", "hesitant", "contemplative", "confident", "determined", "sad",
+]
+
 # ========== Text Processing ==========
+CHUNKER = os.getenv("CHUNKER", "layout")  # "layout" (sections and tokens) or "recursive" (characters)
+
+# Layout chunker (token counts; the embedder truncates inputs at 256 word pieces)
+CHUNK_MAX_TOKENS = 200
+CHUNK_OVERLAP_TOKENS = 40
+HEADING_SIZE_RATIO = 1.15   # Font size relative to body text that marks a heading
+HEADING_MAX_CHARS = 120
+
+# Recursive character splitter
 CHUNK_SIZE = 800
 CHUNK_OVERLAP = 150
 TEXT_SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
 
+# ========== OCR ==========
+# Pages with little extractable text but images (scans) are OCR'd with
+# Tesseract through PyMuPDF in a process pool
+OCR_ENABLED = os.getenv("OCR_ENABLED", "1") == "1"
+OCR_MIN_CHARS = 50            # Pages with less text than this are OCR candidates
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")  # Tesseract languages, e.g. "eng+deu"
+OCR_DPI = 300
+OCR_TESSDATA = os.getenv("TESSDATA_PREFIX") or None  # Found from the tesseract install if unset
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(min(4, os.cpu_count() or 1))))
+OCR_TIMEOUT_S = 180           # OCR budget per PDF; unfinished pages keep their PDF text
+
 # ========== Podcast Settings ==========
 DURATION_MAP = {
     "short": "3-5 minutes with 15-20 dialogue exchanges",
@@ -66,18 +144,113 @@ DURATION_MAP = {
     "long": "10-15 minutes with 60-80 dialogue exchanges"
 }
 
+# Chapters per podcast; each chapter can be regenerated on its own
+CHAPTER_MAP = {
+    "short": "2-3",
+    "medium": "3-5",
+    "long": "5-7"
+}
+
 # Maximum characters for LLM context
 MAX_CONTEXT_CHARS = 100000
 
+# ========== Podcast Speakers ==========
+# Default roster of a podcast. Requests can bring their own speakers: a
+# speaker without a role or voices takes those of the default speaker in
+# the same position (cycling through the defaults for larger rosters).
+DEFAULT_SPEAKERS = [
+    {
+        "name": "Alex",
+        "role": "Curious, asks insightful questions, reacts naturally",
+        "voices": {
+            "cartesia": CARTESIA_VOICE_ALEX,
+            "piper": os.getenv("PIPER_VOICE_ALEX", ""),
+            "espeak": "en-us+m3",
+        },
+        "route": os.getenv("TTS_ROUTE_ALEX", TTS_DEFAULT_ROUTE).split(","),
+    },
+    {
+        "name": "Sam",
+        "role": "Knowledgeable, explains concepts clearly, uses analogies",
+        "voices": {
+            "cartesia": CARTESIA_VOICE_SAM,
+            "piper": os.getenv("PIPER_VOICE_SAM", ""),
+            "espeak": "en-us+f3",
+        },
+        "route": os.getenv("TTS_ROUTE_SAM", TTS_DEFAULT_ROUTE).split(","),
+    },
+]
+# Voices requests may choose, per provider: those of the default speakers
+# and the ones listed in CARTESIA_VOICES, PIPER_VOICES and ESPEAK_VOICES
+# (comma-separated). Piper voices are model files run on this server, so
+# no other path is accepted.
+SPEAKER_VOICES = {
+    provider: sorted({
+        voice.strip()
+        for voice in [
+            *(speaker["voices"][provider] for speaker in DEFAULT_SPEAKERS),
+            *os.getenv(f"{provider.upper()}_VOICES", "").split(","),
+        ]
+        if voice.strip()
+    })
+    for provider in ("cartesia", "piper", "espeak")
+}
+GUEST_ROLE = "Guest who brings their own expertise and perspective"  # Role of speakers beyond the defaults
+MIN_SPEAKERS = 2
+MAX_SPEAKERS = 4
+MAX_SPEAKER_NAME_LENGTH = 40
+
+# ========== Chat Context Packing ==========
+CONTEXT_TOKEN_BUDGET = 2000   # Max tokens of retrieved context per chat prompt
+CHARS_PER_TOKEN = 4           # Rough chars/token ratio used for budgeting
+MIN_OVERLAP_CHARS = 20        # Shortest suffix/prefix match treated as overlap
+
+# ========== Chat Sessions ==========
+CHAT_HISTORY_TURNS = 6        # Turns kept server-side per chat session
+CHAT_RETRIEVAL_CACHE_SIZE = 20  # Cached retrievals kept per chat session
+CHAT_RETRIEVAL_REUSE_SIMILARITY = 0.9  # Cosine similarity to a cached query above which its chunks are reused
+
 # ========== Audio Settings ==========
 TTS_MODEL = "sonic-3"
 SAMPLE_RATE = 44100
 AUDIO_ENCODING = "pcm_s16le"
 AUDIO_FORMAT = "wav"
-EXPORT_BITRATE = "256k"
 PAUSE_DURATION_MS = 500  # Pause between segments
 FADE_DURATION_MS = 10     # Fade in/out duration
 
+# ========== Loudness ==========
+LOUDNESS_TARGET_LUFS = float(os.getenv("LOUDNESS_TARGET_LUFS", "-16"))  # Podcast platforms; EBU R128 broadcast is -23
+TRUE_PEAK_LIMIT_DBTP = -1.0    # True-peak ceiling of the limiter
+LOUDNESS_MAX_GAIN_DB = 20.0    # Largest boost or cut applied to a segment
+LIMITER_WINDOW_MS = 5          # Look-ahead (and release) of the limiter
+
+# ========== Audio Export ==========
+# Podcasts are stored once as a lossless master; renditions are encoded on
+# first request and cached. Bitrates offered per format, default first.
+AUDIO_RENDITIONS = {
+    "mp3": ["128k", "64k", "192k"],
+    "opus": ["64k", "32k", "96k"],
+    "aac": ["96k", "64k", "128k"],
+}
+DEFAULT_AUDIO_FORMAT = "mp3"
+STREAM_BITRATE = "128k"   # MP3 bitrate of audio streamed during generation
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", "2"))  # Concurrent ffmpeg encodes
+
+# ========== Vector Index ==========
+FAISS_INDEX_CACHE_SIZE = 256     # Memory-mapped indexes kept open per worker (file pages are shared)
+FAISS_INDEX_REVALIDATE_S = 60    # How long a cached index is used before checking storage for a new version
+CHUNK_STORE_CACHE_SIZE = 256     # Memory-mapped chunk stores kept open per worker
+CHUNK_STORE_REVALIDATE_S = 60    # How long a cached chunk store is used before checking storage for a new version
+
+# ========== HTTP File Delivery ==========
+HTTP_CHUNK_SIZE = 256 * 1024             # Read size for streamed file responses
+IMMUTABLE_MAX_AGE_S = 365 * 24 * 3600    # Cache lifetime for content-addressed files
+ETAG_CACHE_SIZE = 4096                   # File hashes kept per worker for local storage ETags
+
+# ========== Tracing ==========
+TRACE_HISTORY_SIZE = 200         # Finished traces kept for GET /traces
+TRACE_SLOW_REQUEST_MS = 10000    # Log a span breakdown for slower requests
+
 # ========== CORS Configuration ==========
 ALLOWED_ORIGINS = ["http://localhost:3000"]
 
@@ -1,27 +1,144 @@
 """
 File management for uploads and audio outputs
+
+Paths returned and stored in MongoDB are storage keys (see db/storage.py);
+with the local backend they are also valid relative filesystem paths.
 """
+import asyncio
+import hashlib
 import os
-from typing import Optional
+import uuid
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
 import config
+from db import mongodb
+from db.storage import get_storage
+
+
+# (project_id, filename) -> PDF path, filled on upload and on first lookup
+_pdf_path_index: Dict[Tuple[str, str], str] = {}
+
+
+def get_project_upload_dir(project_id: str) -> str:
+    """Get the upload key prefix (shard) of a project's legacy files"""
+    return f"{config.UPLOAD_DIR}/{project_id}"
+
+
+def build_staging_pdf_path() -> str:
+    """Get a unique storage key for an upload whose content hash is not known yet"""
+    return f"{config.UPLOAD_DIR}/incoming/{uuid.uuid4().hex}.pdf"
+
+
+def get_pdf_blob_path(pdf_sha256: str) -> str:
+    """Get the content-addressed storage key of a PDF"""
+    return f"{config.UPLOAD_DIR}/blobs/{pdf_sha256}.pdf"
+
+
+def get_page_store_path(pdf_sha256: str) -> str:
+    """Get the key prefix of a PDF's per-page text and layout store"""
+    return f"{config.UPLOAD_DIR}/pages/{pdf_sha256}"
+
+
+def get_ocr_cache_path(page_hash: str) -> str:
+    """Get the key of a cached OCR result for a scanned page"""
+    return f"{config.UPLOAD_DIR}/ocr/{page_hash}.json"
+
+
+def get_document_dir(document_id: str) -> str:
+    """Get the key prefix of a shared document's artifacts"""
+    return f"{config.UPLOAD_DIR}/documents/{document_id}"
+
 
+def get_document_index_path(document_id: str) -> str:
+    """Get storage key for a shared document's FAISS index"""
+    return f"{get_document_dir(document_id)}/index.faiss"
 
-async def save_uploaded_pdf(file_content: bytes, project_id: str, filename: str) -> str:
-    """Save uploaded PDF file"""
-    file_path = os.path.join(config.UPLOAD_DIR, f"{project_id}_{filename}")
+
+def get_document_chunk_store_path(document_id: str) -> str:
+    """Get storage key prefix for a shared document's chunk store"""
+    return f"{get_document_dir(document_id)}/chunks"
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES"""
+
+
+class InvalidUploadError(Exception):
+    """Raised when an upload is not a PDF"""
+
+
+def stream_pdf_chunks(source: BinaryIO, digest: Any) -> Iterator[bytes]:
+    """
+    Read an uploaded PDF in fixed-size chunks, hashing and size-checking on the fly
+    
+    Args:
+        source: File-like object with the upload
+        digest: Hash object updated with every chunk
+        
+    Yields:
+        Chunks of at most UPLOAD_CHUNK_SIZE bytes
+    """
+    size = 0
+    while True:
+        block = source.read(config.UPLOAD_CHUNK_SIZE)
+        if not block:
+            break
+        
+        # PDF header must appear within the first 1024 bytes
+        if size == 0 and b"%PDF" not in block[:1024]:
+            raise InvalidUploadError("Uploaded file is not a PDF")
+        
+        size += len(block)
+        if size > config.MAX_UPLOAD_BYTES:
+            raise UploadTooLargeError(
+                f"PDF exceeds the {config.MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit"
+            )
+        
+        digest.update(block)
+        yield block
+
+
+async def save_uploaded_pdf(source: BinaryIO) -> Tuple[str, str, int]:
+    """
+    Stream uploaded PDF file to a staging key in storage
+    
+    The document store moves it to its content-addressed key (or drops it
+    when the same PDF is already stored) once the hash is known.
+    
+    Args:
+        source: File-like object with the upload
+        
+    Returns:
+        Tuple of (staging_path, sha256, size_bytes)
+    """
+    file_path = build_staging_pdf_path()
+    digest = hashlib.sha256()
     
-    with open(file_path, "wb") as f:
-        f.write(file_content)
+    # Storage writes are atomic, so a rejected upload leaves no partial file
+    size = await asyncio.to_thread(
+        get_storage().put_stream,
+        file_path,
+        stream_pdf_chunks(source, digest)
+    )
     
-    return file_path
+    return file_path, digest.hexdigest(), size
+
+
+def register_pdf_path(project_id: str, filename: str, file_path: str) -> None:
+    """Record where a project's PDF is stored"""
+    _pdf_path_index[(project_id, filename)] = file_path
+
+
+def forget_project_pdfs(project_id: str) -> None:
+    """Drop index entries of a project"""
+    for key in [k for k in _pdf_path_index if k[0] == project_id]:
+        del _pdf_path_index[key]
 
 
 def delete_pdf_file(file_path: str) -> bool:
     """Delete PDF file"""
     try:
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
-            return True
+        if file_path:
+            return get_storage().delete(file_path)
     except Exception as e:
         print(f"Error deleting PDF: {e}")
     
@@ -31,9 +148,8 @@ def delete_pdf_file(file_path: str) -> bool:
 def delete_faiss_index(index_path: str) -> bool:
     """Delete FAISS index file"""
     try:
-        if index_path and os.path.exists(index_path):
-            os.remove(index_path)
-            return True
+        if index_path:
+            return get_storage().delete(index_path)
     except Exception as e:
         print(f"Error deleting FAISS index: {e}")
     
@@ -43,63 +159,135 @@ def delete_faiss_index(index_path: str) -> bool:
 def delete_audio_file(audio_path: str) -> bool:
     """Delete audio file"""
     try:
-        if audio_path and os.path.exists(audio_path):
-            os.remove(audio_path)
-            return True
+        if audio_path:
+            return get_storage().delete(audio_path)
     except Exception as e:
         print(f"Error deleting audio: {e}")
     
     return False
 
 
-async def cleanup_project_files(project: dict) -> None:
-    """Delete all files associated with a project"""
-    # Delete PDF
+def delete_legacy_pdf_files(project: dict) -> None:
+    """Delete a PDF and FAISS index owned by the project itself (pre document store)"""
+    if project.get("document_id"):
+        # Shared files belong to the document and go with its last reference
+        return
+    
     if project.get("pdf_path"):
         delete_pdf_file(project["pdf_path"])
     
-    # Delete FAISS index
     if project.get("faiss_index_path"):
         delete_faiss_index(project["faiss_index_path"])
+
+
+async def cleanup_project_files(project: dict) -> None:
+    """Delete all files associated with a project"""
+    # Delete PDF and FAISS index
+    delete_legacy_pdf_files(project)
+    forget_project_pdfs(project["project_id"])
     
     # Delete all podcast audio files
     for podcast in project.get("podcasts", []):
-        if podcast.get("audio_path"):
-            delete_audio_file(podcast["audio_path"])
+        delete_podcast_files(podcast)
+    
+    # Remove the project's upload shard if nothing else is left in it
+    remove_empty_dir(get_project_upload_dir(project["project_id"]))
+
+
+def remove_empty_dir(prefix: str) -> None:
+    """Remove the directory of a key prefix if it is empty (local backend only)"""
+    if config.STORAGE_BACKEND == "local":
+        try:
+            os.rmdir(get_storage().local_path(prefix))
+        except OSError:
+            pass
 
 
 def get_audio_path(filename: str) -> str:
-    """Get full path for audio file"""
-    return os.path.join(config.AUDIO_DIR, filename)
+    """Get storage key for audio file"""
+    return f"{config.AUDIO_DIR}/{os.path.basename(filename)}"
+
+
+def get_podcast_audio_path(project_id: str, podcast_id: str, revision: Optional[str] = None) -> str:
+    """Get storage key of a podcast's lossless master (a new revision gets a new key)"""
+    suffix = f"_{revision}" if revision else ""
+    return f"{config.AUDIO_DIR}/{project_id}_{podcast_id}{suffix}.flac"
+
+
+def get_rendition_path(master_path: str, audio_format: str, bitrate: str) -> str:
+    """Get storage key of an encoded rendition of a podcast master"""
+    stem = os.path.splitext(os.path.basename(master_path))[0]
+    return f"{config.AUDIO_DIR}/renditions/{stem}_{bitrate}.{audio_format}"
+
+
+def delete_podcast_audio(audio_path: str) -> None:
+    """Delete a podcast's assembled audio and all renditions encoded from it"""
+    if not audio_path:
+        return
+    
+    delete_audio_file(audio_path)
+    
+    for audio_format, bitrates in config.AUDIO_RENDITIONS.items():
+        for bitrate in bitrates:
+            delete_audio_file(get_rendition_path(audio_path, audio_format, bitrate))
+
+
+def get_podcast_dir(podcast_id: str) -> str:
+    """Get the key prefix of a podcast's segment audio"""
+    return f"{config.AUDIO_DIR}/podcasts/{podcast_id}"
+
+
+def get_podcast_segment_path(podcast_id: str, segment_key: str) -> str:
+    """Get storage key of a synthesized podcast segment"""
+    return f"{get_podcast_dir(podcast_id)}/segments/{segment_key}.pcm"
+
+
+def delete_podcast_files(podcast: dict) -> None:
+    """Delete a podcast's assembled audio, its renditions and the audio of its segments"""
+    delete_podcast_audio(podcast.get("audio_path"))
+    
+    for chapter in podcast.get("chapters", []):
+        for segment in chapter["segments"]:
+            delete_audio_file(segment.get("audio_path"))
+    
+    remove_empty_dir(f"{get_podcast_dir(podcast['podcast_id'])}/segments")
+    remove_empty_dir(get_podcast_dir(podcast["podcast_id"]))
 
 
 def audio_file_exists(filename: str) -> bool:
     """Check if audio file exists"""
-    path = os.path.join(config.AUDIO_DIR, filename)
-    return os.path.exists(path)
+    return get_storage().exists(get_audio_path(filename))
 
 
-def get_faiss_index_path(project_id: str) -> str:
-    """Get path for FAISS index file"""
-    return os.path.join(config.UPLOAD_DIR, f"{project_id}.faiss")
+async def resolve_pdf_path(project_id: str, filename: str) -> Optional[str]:
+    """
+    Resolve a project's PDF by (project_id, filename) in constant time
+    
+    Args:
+        project_id: Project ID
+        filename: Original PDF filename
+        
+    Returns:
+        Path to the PDF, or None if the project has no such PDF
+    """
+    key = (project_id, filename)
+    if key in _pdf_path_index:
+        return _pdf_path_index[key]
+    
+    # Fall back to the project record (e.g. after a restart)
+    project = await mongodb.get_project(project_id)
+    if not project or project.get("pdf_filename") != filename or not project.get("pdf_path"):
+        return None
+    
+    register_pdf_path(project_id, filename, project["pdf_path"])
+    return project["pdf_path"]
 
 
 def get_pdf_path(filename: str) -> str:
-    """Get full path for PDF file"""
-    # Check if it's already a full path or just a filename
-    if os.path.isabs(filename) or os.path.exists(filename):
-        return filename
-    
-    # Try to find the file in uploads directory
-    for file in os.listdir(config.UPLOAD_DIR):
-        if file.endswith(filename):
-            return os.path.join(config.UPLOAD_DIR, file)
-    
-    # If not found, return expected path
-    return os.path.join(config.UPLOAD_DIR, filename)
+    """Get storage key for a legacy (flat layout) PDF file"""
+    return f"{config.UPLOAD_DIR}/{os.path.basename(filename)}"
 
 
 def pdf_file_exists(filename: str) -> bool:
-    """Check if PDF file exists"""
-    path = get_pdf_path(filename)
-    return os.path.exists(path)
+    """Check if a legacy (flat layout) PDF file exists"""
+    return get_storage().exists(get_pdf_path(filename))
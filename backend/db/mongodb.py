@@ -2,24 +2,30 @@
 MongoDB connection and CRUD operations
 """
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 import config
+from utils.tracing import traced
 
 # MongoDB client (singleton pattern)
 _mongo_client: Optional[AsyncIOMotorClient] = None
 _db = None
 _projects_collection = None
+_chat_sessions_collection = None
+_documents_collection = None
 
 
 def get_mongo_client():
     """Get or create MongoDB client"""
-    global _mongo_client, _db, _projects_collection
+    global _mongo_client, _db, _projects_collection, _chat_sessions_collection, _documents_collection
     
     if _mongo_client is None:
         _mongo_client = AsyncIOMotorClient(config.MONGO_URL)
         _db = _mongo_client[config.DATABASE_NAME]
         _projects_collection = _db[config.COLLECTION_NAME]
+        _chat_sessions_collection = _db[config.CHAT_SESSIONS_COLLECTION]
+        _documents_collection = _db[config.DOCUMENTS_COLLECTION]
     
     return _mongo_client
 
@@ -30,6 +36,19 @@ def get_projects_collection():
     return _projects_collection
 
 
+def get_chat_sessions_collection():
+    """Get chat sessions collection"""
+    get_mongo_client()  # Ensure initialized
+    return _chat_sessions_collection
+
+
+def get_documents_collection():
+    """Get documents collection"""
+    get_mongo_client()  # Ensure initialized
+    return _documents_collection
+
+
+@traced("mongo.create_project")
 async def create_project(project_id: str, name: str, description: str = ""):
     """Create a new project in database"""
     collection = get_projects_collection()
@@ -52,6 +71,7 @@ async def create_project(project_id: str, name: str, description: str = ""):
     return project_data
 
 
+@traced("mongo.get_all_projects")
 async def get_all_projects():
     """Get all projects"""
     collection = get_projects_collection()
@@ -70,10 +90,11 @@ async def get_all_projects():
     return projects
 
 
-async def get_project(project_id: str):
-    """Get a single project by ID"""
+@traced("mongo.get_project")
+async def get_project(project_id: str, fields: Optional[List[str]] = None):
+    """Get a single project by ID (optionally only the given fields)"""
     collection = get_projects_collection()
-    project = await collection.find_one({"project_id": project_id})
+    project = await collection.find_one({"project_id": project_id}, fields)
     
     if project:
         project["_id"] = str(project["_id"])
@@ -81,15 +102,13 @@ async def get_project(project_id: str):
     return project
 
 
+@traced("mongo.update_project_pdf")
 async def update_project_pdf(
     project_id: str,
     pdf_filename: str,
-    pdf_path: str,
-    pdf_text: str,
-    chunks: List[Dict],
-    faiss_index_path: str
+    document: Dict[str, Any]
 ):
-    """Update project with PDF processing results"""
+    """Point project at a processed document from the document store"""
     collection = get_projects_collection()
     
     await collection.update_one(
@@ -97,16 +116,24 @@ async def update_project_pdf(
         {
             "$set": {
                 "pdf_filename": pdf_filename,
-                "pdf_path": pdf_path,
-                "pdf_text": pdf_text,
-                "chunks": chunks,
-                "faiss_index_path": faiss_index_path,
+                "pdf_path": document["pdf_path"],
+                "document_id": document["document_id"],
+                "faiss_index_path": document["faiss_index_path"],
+                "pdf_sha256": document["pdf_sha256"],
+                "pdf_size": document["pdf_size"],
+                "total_pages": document["total_pages"],
+                "total_chunks": document["total_chunks"],
+                "word_count": document["word_count"],
+                # Text and chunks live on the shared document
+                "pdf_text": None,
+                "chunks": [],
                 "updated_at": datetime.utcnow()
             }
         }
     )
 
 
+@traced("mongo.add_podcast_to_project")
 async def add_podcast_to_project(project_id: str, podcast_data: Dict[str, Any]):
     """Add a podcast to project"""
     collection = get_projects_collection()
@@ -120,6 +147,34 @@ async def add_podcast_to_project(project_id: str, podcast_data: Dict[str, Any]):
     )
 
 
+@traced("mongo.update_podcast")
+async def update_podcast(project_id: str, podcast_id: str, fields: Dict[str, Any]):
+    """Update fields of a project's podcast"""
+    collection = get_projects_collection()
+    
+    await collection.update_one(
+        {"project_id": project_id, "podcasts.podcast_id": podcast_id},
+        {
+            "$set": {
+                **{f"podcasts.$.{name}": value for name, value in fields.items()},
+                "updated_at": datetime.utcnow()
+            }
+        }
+    )
+
+
+@traced("mongo.get_podcast")
+async def get_podcast(podcast_id: str) -> Optional[Dict[str, Any]]:
+    """Get a podcast by ID (with the ID of the project holding it)"""
+    collection = get_projects_collection()
+    project = await collection.find_one(
+        {"podcasts.podcast_id": podcast_id},
+        {"_id": 0, "project_id": 1, "podcasts": {"$elemMatch": {"podcast_id": podcast_id}}}
+    )
+    return {**project["podcasts"][0], "project_id": project["project_id"]} if project else None
+
+
+@traced("mongo.delete_project")
 async def delete_project(project_id: str):
     """Delete a project"""
     collection = get_projects_collection()
@@ -132,12 +187,14 @@ async def delete_project(project_id: str):
     return None
 
 
+@traced("mongo.get_project_count")
 async def get_project_count():
     """Get total number of projects"""
     collection = get_projects_collection()
     return await collection.count_documents({})
 
 
+@traced("mongo.check_connection")
 async def check_connection():
     """Check if MongoDB connection is working"""
     try:
@@ -146,3 +203,192 @@ async def check_connection():
         return True
     except Exception:
         return False
+
+
+# ========== Chat Sessions ==========
+
+@traced("mongo.create_chat_session")
+async def create_chat_session(session_id: str, project_id: str):
+    """Create a new chat session for a project"""
+    collection = get_chat_sessions_collection()
+    
+    session_data = {
+        "session_id": session_id,
+        "project_id": project_id,
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(),
+        "history": [],
+        "retrieval_cache": []
+    }
+    
+    await collection.insert_one(session_data)
+    return session_data
+
+
+@traced("mongo.get_chat_session")
+async def get_chat_session(session_id: str):
+    """Get a chat session by ID"""
+    collection = get_chat_sessions_collection()
+    session = await collection.find_one({"session_id": session_id})
+    
+    if session:
+        session["_id"] = str(session["_id"])
+    
+    return session
+
+
+@traced("mongo.add_chat_turn")
+async def add_chat_turn(session_id: str, turn: Dict[str, Any]):
+    """Append a turn to session history, keeping only the latest turns"""
+    collection = get_chat_sessions_collection()
+    
+    await collection.update_one(
+        {"session_id": session_id},
+        {
+            "$push": {
+                "history": {
+                    "$each": [turn],
+                    "$slice": -config.CHAT_HISTORY_TURNS
+                }
+            },
+            "$set": {"updated_at": datetime.utcnow()}
+        }
+    )
+
+
+@traced("mongo.cache_chat_retrieval")
+async def cache_chat_retrieval(session_id: str, entry: Dict[str, Any]):
+    """Cache retrieval results for a session, keeping only the latest entries"""
+    collection = get_chat_sessions_collection()
+    
+    await collection.update_one(
+        {"session_id": session_id},
+        {
+            "$push": {
+                "retrieval_cache": {
+                    "$each": [entry],
+                    "$slice": -config.CHAT_RETRIEVAL_CACHE_SIZE
+                }
+            }
+        }
+    )
+
+
+@traced("mongo.clear_project_chat_retrievals")
+async def clear_project_chat_retrievals(project_id: str):
+    """Drop cached retrievals of a project's sessions (chunk indexes changed)"""
+    collection = get_chat_sessions_collection()
+    
+    await collection.update_many(
+        {"project_id": project_id},
+        {"$set": {"retrieval_cache": []}}
+    )
+
+
+@traced("mongo.delete_chat_session")
+async def delete_chat_session(session_id: str) -> bool:
+    """Delete a chat session"""
+    collection = get_chat_sessions_collection()
+    result = await collection.delete_one({"session_id": session_id})
+    return result.deleted_count > 0
+
+
+@traced("mongo.delete_project_chat_sessions")
+async def delete_project_chat_sessions(project_id: str) -> int:
+    """Delete all chat sessions of a project"""
+    collection = get_chat_sessions_collection()
+    result = await collection.delete_many({"project_id": project_id})
+    return result.deleted_count
+
+
+# ========== Documents ==========
+
+@traced("mongo.get_document")
+async def get_document(document_id: str, fields: Optional[List[str]] = None):
+    """Get a processed document by ID (optionally only the given fields)"""
+    collection = get_documents_collection()
+    document = await collection.find_one({"document_id": document_id}, fields)
+    
+    if document:
+        document["_id"] = str(document["_id"])
+    
+    return document
+
+
+@traced("mongo.insert_document")
+async def insert_document(document_data: Dict[str, Any]):
+    """Store a processed document unless one with the same ID exists"""
+    collection = get_documents_collection()
+    
+    await collection.update_one(
+        {"document_id": document_data["document_id"]},
+        {
+            "$setOnInsert": {
+                **document_data,
+                "project_ids": [],
+                "ref_count": 0,
+                "created_at": datetime.utcnow()
+            }
+        },
+        upsert=True
+    )
+
+
+@traced("mongo.add_document_reference")
+async def add_document_reference(document_id: str, project_id: str):
+    """
+    Reference a document from a project (idempotent)
+    
+    Returns:
+        The referenced document, or None if it does not exist (e.g. deleted
+        by another worker since it was read)
+    """
+    collection = get_documents_collection()
+    
+    document = await collection.find_one_and_update(
+        {"document_id": document_id, "project_ids": {"$ne": project_id}},
+        {
+            "$push": {"project_ids": project_id},
+            "$inc": {"ref_count": 1}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+    
+    if document is None:
+        # Already referenced: the document stays while the reference does
+        document = await collection.find_one({"document_id": document_id, "project_ids": project_id})
+    
+    if document:
+        document["_id"] = str(document["_id"])
+    
+    return document
+
+
+@traced("mongo.remove_document_reference")
+async def remove_document_reference(document_id: str, project_id: str):
+    """
+    Drop a project's reference to a document
+    
+    Returns:
+        The deleted document if this was its last reference, otherwise None
+    """
+    collection = get_documents_collection()
+    
+    await collection.update_one(
+        {"document_id": document_id, "project_ids": project_id},
+        {
+            "$pull": {"project_ids": project_id},
+            "$inc": {"ref_count": -1}
+        }
+    )
+    
+    return await collection.find_one_and_delete(
+        {"document_id": document_id, "ref_count": {"$lte": 0}}
+    )
+
+
+@traced("mongo.count_documents_by_sha256")
+async def count_documents_by_sha256(pdf_sha256: str) -> int:
+    """Count documents built from the same PDF (e.g. with other chunking settings)"""
+    collection = get_documents_collection()
+    return await collection.count_documents({"pdf_sha256": pdf_sha256})
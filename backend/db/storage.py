@@ -0,0 +1,368 @@
+"""
+Storage backends for uploads, FAISS indexes and audio
+
+Objects are addressed by "/"-separated keys such as
+"uploads/blobs/{sha256}.pdf" or "outputs/{project_id}_{podcast_id}.mp3".
+The local backend maps keys onto a directory; the S3 backend stores them in
+a bucket (AWS S3, MinIO or any S3-compatible service) and keeps a local
+read-through cache for files that libraries need on disk (FAISS, PyMuPDF).
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Tuple
+import config
+from utils.tracing import traced
+
+
+@dataclass
+class StoredObject:
+    """
+    Metadata of a stored object
+
+    The etag is an opaque validator that changes with the content: the
+    SHA-256 of the file on local storage, the S3 ETag on S3 (not a content
+    hash for objects uploaded in parts, so it is only compared, never checked).
+    """
+    key: str
+    size: int
+    mtime: float
+    etag: str
+
+
+class StorageBackend(ABC):
+    """Interface implemented by storage backends"""
+
+    @abstractmethod
+    def put_file(self, key: str, local_path: str) -> None:
+        """Store a local file under key (the local file is left in place)"""
+
+    @abstractmethod
+    def put_stream(self, key: str, chunks: Iterable[bytes]) -> int:
+        """Store an iterable of byte chunks under key, returning the size"""
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        """Store bytes under key"""
+        self.put_stream(key, [data])
+
+    @abstractmethod
+    def open_read(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Stream an inclusive byte range of an object"""
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[StoredObject]:
+        """Get object metadata, or None if it does not exist"""
+
+    def exists(self, key: str) -> bool:
+        """Check if an object exists"""
+        return self.stat(key) is not None
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """Delete an object, returning True if it existed"""
+
+    @abstractmethod
+    def move(self, src_key: str, dst_key: str) -> None:
+        """Move an object to a new key (without passing data through this node)"""
+
+    @abstractmethod
+    def local_path(self, key: str) -> str:
+        """Get a local file path with the object's current content"""
+
+
+class LocalStorage(StorageBackend):
+    """Storage on the local filesystem"""
+
+    def __init__(self, root: str):
+        self.root = root
+        # path -> (size, mtime_ns, etag), LRU order
+        self._etag_cache: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put_file(self, key: str, local_path: str) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.abspath(local_path) == os.path.abspath(path):
+            return
+
+        # Copy and rename: files may be memory-mapped by readers (FAISS, chunk stores)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".part")
+        os.close(fd)
+        try:
+            shutil.copyfile(local_path, temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def put_stream(self, key: str, chunks: Iterable[bytes]) -> int:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        # Write next to the target and rename so readers never see partial files
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".part")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        return size
+
+    def open_read(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        path = self._path(key)
+        if end is None:
+            end = os.path.getsize(path) - 1
+
+        remaining = end - start + 1
+        with open(path, "rb") as f:
+            f.seek(start)
+            while remaining > 0:
+                block = f.read(min(config.HTTP_CHUNK_SIZE, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                yield block
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        if not os.path.isfile(path):
+            return None
+
+        return StoredObject(key, stat.st_size, stat.st_mtime, self._etag(path, stat))
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._path(key))
+
+    def _etag(self, path: str, stat: os.stat_result) -> str:
+        """Strong ETag from the file's SHA-256, cached per size/mtime"""
+        cached = self._etag_cache.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            self._etag_cache.move_to_end(path)
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(config.HTTP_CHUNK_SIZE), b""):
+                digest.update(block)
+
+        etag = f'"{digest.hexdigest()}"'
+        self._etag_cache[path] = (stat.st_size, stat.st_mtime_ns, etag)
+        self._etag_cache.move_to_end(path)
+        while len(self._etag_cache) > config.ETAG_CACHE_SIZE:
+            self._etag_cache.popitem(last=False)
+        return etag
+
+    def delete(self, key: str) -> bool:
+        path = self._path(key)
+        self._etag_cache.pop(path, None)
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def move(self, src_key: str, dst_key: str) -> None:
+        src_path = self._path(src_key)
+        path = self._path(dst_key)
+        self._etag_cache.pop(src_path, None)
+        self._etag_cache.pop(path, None)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        os.replace(src_path, path)
+
+    def local_path(self, key: str) -> str:
+        return self._path(key)
+
+
+class S3Storage(StorageBackend):
+    """Storage in an S3-compatible bucket with a local read-through cache"""
+
+    def __init__(self, bucket: str, cache_dir: str):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        self.bucket = bucket
+        self.cache_dir = cache_dir
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=config.S3_ENDPOINT_URL,
+            region_name=config.S3_REGION,
+            aws_access_key_id=config.S3_ACCESS_KEY_ID or None,
+            aws_secret_access_key=config.S3_SECRET_ACCESS_KEY or None,
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=config.S3_MULTIPART_CHUNK_SIZE,
+            multipart_chunksize=config.S3_MULTIPART_CHUNK_SIZE,
+        )
+
+    def _is_missing(self, error: Exception) -> bool:
+        code = getattr(error, "response", {}).get("Error", {}).get("Code")
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    def put_file(self, key: str, local_path: str) -> None:
+        # upload_file switches to a multipart upload above the threshold
+        self.client.upload_file(local_path, self.bucket, key, Config=self.transfer_config)
+
+    def put_stream(self, key: str, chunks: Iterable[bytes]) -> int:
+        part_size = config.S3_MULTIPART_CHUNK_SIZE
+        buffer = bytearray()
+        size = 0
+        parts = []
+        upload_id = None
+
+        try:
+            for chunk in chunks:
+                buffer.extend(chunk)
+                size += len(chunk)
+
+                while len(buffer) >= part_size:
+                    if upload_id is None:
+                        upload_id = self.client.create_multipart_upload(
+                            Bucket=self.bucket, Key=key
+                        )["UploadId"]
+                    parts.append(self._upload_part(key, upload_id, len(parts) + 1, bytes(buffer[:part_size])))
+                    del buffer[:part_size]
+
+            # Small objects go up in a single request
+            if upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=bytes(buffer))
+                return size
+
+            if buffer:
+                parts.append(self._upload_part(key, upload_id, len(parts) + 1, bytes(buffer)))
+
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+            return size
+
+        except BaseException:
+            if upload_id is not None:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+    def _upload_part(self, key: str, upload_id: str, number: int, data: bytes) -> dict:
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=number,
+            Body=data
+        )
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    def open_read(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        response = self.client.get_object(Bucket=self.bucket, Key=key, Range=byte_range)
+        yield from response["Body"].iter_chunks(chunk_size=config.HTTP_CHUNK_SIZE)
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except Exception as e:
+            if self._is_missing(e):
+                return None
+            raise
+
+        return StoredObject(
+            key,
+            head["ContentLength"],
+            head["LastModified"].timestamp(),
+            head["ETag"]
+        )
+
+    def delete(self, key: str) -> bool:
+        existed = self.stat(key) is not None
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+        cached = os.path.join(self.cache_dir, *key.split("/"))
+        for path in (cached, cached + ".etag"):
+            if os.path.exists(path):
+                os.remove(path)
+
+        return existed
+
+    def move(self, src_key: str, dst_key: str) -> None:
+        # Server-side (multipart) copy, then drop the source
+        self.client.copy(
+            {"Bucket": self.bucket, "Key": src_key},
+            self.bucket,
+            dst_key,
+            Config=self.transfer_config
+        )
+        self.delete(src_key)
+
+    def local_path(self, key: str) -> str:
+        """Download into the read-through cache unless the cached copy is current"""
+        path = os.path.join(self.cache_dir, *key.split("/"))
+        etag_path = path + ".etag"
+
+        remote = self.stat(key)
+        if remote is None:
+            raise FileNotFoundError(key)
+
+        if os.path.exists(path) and os.path.exists(etag_path):
+            with open(etag_path) as f:
+                if f.read() == remote.etag:
+                    return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        os.close(fd)
+        self.client.download_file(self.bucket, key, temp_path, Config=self.transfer_config)
+        os.replace(temp_path, path)
+
+        with open(etag_path, "w") as f:
+            f.write(remote.etag)
+
+        return path
+
+
+# Storage backend (singleton pattern)
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """Get or create the configured storage backend"""
+    global _storage
+
+    if _storage is None:
+        if config.STORAGE_BACKEND == "s3":
+            _storage = S3Storage(config.S3_BUCKET, config.STORAGE_CACHE_DIR)
+        else:
+            _storage = LocalStorage(config.STORAGE_ROOT)
+
+    return _storage
+
+
+@traced("storage.local_path")
+def get_local_path(key: str) -> str:
+    """Get a local path for a stored object (downloads remote objects into the cache)"""
+    return get_storage().local_path(key)
+
+
+def new_scratch_path(suffix: str = "") -> str:
+    """Get a unique node-local scratch file path"""
+    os.makedirs(config.SCRATCH_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=config.SCRATCH_DIR, suffix=suffix)
+    os.close(fd)
+    return path
@@ -2,12 +2,19 @@
 PDF to Podcast - Main FastAPI Application
 Minimal entry point with route registration
 """
-from fastapi import FastAPI, HTTPException
+import asyncio
+import time
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, Response
 import config
 from db import mongodb, file_manager
+from db.storage import get_storage
 from routes import project_router, chat_router, podcast_router
+from services.tts_providers import get_provider_status
+from utils.metrics import render_metrics, HTTP_REQUEST_SECONDS
+from utils import tracing
+from utils.http_files import file_response
 
 
 # Initialize FastAPI app
@@ -28,6 +35,63 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Start a trace per request and export request latency"""
+    trace = tracing.start_trace(
+        name=f"{request.method} {request.url.path}",
+        trace_id=request.headers.get("x-trace-id")
+    )
+    started = time.perf_counter()
+    status_code = 500
+    
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            request.method,
+            route.path if route else "unmatched",
+            str(status_code)
+        ).observe(time.perf_counter() - started)
+        tracing.finish_trace(trace, status_code)
+    
+    response.headers["X-Trace-Id"] = trace.trace_id
+    response.headers["Server-Timing"] = f"total;dur={trace.duration_ms:.1f}"
+    return response
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject oversized PDF uploads from Content-Length before reading the body"""
+    if request.method == "POST" and request.url.path.endswith("/upload_pdf"):
+        content_length = request.headers.get("content-length")
+        
+        # Chunked bodies would be spooled in full before any size check
+        if content_length is None:
+            return JSONResponse(
+                status_code=411,
+                content={"detail": "PDF uploads must be sent with a Content-Length header"}
+            )
+        
+        try:
+            content_length = int(content_length)
+            if content_length < 0:
+                raise ValueError(content_length)
+        except ValueError:
+            return JSONResponse(status_code=400, content={"detail": "Invalid Content-Length header"})
+        
+        # Allow some room for multipart boundaries and headers
+        if content_length > config.MAX_UPLOAD_BYTES + 64 * 1024:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"PDF exceeds the {config.MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit"}
+            )
+    
+    return await call_next(request)
+
+
 # Register routers
 app.include_router(project_router)
 app.include_router(chat_router)
@@ -51,10 +115,19 @@ def home():
             "get_projects": "GET /projects",
             "upload_pdf": "POST /projects/{project_id}/upload_pdf",
             "chat": "POST /chat",
+            "get_chat_session": "GET /chat/sessions/{session_id}",
             "generate_podcast": "POST /generate_podcast",
-            "get_audio": "GET /audio/{filename}",
-            "get_pdf": "GET /pdf/{filename}",
-            "status": "GET /status"
+            "generate_podcast_stream": "POST /generate_podcast/stream",
+            "stream_podcast": "GET /podcasts/{podcast_id}/stream",
+            "get_chapter_audio": "GET /podcasts/{podcast_id}/chapters/{chapter_index}/audio",
+            "regenerate_chapter": "POST /podcasts/{podcast_id}/chapters/{chapter_index}/regenerate",
+            "update_podcast_script": "PUT /podcasts/{podcast_id}/script",
+            "get_audio": "GET /audio/{filename}?format=&bitrate=",
+            "get_pdf": "GET /pdf/{project_id}/{filename}",
+            "get_page_layout": "GET /projects/{project_id}/pages/{page_num}",
+            "status": "GET /status",
+            "metrics": "GET /metrics",
+            "traces": "GET /traces/{trace_id}"
         }
     }
 
@@ -70,16 +143,66 @@ async def status():
         "mongodb_connected": mongodb_connected,
         "project_count": project_count,
         "cartesia_configured": config.check_cartesia_setup(),
+        "tts_providers": get_provider_status(),
         "gemini_configured": config.check_gemini_setup()
     }
 
 
+@app.get("/metrics")
+def metrics():
+    """Export Prometheus metrics"""
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+
+@app.get("/traces")
+def recent_traces(limit: int = 50):
+    """List recently finished request traces"""
+    return {
+        "traces": [
+            {
+                "trace_id": trace.trace_id,
+                "name": trace.name,
+                "status": trace.status,
+                "duration_ms": trace.duration_ms,
+                "span_count": len(trace.spans)
+            }
+            for trace in tracing.get_recent_traces(limit)
+        ]
+    }
+
+
+@app.get("/traces/{trace_id}")
+def get_trace(trace_id: str):
+    """Get the per-stage span breakdown of a request"""
+    trace = tracing.get_trace(trace_id)
+    
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    
+    return trace.to_dict()
+
+
+@app.get("/pdf/{project_id}/{filename}")
+async def get_project_pdf(project_id: str, filename: str, request: Request):
+    """Serve a project's PDF file"""
+    path = await file_manager.resolve_pdf_path(project_id, filename)
+    
+    # Storage calls block (S3 requests, hashing on local storage)
+    if not path or not await asyncio.to_thread(get_storage().exists, path):
+        raise HTTPException(status_code=404, detail="PDF not found")
+    
+    # Re-uploads reuse the filename, so clients must revalidate
+    return await asyncio.to_thread(file_response, request, path, media_type="application/pdf")
+
+
 @app.get("/pdf/{filename}")
-async def get_pdf(filename: str):
-    """Serve PDF file"""
+async def get_pdf(filename: str, request: Request):
+    """Serve PDF file stored in the legacy flat upload layout"""
     path = file_manager.get_pdf_path(filename)
     
-    if not file_manager.pdf_file_exists(filename):
+    if not await asyncio.to_thread(file_manager.pdf_file_exists, filename):
         raise HTTPException(status_code=404, detail="PDF not found")
     
-    return FileResponse(path, media_type="application/pdf")
+    # Re-uploads reuse the filename, so clients must revalidate
+    return await asyncio.to_thread(file_response, request, path, media_type="application/pdf")
@@ -1,9 +1,11 @@
 """
 Pydantic models for request/response validation
 """
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field, ValidationInfo, field_validator
+from typing import Dict, Optional, List
 from datetime import datetime
+import config
+from utils.text import clean_dialogue, speaker_key
 
 
 class ProjectCreate(BaseModel):
@@ -17,6 +19,15 @@ class ChatRequest(BaseModel):
     project_id: str
     query: str
     top_k: int = 3
+    session_id: Optional[str] = None
+
+
+class PodcastSpeaker(BaseModel):
+    """A podcast speaker: name in the script, role for the script writer, voice per TTS provider"""
+    name: str
+    role: Optional[str] = None
+    voices: Dict[str, str] = {}
+    route: Optional[List[str]] = None
 
 
 class PodcastRequest(BaseModel):
@@ -24,12 +35,81 @@ class PodcastRequest(BaseModel):
     project_id: str
     topic: Optional[str] = None
     duration: str = "medium"
+    speakers: Optional[List[PodcastSpeaker]] = None
+
+
+class ScriptTurn(BaseModel):
+    """
+    One line of a structured podcast script (Gemini response schema)
+    
+    Validate with context={"speakers": [names]} to check speakers against
+    the podcast's roster.
+    """
+    speaker: str
+    text: str
+    emotion: Optional[str] = None
+
+    @field_validator("speaker")
+    @classmethod
+    def known_speaker(cls, speaker: str, info: ValidationInfo) -> str:
+        """Match the speaker to a roster name, ignoring case and markdown"""
+        names = (info.context or {}).get("speakers")
+        if not names:
+            return speaker
+        
+        for name in names:
+            if speaker_key(speaker.strip("*_: ")) == speaker_key(name):
+                return name
+        raise ValueError(f"must be one of: {', '.join(names)}")
+
+    @field_validator("text")
+    @classmethod
+    def spoken_text(cls, text: str) -> str:
+        """Keep only the words to speak (no stage directions or markdown)"""
+        text = clean_dialogue(text)
+        if not text:
+            raise ValueError("must contain words to speak")
+        return text
+
+    @field_validator("emotion")
+    @classmethod
+    def known_emotion(cls, emotion: Optional[str]) -> Optional[str]:
+        """Emotions TTS cannot render are dropped rather than repaired"""
+        emotion = (emotion or "").strip().lower()
+        return emotion if emotion in config.TTS_EMOTIONS else None
+
+
+class ScriptChapter(BaseModel):
+    """A chapter of a structured podcast script"""
+    title: str
+    turns: List[ScriptTurn] = Field(min_length=1)
+
+
+class PodcastScript(BaseModel):
+    """A structured podcast script, divided into chapters"""
+    chapters: List[ScriptChapter] = Field(min_length=1)
+
+
+class ChapterScript(BaseModel):
+    """The dialogue of one rewritten chapter"""
+    turns: List[ScriptTurn] = Field(min_length=1)
+
+
+class ChapterRegenerateRequest(BaseModel):
+    """Request model for regenerating one chapter of a podcast"""
+    instructions: Optional[str] = None
+
+
+class ScriptUpdateRequest(BaseModel):
+    """Request model for replacing a podcast's script"""
+    script: str
 
 
 class ChatResponse(BaseModel):
     """Response model for chat"""
     answer: str
     references: List[dict]
+    session_id: str
 
 
 class PodcastResponse(BaseModel):
@@ -58,6 +138,8 @@ class PDFUploadResponse(BaseModel):
     total_chunks: int
     total_pages: int
     word_count: int
+    sha256: Optional[str] = None
+    reused: bool = False
 
 
 class StatusResponse(BaseModel):
@@ -2,12 +2,68 @@
 Chat routes for interacting with PDF content
 """
 from fastapi import APIRouter, HTTPException
+import config
 from models import ChatRequest
 from db import mongodb
-from services import vector_service, llm_service
+from services import document_service, vector_service, llm_service
+from utils.id_generator import generate_session_id
+from utils.text import normalize_query
+from utils.tracing import span
+from datetime import datetime
+from typing import Optional, Sequence
 
 router = APIRouter(tags=["Chat"])
 
+# Only what retrieval needs; chunk text is read from the chunk store
+CHAT_DOCUMENT_FIELDS = ["faiss_index_path", "chunk_store_path", "chunks"]
+CHAT_PROJECT_FIELDS = ["project_id", "document_id"] + CHAT_DOCUMENT_FIELDS
+
+
+async def get_or_create_session(session_id: Optional[str], project_id: str) -> dict:
+    """Load an existing chat session or start a new one"""
+    if not session_id:
+        return await mongodb.create_chat_session(generate_session_id(), project_id)
+    
+    session = await mongodb.get_chat_session(session_id)
+    
+    if not session or session["project_id"] != project_id:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    
+    return session
+
+
+def find_cached_retrieval(session: dict, query_key: str, query_embedding: Sequence[float], top_k: int):
+    """
+    Return cached hits of this session for the same or a similar query
+    
+    Condensed follow-ups rarely repeat a query word for word, so a query
+    whose embedding is within CHAT_RETRIEVAL_REUSE_SIMILARITY of a cached
+    one reuses its hits too (the closest such query wins).
+    
+    Args:
+        session: Chat session with its retrieval cache
+        query_key: Normalized condensed query
+        query_embedding: Embedding of the condensed query
+        top_k: Number of hits needed
+    
+    Returns:
+        Cached hits, or None if the chunks have to be retrieved
+    """
+    best, best_similarity = None, config.CHAT_RETRIEVAL_REUSE_SIMILARITY
+    for entry in reversed(session.get("retrieval_cache", [])):
+        if entry["top_k"] < top_k:
+            continue
+        if entry["query_key"] == query_key:
+            return entry["hits"][:top_k]
+    
+        # Entries cached before embeddings were stored only match exactly
+        if entry.get("query_embedding"):
+            similarity = vector_service.query_similarity(query_embedding, entry["query_embedding"])
+            if similarity >= best_similarity:
+                best, best_similarity = entry, similarity
+    
+    return best["hits"][:top_k] if best else None
+
 
 @router.post("/chat")
 async def chat_with_pdf(req: ChatRequest):
@@ -16,45 +72,113 @@ async def chat_with_pdf(req: ChatRequest):
     """
     try:
         # Get project
-        project = await mongodb.get_project(req.project_id)
+        project = await mongodb.get_project(req.project_id, CHAT_PROJECT_FIELDS)
+        document = await document_service.get_project_document(
+            project, CHAT_DOCUMENT_FIELDS
+        ) if project else None
         
-        if not project or not project.get("faiss_index_path"):
+        if not document or not document.get("faiss_index_path"):
             raise HTTPException(
                 status_code=400,
                 detail="No PDF processed for this project"
             )
         
-        # Load FAISS index
-        index = vector_service.load_faiss_index(project["faiss_index_path"])
-        chunks = project["chunks"]
+        session = await get_or_create_session(req.session_id, req.project_id)
+        history = session.get("history", [])
+        chunks = document_service.load_document_chunks(document)
         
-        # Search for relevant chunks
-        relevant_chunks = vector_service.search_similar_chunks(
-            index=index,
-            chunks=chunks,
-            query=req.query,
-            top_k=req.top_k
-        )
+        # Turn follow-ups into standalone queries before retrieval
+        search_query = await llm_service.condense_query(req.query, history)
+        query_key = normalize_query(search_query)
+        query_embedding = vector_service.embed_query(search_query)
+        
+        # Reuse chunks already retrieved for this or a similar query in the session
+        hits = find_cached_retrieval(session, query_key, query_embedding, req.top_k)
+        
+        if hits is not None:
+            relevant_chunks = vector_service.get_chunks_by_hits(chunks, hits)
+        else:
+            with span("chat.retrieve", top_k=req.top_k):
+                # Load FAISS index
+                index = vector_service.load_faiss_index(document["faiss_index_path"])
+                
+                # Search for relevant chunks
+                relevant_chunks = vector_service.search_similar_chunks(
+                    index=index,
+                    chunks=chunks,
+                    query=search_query,
+                    top_k=req.top_k,
+                    query_embedding=query_embedding
+                )
+            
+            await mongodb.cache_chat_retrieval(session["session_id"], {
+                "query_key": query_key,
+                "query_embedding": [round(float(value), 5) for value in query_embedding],
+                "top_k": req.top_k,
+                "hits": [
+                    {
+                        "chunk_index": chunk["chunk_index"],
+                        "relevance_score": chunk["relevance_score"]
+                    }
+                    for chunk in relevant_chunks
+                ]
+            })
         
         # Generate answer using LLM
         answer = await llm_service.chat_with_context(
             query=req.query,
-            context_chunks=relevant_chunks
+            context_chunks=relevant_chunks,
+            history=history
         )
         
+        await mongodb.add_chat_turn(session["session_id"], {
+            "query": req.query,
+            "search_query": search_query,
+            "answer": answer,
+            "chunk_indexes": [chunk["chunk_index"] for chunk in relevant_chunks],
+            "created_at": datetime.utcnow()
+        })
+        
         return {
             "answer": answer,
+            "session_id": session["session_id"],
             "references": [
                 {
                     "page": chunk["page"],
+                    "boxes": chunk["boxes"],
                     "text_preview": chunk["text"][:200] + "...",
                     "relevance": chunk["relevance_score"]
                 }
                 for chunk in relevant_chunks
             ]
         }
-        
+    
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/chat/sessions/{session_id}")
+async def get_chat_session(session_id: str):
+    """Get chat session history"""
+    session = await mongodb.get_chat_session(session_id)
+    
+    if not session:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    
+    return {
+        "session_id": session["session_id"],
+        "project_id": session["project_id"],
+        "created_at": session["created_at"],
+        "history": session.get("history", [])
+    }
+
+
+@router.delete("/chat/sessions/{session_id}")
+async def delete_chat_session(session_id: str):
+    """Delete a chat session"""
+    if not await mongodb.delete_chat_session(session_id):
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    
+    return {"status": "success", "message": "Chat session deleted"}
@@ -1,67 +1,197 @@
 """
 Podcast generation routes
 """
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
-from models import PodcastRequest
+import asyncio
+import time
+from typing import Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from models import PodcastRequest, ChapterRegenerateRequest, ScriptUpdateRequest
 from db import mongodb, file_manager
-from services import llm_service, tts_service
+from db.storage import get_storage
+from services import audio_export, document_service, llm_gateway, llm_service, podcast_service
+from utils.audio_stream import AudioStream
 from utils.id_generator import generate_podcast_id
+from utils.metrics import PODCAST_FIRST_AUDIO_SECONDS
+from utils.singleflight import SingleFlight
+from utils.text import normalize_query, join_podcast_chapters, parse_podcast_script
+from utils.tracing import span
+from utils.http_files import file_response
 from datetime import datetime
 import os
 
 router = APIRouter(tags=["Podcast"])
 
 
-@router.post("/generate_podcast")
-async def generate_podcast(req: PodcastRequest):
-    """Generate podcast from PDF content"""
-    # Get project
-    project = await mongodb.get_project(req.project_id)
+# Identical podcast requests in flight share one generation job
+_podcast_jobs = SingleFlight()
+
+# Podcast ID of each in-flight job, so duplicate requests join its stream
+_job_podcast_ids: Dict[tuple, str] = {}
+
+# Audio of podcasts being generated, by podcast ID, for progressive playback
+_audio_streams: Dict[str, AudioStream] = {}
+
+
+def get_request_roster(req: PodcastRequest) -> List[Dict]:
+    """Build the speaker roster of a podcast request, or fail with 400"""
+    try:
+        return podcast_service.build_roster([speaker.model_dump() for speaker in req.speakers or []])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def podcast_job_key(req: PodcastRequest, speakers: List[Dict]) -> tuple:
+    """Build the deduplication key for a podcast request"""
+    topic = normalize_query(req.topic) if req.topic else None
+    roster = tuple(
+        (speaker["key"], speaker["role"], tuple(sorted(speaker["voices"].items())), tuple(speaker["route"]))
+        for speaker in speakers
+    )
+    return (req.project_id, topic, req.duration, roster)
+
+
+async def run_podcast_job(req: PodcastRequest, pdf_text: str, podcast_id: str, speakers: List[Dict]) -> dict:
+    """Generate script and audio for a podcast and store it"""
+    stream = _audio_streams[podcast_id]
+    started = time.perf_counter()
     
-    if not project or not project.get("pdf_text"):
-        raise HTTPException(
-            status_code=400,
-            detail="Please upload PDF first"
-        )
+    async def on_audio(chunk: bytes) -> None:
+        if not stream.chunks:
+            PODCAST_FIRST_AUDIO_SECONDS.observe(time.perf_counter() - started)
+        await stream.append(chunk)
     
     try:
-        # Generate script using LLM
-        script = await llm_service.generate_podcast_script(
-            pdf_text=project["pdf_text"],
-            topic=req.topic,
-            duration=req.duration
-        )
+        # Generate script using LLM (structured chapters of dialogue)
+        with span("podcast.script", duration=req.duration):
+            chapters = await llm_service.generate_podcast_script(
+                pdf_text=pdf_text,
+                topic=req.topic,
+                duration=req.duration,
+                speakers=speakers
+            )
         
-        # Generate audio from script
-        podcast_path, segments_count = await tts_service.create_podcast_audio(
-            script=script,
-            project_id=req.project_id
-        )
+        # Generate audio chapter by chapter (files are namespaced by podcast_id)
+        with span("podcast.audio", chapters=len(chapters)):
+            chapters, _ = await podcast_service.create_chapters_audio(chapters, podcast_id, speakers, on_audio)
+            podcast_path = await asyncio.to_thread(
+                podcast_service.assemble_podcast_audio,
+                chapters,
+                file_manager.get_podcast_audio_path(req.project_id, podcast_id)
+            )
+        segments_count = podcast_service.count_segments(chapters)
+        script = join_podcast_chapters(chapters)
         
         # Create podcast metadata
         podcast_data = {
-            "podcast_id": generate_podcast_id(),
+            "podcast_id": podcast_id,
             "created_at": datetime.utcnow(),
             "topic": req.topic,
             "duration": req.duration,
+            "speakers": speakers,
             "script": script,
+            "chapters": chapters,
             "audio_path": podcast_path,
-            "audio_filename": os.path.basename(podcast_path),
+            "audio_filename": podcast_service.audio_filename(podcast_path),
             "segments_count": segments_count
         }
         
         # Save podcast to project
         await mongodb.add_podcast_to_project(req.project_id, podcast_data)
+        await stream.finish()
         
-        return {
-            "status": "success",
-            "podcast_id": podcast_data["podcast_id"],
-            "podcast_url": f"/audio/{os.path.basename(podcast_path)}",
-            "script": script,
-            "segments_count": segments_count
-        }
+    except Exception as e:
+        await stream.finish(error=str(e))
+        raise
+    
+    return {
+        "status": "success",
+        "podcast_id": podcast_data["podcast_id"],
+        "podcast_url": f"/audio/{podcast_data['audio_filename']}",
+        "script": script,
+        "speakers": podcast_service.speaker_names(speakers),
+        "chapters": chapter_summaries(chapters),
+        "segments_count": segments_count
+    }
+
+
+def chapter_summaries(chapters: list) -> list:
+    """Chapter titles and sizes for API responses"""
+    return [
+        {"index": i, "title": chapter["title"], "segments_count": len(chapter["segments"])}
+        for i, chapter in enumerate(chapters)
+    ]
+
+
+def start_podcast_job(req: PodcastRequest, pdf_text: str, speakers: List[Dict]) -> tuple[str, asyncio.Future, bool]:
+    """
+    Start a podcast job, or join the identical one in flight
+    
+    Args:
+        req: Podcast request
+        pdf_text: Document text to base the script on
+        speakers: Roster of the podcast (from get_request_roster)
         
+    Returns:
+        Tuple of (podcast_id, future of the job result, shared)
+    """
+    key = podcast_job_key(req, speakers)
+    podcast_id = generate_podcast_id()
+    task, shared = _podcast_jobs.start(key, lambda: run_podcast_job(req, pdf_text, podcast_id, speakers))
+    
+    if shared:
+        podcast_id = _job_podcast_ids[key]
+    else:
+        # Register the stream before the job runs so listeners can attach at once
+        _job_podcast_ids[key] = podcast_id
+        _audio_streams[podcast_id] = AudioStream()
+        task.add_done_callback(lambda _: finish_podcast_job(key, podcast_id))
+    
+    # A caller that goes away does not cancel the job for the others
+    return podcast_id, asyncio.shield(task), shared
+
+
+def finish_podcast_job(key: tuple, podcast_id: str) -> None:
+    """Forget a finished job; it leaves the single-flight set in the same step"""
+    # Later listeners are served the stored file
+    _job_podcast_ids.pop(key, None)
+    _audio_streams.pop(podcast_id, None)
+
+
+async def get_podcast_text(project_id: str) -> str:
+    """Get the document text of a project, or fail if no PDF was uploaded"""
+    project = await mongodb.get_project(project_id)
+    document = await document_service.get_project_document(project) if project else None
+    
+    if not document or not document.get("pdf_text"):
+        raise HTTPException(
+            status_code=400,
+            detail="Please upload PDF first"
+        )
+    
+    return document["pdf_text"]
+
+
+@router.post("/generate_podcast")
+async def generate_podcast(req: PodcastRequest):
+    """Generate podcast from PDF content"""
+    speakers = get_request_roster(req)
+    pdf_text = await get_podcast_text(req.project_id)
+    
+    try:
+        podcast_id, future, shared = start_podcast_job(req, pdf_text, speakers)
+        result = await future
+        
+        if shared:
+            print(f"Attached duplicate podcast request to job {podcast_id}")
+        
+        return {**result, "deduplicated": shared}
+        
+    except llm_gateway.GatewayError as e:
+        raise HTTPException(
+            status_code=502,
+            detail=f"Podcast script generation failed: {str(e)}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -69,12 +199,258 @@ async def generate_podcast(req: PodcastRequest):
         )
 
 
+@router.post("/generate_podcast/stream")
+async def generate_podcast_stream(req: PodcastRequest):
+    """Start podcast generation and return the URL its audio streams from"""
+    speakers = get_request_roster(req)
+    pdf_text = await get_podcast_text(req.project_id)
+    podcast_id, future, shared = start_podcast_job(req, pdf_text, speakers)
+    
+    def log_failure(job: asyncio.Future) -> None:
+        if not job.cancelled() and job.exception():
+            print(f"Podcast job {podcast_id} failed: {job.exception()}")
+    
+    future.add_done_callback(log_failure)
+    
+    return {
+        "status": "generating",
+        "podcast_id": podcast_id,
+        "stream_url": f"/podcasts/{podcast_id}/stream",
+        "deduplicated": shared
+    }
+
+
+@router.get("/podcasts/{podcast_id}/stream")
+async def stream_podcast(podcast_id: str):
+    """Stream podcast audio, starting while it is still being generated"""
+    stream = _audio_streams.get(podcast_id)
+    
+    if stream is not None:
+        # Segments are sent as soon as they are encoded, in script order
+        return StreamingResponse(
+            stream.iter_chunks(),
+            media_type="audio/mpeg",
+            headers={"Cache-Control": "no-store"}
+        )
+    
+    # Finished (or generated by another worker): redirect to the stored file
+    podcast = await mongodb.get_podcast(podcast_id)
+    
+    if not podcast:
+        raise HTTPException(status_code=404, detail="Podcast not found")
+    
+    if not await asyncio.to_thread(get_storage().exists, podcast["audio_path"]):
+        if not podcast.get("chapters"):
+            raise HTTPException(status_code=404, detail="Podcast not found")
+        
+        # Assemble on demand from the stored chapter audio
+        await asyncio.to_thread(podcast_service.assemble_podcast_audio, podcast["chapters"], podcast["audio_path"])
+    
+    # Edits replace the audio behind this URL, so it is never cached; the
+    # file name under /audio changes with every revision and is immutable
+    return RedirectResponse(
+        f"/audio/{podcast_service.audio_filename(podcast['audio_path'])}",
+        status_code=307,
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
+def negotiate_rendition(
+    request: Request,
+    extension: str = "",
+    audio_format: Optional[str] = None,
+    bitrate: Optional[str] = None
+) -> tuple[str, str]:
+    """Choose format and bitrate of the audio to serve, or fail with 400"""
+    try:
+        return audio_export.negotiate_rendition(
+            extension,
+            request.headers.get("accept", ""),
+            audio_format,
+            bitrate
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def serve_rendition(
+    request: Request,
+    master_path: str,
+    extension: str = "",
+    audio_format: Optional[str] = None,
+    bitrate: Optional[str] = None
+) -> Response:
+    """Serve a rendition of a podcast master, encoding it on first request"""
+    audio_format, bitrate = negotiate_rendition(request, extension, audio_format, bitrate)
+    
+    try:
+        path = await audio_export.get_rendition(master_path, audio_format, bitrate)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Audio encoding failed: {str(e)}"
+        )
+    
+    # A rendition never changes, but which one is served depends on Accept
+    response = await asyncio.to_thread(
+        file_response,
+        request,
+        path,
+        media_type=audio_export.FORMATS[audio_format]["media_type"],
+        immutable=True
+    )
+    response.headers["Vary"] = "Accept"
+    return response
+
+
+async def get_podcast_chapter(podcast_id: str, chapter_index: int) -> tuple[dict, dict]:
+    """Get a podcast and one of its chapters, or fail with 404/400"""
+    podcast = await mongodb.get_podcast(podcast_id)
+    
+    if not podcast:
+        raise HTTPException(status_code=404, detail="Podcast not found")
+    
+    if not podcast.get("chapters"):
+        raise HTTPException(status_code=400, detail="Podcast was created without chapters")
+    
+    if not 0 <= chapter_index < len(podcast["chapters"]):
+        raise HTTPException(status_code=404, detail="Chapter not found")
+    
+    return podcast, podcast["chapters"][chapter_index]
+
+
+@router.get("/podcasts/{podcast_id}/chapters/{chapter_index}/audio")
+async def get_chapter_audio(
+    podcast_id: str,
+    chapter_index: int,
+    request: Request,
+    audio_format: Optional[str] = Query(None, alias="format"),
+    bitrate: Optional[str] = None
+):
+    """Get the audio of one chapter, encoded from its segments"""
+    _, chapter = await get_podcast_chapter(podcast_id, chapter_index)
+    audio_format, bitrate = negotiate_rendition(request, "", audio_format, bitrate)
+    
+    audio = await asyncio.get_running_loop().run_in_executor(
+        audio_export.get_transcode_pool(),
+        podcast_service.encode_chapter_audio,
+        chapter,
+        audio_format,
+        bitrate
+    )
+    
+    return Response(
+        content=audio,
+        media_type=audio_export.FORMATS[audio_format]["media_type"],
+        headers={"Vary": "Accept"}
+    )
+
+
+@router.post("/podcasts/{podcast_id}/chapters/{chapter_index}/regenerate")
+async def regenerate_chapter(podcast_id: str, chapter_index: int, req: ChapterRegenerateRequest):
+    """Rewrite one chapter and re-synthesize only its audio"""
+    async with podcast_service.get_podcast_lock(podcast_id):
+        # Read under the lock so concurrent edits build on each other
+        podcast, _ = await get_podcast_chapter(podcast_id, chapter_index)
+        pdf_text = await get_podcast_text(podcast["project_id"])
+        
+        try:
+            with span("podcast.regenerate_chapter", index=chapter_index):
+                podcast, synthesized = await podcast_service.regenerate_chapter(
+                    podcast,
+                    pdf_text,
+                    chapter_index,
+                    req.instructions
+                )
+        except llm_gateway.GatewayError as e:
+            raise HTTPException(
+                status_code=502,
+                detail=f"Chapter script generation failed: {str(e)}"
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Chapter regeneration failed: {str(e)}"
+            )
+    
+    chapter = podcast["chapters"][chapter_index]
+    return {
+        "status": "success",
+        "podcast_id": podcast_id,
+        "podcast_url": f"/audio/{podcast['audio_filename']}",
+        "chapter": {"index": chapter_index, "title": chapter["title"], "script": chapter["script"]},
+        "chapters": chapter_summaries(podcast["chapters"]),
+        "synthesized_segments": synthesized,
+        "reused_segments": podcast["segments_count"] - synthesized
+    }
+
+
 @router.get("/audio/{filename}")
-async def get_audio(filename: str):
-    """Serve audio file"""
-    path = file_manager.get_audio_path(filename)
+async def get_audio(
+    filename: str,
+    request: Request,
+    audio_format: Optional[str] = Query(None, alias="format"),
+    bitrate: Optional[str] = None
+):
+    """
+    Serve podcast audio
+    
+    Stored files (MP3s of older podcasts, FLAC masters) are served as they
+    are. A podcast name without extension, or with a rendition extension
+    (.mp3, .opus, .m4a), gets a rendition of its master; format and bitrate
+    come from ?format= and ?bitrate=, the extension, or the Accept header.
+    """
+    stem, extension = os.path.splitext(os.path.basename(filename))
+    master_path = file_manager.get_audio_path(f"{stem}.flac")
+    has_master = await asyncio.to_thread(get_storage().exists, master_path)
+    stored = await asyncio.to_thread(file_manager.audio_file_exists, filename)
+    
+    # Podcast audio is written once under a unique podcast ID
+    if stored and not (has_master and (audio_format or bitrate)):
+        media_type = audio_export.MASTER_MEDIA_TYPE if extension == ".flac" else "audio/mpeg"
+        return await asyncio.to_thread(
+            file_response,
+            request,
+            file_manager.get_audio_path(filename),
+            media_type=media_type,
+            immutable=True
+        )
     
-    if not file_manager.audio_file_exists(filename):
+    if not has_master:
         raise HTTPException(status_code=404, detail="Audio not found")
     
-    return FileResponse(path, media_type="audio/mpeg")
+    return await serve_rendition(request, master_path, extension, audio_format, bitrate)
+
+
+@router.put("/podcasts/{podcast_id}/script")
+async def update_podcast_script(podcast_id: str, req: ScriptUpdateRequest):
+    """Replace a podcast's script and re-synthesize only the lines that changed"""
+    async with podcast_service.get_podcast_lock(podcast_id):
+        podcast = await mongodb.get_podcast(podcast_id)
+        
+        if not podcast:
+            raise HTTPException(status_code=404, detail="Podcast not found")
+        
+        speakers = podcast_service.speaker_names(podcast_service.get_roster(podcast))
+        if not parse_podcast_script(req.script, speakers):
+            raise HTTPException(status_code=400, detail=f"Script has no dialogue lines of {', '.join(speakers)}")
+        
+        try:
+            with span("podcast.update_script"):
+                podcast, diff, synthesized = await podcast_service.update_script(podcast, req.script)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Script update failed: {str(e)}"
+            )
+    
+    return {
+        "status": "success",
+        "podcast_id": podcast_id,
+        "podcast_url": f"/audio/{podcast['audio_filename']}",
+        "script": podcast["script"],
+        "chapters": chapter_summaries(podcast["chapters"]),
+        "diff": diff,
+        "synthesized_segments": synthesized,
+        "reused_segments": podcast["segments_count"] - synthesized
+    }
@@ -2,11 +2,12 @@
 Project management routes
 """
 from fastapi import APIRouter, UploadFile, HTTPException
-from fastapi.responses import FileResponse
 from models import ProjectCreate
 from db import mongodb, file_manager
-from services import pdf_service, vector_service
+from services import document_service, page_store
 from utils.id_generator import generate_project_id
+from utils.tracing import span
+import asyncio
 import os
 
 router = APIRouter(prefix="/projects", tags=["Projects"])
@@ -59,6 +60,13 @@ async def delete_project(project_id: str):
     # Delete associated files
     await file_manager.cleanup_project_files(project)
     
+    # Release the shared document
+    if project.get("document_id"):
+        await document_service.release_document(project["document_id"], project_id)
+    
+    # Delete chat sessions
+    await mongodb.delete_project_chat_sessions(project_id)
+    
     return {"status": "success", "message": "Project deleted"}
 
 
@@ -70,39 +78,54 @@ async def upload_pdf(project_id: str, file: UploadFile):
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Save uploaded file
-    file_content = await file.read()
-    file_path = await file_manager.save_uploaded_pdf(
-        file_content=file_content,
-        project_id=project_id,
-        filename=file.filename
-    )
-    
-    # Process PDF
-    full_text, chunks, total_pages = await pdf_service.process_pdf(file_path)
-    
-    # Build FAISS index
-    index, embeddings = vector_service.build_faiss_index(chunks)
-    
-    # Save FAISS index
-    index_path = vector_service.save_faiss_index(index, project_id)
+    # Stream uploaded file to storage, hashing it on the way
+    try:
+        with span("upload.save"):
+            file_path, pdf_sha256, pdf_size = await file_manager.save_uploaded_pdf(file.file)
+    except file_manager.UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except file_manager.InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Reuse the processed document if this PDF is already known
+    with span("upload.ingest"):
+        document, reused = await document_service.ingest_pdf(
+            staging_path=file_path,
+            pdf_sha256=pdf_sha256,
+            pdf_size=pdf_size,
+            project_id=project_id
+        )
     
     # Update project in database
     await mongodb.update_project_pdf(
         project_id=project_id,
         pdf_filename=file.filename,
-        pdf_path=file_path,
-        pdf_text=full_text,
-        chunks=chunks,
-        faiss_index_path=index_path
+        document=document
     )
     
+    # A project has a single PDF; replace any previous index entry
+    file_manager.forget_project_pdfs(project_id)
+    file_manager.register_pdf_path(project_id, file.filename, document["pdf_path"])
+    
+    previous_document_id = project.get("document_id")
+    if previous_document_id != document["document_id"]:
+        # Cached chat retrievals point at the previous chunk list
+        await mongodb.clear_project_chat_retrievals(project_id)
+        
+        # Release the previous document, or files from before the document store
+        if previous_document_id:
+            await document_service.release_document(previous_document_id, project_id)
+        else:
+            file_manager.delete_legacy_pdf_files(project)
+    
     return {
         "status": "success",
         "filename": file.filename,
-        "total_chunks": len(chunks),
-        "total_pages": total_pages,
-        "word_count": len(full_text.split())
+        "total_chunks": document["total_chunks"],
+        "total_pages": document["total_pages"],
+        "word_count": document["word_count"],
+        "sha256": pdf_sha256,
+        "reused": reused
     }
 
 
@@ -115,3 +138,24 @@ async def get_podcasts(project_id: str):
         raise HTTPException(status_code=404, detail="Project not found")
     
     return {"podcasts": project.get("podcasts", [])}
+
+
+@router.get("/{project_id}/pages/{page_num}")
+async def get_page_layout(project_id: str, page_num: int):
+    """Get a page's text, block layout and word boxes (for highlighting in the viewer)"""
+    project = await mongodb.get_project(project_id, ["project_id", "document_id"])
+    
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    document = await document_service.get_project_document(project, ["page_store_path"])
+    
+    if not document or not document.get("page_store_path"):
+        raise HTTPException(status_code=404, detail="No page layout for this project")
+    
+    page = await asyncio.to_thread(page_store.load_page, document["page_store_path"], page_num)
+    
+    if page is None:
+        raise HTTPException(status_code=404, detail="Page not found")
+    
+    return page
@@ -0,0 +1,268 @@
+"""
+Podcast audio export: lossless masters and cached renditions
+
+Segment audio is kept as raw PCM (mono, 16-bit, SAMPLE_RATE), so a podcast
+is assembled by concatenating segments and encoded once into a FLAC master.
+MP3, Opus and AAC renditions are encoded from the master by ffmpeg in a
+small worker pool the first time they are requested, then served from
+storage.
+"""
+import asyncio
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+from pydub import AudioSegment
+import config
+from db.file_manager import get_rendition_path
+from db.storage import get_storage, get_local_path, new_scratch_path
+from utils.metrics import AUDIO_ENCODE_SECONDS, AUDIO_RENDITION_BYTES, AUDIO_RENDITION_REQUESTS
+from utils.singleflight import SingleFlight
+from utils.tracing import span
+
+# Layout of segment audio
+PCM_SAMPLE_WIDTH = 2
+PCM_CHANNELS = 1
+PCM_INPUT = ["-f", "s16le", "-ar", str(config.SAMPLE_RATE), "-ac", str(PCM_CHANNELS)]
+
+# Encoder settings, content type and file extensions of each rendition format
+FORMATS = {
+    "mp3": {
+        "args": ["-c:a", "libmp3lame", "-f", "mp3"],
+        "media_type": "audio/mpeg",
+        "extensions": (".mp3",),
+        "accept": ("audio/mpeg", "audio/mp3"),
+    },
+    "opus": {
+        "args": ["-c:a", "libopus", "-f", "ogg"],
+        "media_type": "audio/ogg",
+        "extensions": (".opus", ".ogg"),
+        "accept": ("audio/ogg", "audio/opus", "application/ogg"),
+    },
+    "aac": {
+        "args": ["-c:a", "aac", "-f", "ipod", "-movflags", "+faststart"],
+        "media_type": "audio/mp4",
+        "extensions": (".m4a", ".aac"),
+        "accept": ("audio/mp4", "audio/aac", "audio/x-m4a"),
+    },
+}
+
+MASTER_MEDIA_TYPE = "audio/flac"
+
+_pool: Optional[ThreadPoolExecutor] = None
+_transcodes = SingleFlight()
+
+
+def run_ffmpeg(args: list, chunks: Optional[Iterable[bytes]] = None) -> None:
+    """
+    Run ffmpeg, feeding chunks to its standard input
+    
+    Args:
+        args: ffmpeg arguments after the global options
+        chunks: Optional input data (read with "-i pipe:0")
+    """
+    process = subprocess.Popen(
+        [AudioSegment.converter, "-hide_banner", "-loglevel", "error", "-y", *args],
+        stdin=subprocess.PIPE if chunks is not None else subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    
+    try:
+        if chunks is not None:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+    except BrokenPipeError:
+        # ffmpeg exited early; its error output says why
+        pass
+    finally:
+        if process.stdin:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+    
+    errors = process.stderr.read()
+    process.wait()
+    if process.returncode != 0:
+        raise Exception(f"ffmpeg failed: {errors.decode('utf-8', 'replace').strip()}")
+
+
+def write_master(pcm_chunks: Iterable[bytes], master_path: str) -> str:
+    """
+    Encode concatenated segment PCM into the FLAC master of a podcast
+    
+    Args:
+        pcm_chunks: Raw PCM in playback order
+        master_path: Storage key of the master
+    
+    Returns:
+        The master path
+    """
+    scratch = new_scratch_path(".flac")
+    try:
+        run_ffmpeg([*PCM_INPUT, "-i", "pipe:0", "-c:a", "flac", scratch], pcm_chunks)
+        get_storage().put_file(master_path, scratch)
+    finally:
+        os.remove(scratch)
+    
+    return master_path
+
+
+def encode_pcm(pcm_chunks: Iterable[bytes], audio_format: str, bitrate: str) -> bytes:
+    """Encode raw PCM into one rendition format, e.g. for a chapter preview"""
+    scratch = new_scratch_path(f".{audio_format}")
+    try:
+        run_ffmpeg(
+            [*PCM_INPUT, "-i", "pipe:0", *FORMATS[audio_format]["args"], "-b:a", bitrate, scratch],
+            pcm_chunks
+        )
+        with open(scratch, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(scratch)
+
+
+def transcode(master_path: str, audio_format: str, bitrate: str) -> str:
+    """
+    Encode a rendition from a podcast master and store it (blocking)
+    
+    Args:
+        master_path: Storage key of the FLAC master
+        audio_format: Rendition format (see FORMATS)
+        bitrate: Target bitrate, e.g. "64k"
+    
+    Returns:
+        Storage key of the rendition
+    """
+    rendition_path = get_rendition_path(master_path, audio_format, bitrate)
+    scratch = new_scratch_path(f".{audio_format}")
+    try:
+        started = time.perf_counter()
+        run_ffmpeg([
+            "-i", get_local_path(master_path), "-vn",
+            *FORMATS[audio_format]["args"], "-b:a", bitrate, scratch
+        ])
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(scratch)
+        
+        get_storage().put_file(rendition_path, scratch)
+    finally:
+        os.remove(scratch)
+    
+    AUDIO_ENCODE_SECONDS.labels(audio_format, bitrate).observe(elapsed)
+    AUDIO_RENDITION_BYTES.labels(audio_format, bitrate).observe(size)
+    print(f"Encoded {audio_format} {bitrate}: {size / 1e6:.2f} MB in {elapsed:.2f}s ({os.path.basename(master_path)})")
+    
+    return rendition_path
+
+
+def get_transcode_pool() -> ThreadPoolExecutor:
+    """Get the pool bounding concurrent ffmpeg encodes"""
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=config.TRANSCODE_WORKERS, thread_name_prefix="transcode")
+    return _pool
+
+
+async def get_rendition(master_path: str, audio_format: str, bitrate: str) -> str:
+    """
+    Get a rendition of a podcast master, encoding it on first request
+    
+    Concurrent requests for the same rendition share one encode.
+    
+    Args:
+        master_path: Storage key of the FLAC master
+        audio_format: Rendition format (see FORMATS)
+        bitrate: Target bitrate
+    
+    Returns:
+        Storage key of the rendition
+    """
+    rendition_path = get_rendition_path(master_path, audio_format, bitrate)
+    if await asyncio.to_thread(get_storage().exists, rendition_path):
+        AUDIO_RENDITION_REQUESTS.labels(audio_format, "cached").inc()
+        return rendition_path
+    
+    AUDIO_RENDITION_REQUESTS.labels(audio_format, "encoded").inc()
+    loop = asyncio.get_running_loop()
+    with span("audio.transcode", format=audio_format, bitrate=bitrate):
+        rendition_path, _ = await _transcodes.do(
+            rendition_path,
+            lambda: loop.run_in_executor(get_transcode_pool(), transcode, master_path, audio_format, bitrate)
+        )
+    
+    return rendition_path
+
+
+def format_from_extension(extension: str) -> Optional[str]:
+    """Get the rendition format a file extension asks for"""
+    for audio_format, spec in FORMATS.items():
+        if extension.lower() in spec["extensions"]:
+            return audio_format
+    return None
+
+
+def format_from_accept(accept: str) -> str:
+    """
+    Pick the rendition format preferred by an Accept header
+    
+    Args:
+        accept: Accept header value
+    
+    Returns:
+        Format with the highest q-value (earliest listed on ties), or the default
+    """
+    best, best_q = config.DEFAULT_AUDIO_FORMAT, 0.0
+    for entry in accept.split(","):
+        media_type, *params = [part.strip() for part in entry.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        
+        for audio_format, spec in FORMATS.items():
+            if media_type.lower() in spec["accept"] and q > best_q:
+                best, best_q = audio_format, q
+    
+    return best
+
+
+def negotiate_rendition(
+    extension: str,
+    accept: str,
+    audio_format: Optional[str] = None,
+    bitrate: Optional[str] = None
+) -> tuple[str, str]:
+    """
+    Choose the rendition to serve for an audio request
+    
+    An explicit format wins over the file extension, which wins over the
+    Accept header. The bitrate defaults to the format's first offered one.
+    
+    Args:
+        extension: Extension of the requested file name ("" for none)
+        accept: Accept header value
+        audio_format: Format requested with ?format=
+        bitrate: Bitrate requested with ?bitrate=
+    
+    Returns:
+        Tuple of (format, bitrate)
+    
+    Raises:
+        ValueError: If the format or bitrate is not offered
+    """
+    audio_format = audio_format or format_from_extension(extension) or format_from_accept(accept)
+    if audio_format not in config.AUDIO_RENDITIONS:
+        raise ValueError(f"Unsupported audio format: {audio_format}")
+    
+    bitrates = config.AUDIO_RENDITIONS[audio_format]
+    bitrate = bitrate or bitrates[0]
+    if bitrate not in bitrates:
+        raise ValueError(f"Bitrate {bitrate} not offered for {audio_format} ({', '.join(bitrates)})")
+    
+    return audio_format, bitrate
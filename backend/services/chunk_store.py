@@ -0,0 +1,191 @@
+"""
+Compact, memory-mapped chunk store
+
+A document's chunks are stored next to its FAISS index as three files:
+    {path}.offsets.npy  int64 byte offsets into the text blob (n + 1 entries)
+    {path}.pages.npy    int32 page number per chunk
+    {path}.text.bin     UTF-8 text of all chunks, concatenated
+plus, for chunks with layout information, their highlight boxes:
+    {path}.box_offsets.npy  int64 offsets into the box array (n + 1 entries)
+    {path}.boxes.npy        float32 [page, x0, y0, x1, y1] rows
+Readers map the files and decode only the chunks they index.
+"""
+import mmap
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+import config
+from db.storage import get_storage, get_local_path, new_scratch_path
+from utils.tracing import traced
+
+OFFSETS_SUFFIX = ".offsets.npy"
+PAGES_SUFFIX = ".pages.npy"
+TEXT_SUFFIX = ".text.bin"
+BOX_OFFSETS_SUFFIX = ".box_offsets.npy"
+BOXES_SUFFIX = ".boxes.npy"
+
+
+class ChunkStore:
+    """Read-only chunk sequence backed by memory-mapped files"""
+
+    def __init__(
+        self,
+        offsets_path: str,
+        pages_path: str,
+        text_path: str,
+        box_offsets_path: Optional[str] = None,
+        boxes_path: Optional[str] = None
+    ):
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        self.pages = np.load(pages_path, mmap_mode="r")
+        self.box_offsets = np.load(box_offsets_path, mmap_mode="r") if box_offsets_path else None
+        self.boxes = np.load(boxes_path, mmap_mode="r") if boxes_path else None
+        
+        # mmap cannot map empty files (documents without text)
+        if os.path.getsize(text_path) > 0:
+            with open(text_path, "rb") as f:
+                self.text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.text = b""
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def __getitem__(self, index: int) -> Dict[str, any]:
+        """Decode a single chunk as {"text", "page"} (and "boxes" if stored)"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        chunk = {
+            "text": self.text[start:end].decode("utf-8"),
+            "page": int(self.pages[index])
+        }
+        
+        if self.boxes is not None:
+            first, last = int(self.box_offsets[index]), int(self.box_offsets[index + 1])
+            chunk["boxes"] = [
+                [int(row[0]), *(round(float(v), 2) for v in row[1:])]
+                for row in self.boxes[first:last]
+            ]
+        
+        return chunk
+
+
+# Open stores by storage path with the version they were mapped at and when
+# that was last checked against storage, LRU order
+_store_cache: "OrderedDict[str, tuple[tuple[int, int], ChunkStore, float]]" = OrderedDict()
+
+
+@traced("chunks.save")
+def save_chunk_store(chunks: List[Dict[str, any]], store_path: str) -> str:
+    """
+    Write chunks to storage in the compact format
+    
+    Args:
+        chunks: List of chunks with text and page
+        store_path: Storage key prefix of the store files
+    
+    Returns:
+        The store path
+    """
+    encoded = [c["text"].encode("utf-8") for c in chunks]
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    pages = np.array([c["page"] for c in chunks], dtype=np.int32)
+    
+    storage = get_storage()
+    local_path = new_scratch_path()
+    try:
+        with open(local_path, "wb") as f:
+            for block in encoded:
+                f.write(block)
+        storage.put_file(store_path + TEXT_SUFFIX, local_path)
+        
+        with open(local_path, "wb") as f:
+            np.save(f, pages)
+        storage.put_file(store_path + PAGES_SUFFIX, local_path)
+        
+        if any("boxes" in c for c in chunks):
+            box_counts = [len(c.get("boxes", [])) for c in chunks]
+            box_offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+            np.cumsum(box_counts, out=box_offsets[1:])
+            boxes = np.array(
+                [box for c in chunks for box in c.get("boxes", [])],
+                dtype=np.float32
+            ).reshape(-1, 5)
+            
+            with open(local_path, "wb") as f:
+                np.save(f, boxes)
+            storage.put_file(store_path + BOXES_SUFFIX, local_path)
+            
+            with open(local_path, "wb") as f:
+                np.save(f, box_offsets)
+            storage.put_file(store_path + BOX_OFFSETS_SUFFIX, local_path)
+        
+        # Offsets go last: readers key their cache on this file
+        with open(local_path, "wb") as f:
+            np.save(f, offsets)
+        storage.put_file(store_path + OFFSETS_SUFFIX, local_path)
+    finally:
+        os.remove(local_path)
+    
+    return store_path
+
+
+@traced("chunks.load")
+def load_chunk_store(store_path: str) -> ChunkStore:
+    """
+    Open a chunk store, memory-mapped and cached per worker
+    
+    Args:
+        store_path: Storage key prefix of the store files
+    
+    Returns:
+        ChunkStore supporting len() and indexing
+    """
+    # Storage is only asked (HEAD requests on S3) once the entry is due for revalidation
+    cached = _store_cache.get(store_path)
+    if cached and time.monotonic() - cached[2] < config.CHUNK_STORE_REVALIDATE_S:
+        _store_cache.move_to_end(store_path)
+        return cached[1]
+    
+    offsets_path = get_local_path(store_path + OFFSETS_SUFFIX)
+    stat = os.stat(offsets_path)
+    version = (stat.st_size, stat.st_mtime_ns)
+    
+    if cached and cached[0] == version:
+        _store_cache[store_path] = (version, cached[1], time.monotonic())
+        _store_cache.move_to_end(store_path)
+        return cached[1]
+    
+    # Stores written without layout information have no boxes
+    has_boxes = get_storage().exists(store_path + BOXES_SUFFIX)
+    store = ChunkStore(
+        offsets_path,
+        get_local_path(store_path + PAGES_SUFFIX),
+        get_local_path(store_path + TEXT_SUFFIX),
+        get_local_path(store_path + BOX_OFFSETS_SUFFIX) if has_boxes else None,
+        get_local_path(store_path + BOXES_SUFFIX) if has_boxes else None
+    )
+    _store_cache[store_path] = (version, store, time.monotonic())
+    _store_cache.move_to_end(store_path)
+    while len(_store_cache) > config.CHUNK_STORE_CACHE_SIZE:
+        _store_cache.popitem(last=False)
+    
+    return store
+
+
+def delete_chunk_store(store_path: str) -> None:
+    """Unmap and delete a chunk store"""
+    _store_cache.pop(store_path, None)
+    
+    for suffix in (OFFSETS_SUFFIX, PAGES_SUFFIX, TEXT_SUFFIX, BOX_OFFSETS_SUFFIX, BOXES_SUFFIX):
+        try:
+            get_storage().delete(store_path + suffix)
+        except Exception as e:
+            print(f"Error deleting chunk store: {e}")
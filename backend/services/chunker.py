@@ -0,0 +1,176 @@
+"""
+Layout-aware chunker built on PyMuPDF text blocks
+
+Chunks follow the document's structure: a heading always starts a new
+chunk (sections are never mixed), paragraphs are kept whole where they fit,
+and size and overlap are measured in tokens. Chunking is a single linear
+pass over the blocks.
+"""
+import re
+from collections import Counter
+from typing import Dict, Iterator, List, Tuple
+import config
+from services.layout import TextBlock
+from utils.text import count_tokens
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[])")
+
+
+def body_font_size(blocks: List[TextBlock]) -> float:
+    """Most common font size, weighted by amount of text"""
+    sizes = Counter()
+    for block in blocks:
+        sizes[round(block.size, 1)] += len(block.text)
+    
+    return sizes.most_common(1)[0][0] if sizes else 0.0
+
+
+def is_heading(block: TextBlock, body_size: float) -> bool:
+    """Short, larger or bold blocks that do not read like sentences"""
+    if block.lines > 2 or len(block.text) > config.HEADING_MAX_CHARS:
+        return False
+    
+    if block.text.endswith((".", ",", ";")) or not any(c.isalpha() for c in block.text):
+        return False
+    
+    return block.size >= body_size * config.HEADING_SIZE_RATIO or (
+        block.bold and block.size >= body_size * 0.95
+    )
+
+
+def split_units(text: str, max_tokens: int) -> Iterator[Tuple[str, int, int, int]]:
+    """
+    Split a paragraph into sentences that fit the token budget
+    
+    Yields:
+        Tuples of (text, token_count, start, end) with offsets into text
+    """
+    position = 0
+    boundaries = [m.span() for m in SENTENCE_BOUNDARY.finditer(text)] + [(len(text), len(text))]
+    
+    for boundary_start, boundary_end in boundaries:
+        sentence = text[position:boundary_start]
+        sentence_start = position
+        position = boundary_end
+        
+        tokens = count_tokens(sentence)
+        if tokens <= max_tokens:
+            yield sentence, tokens, sentence_start, boundary_start
+            continue
+        
+        # Very long sentences (tables, lists without punctuation) split on words
+        window_start = None
+        window_end = 0
+        window_tokens = 0
+        for word in re.finditer(r"\S+", sentence):
+            word_tokens = count_tokens(word.group())
+            if window_start is not None and window_tokens + word_tokens > max_tokens:
+                yield (sentence[window_start:window_end], window_tokens,
+                       sentence_start + window_start, sentence_start + window_end)
+                window_start, window_tokens = None, 0
+            if window_start is None:
+                window_start = word.start()
+            window_end = word.end()
+            window_tokens += word_tokens
+        
+        if window_start is not None:
+            yield (sentence[window_start:window_end], window_tokens,
+                   sentence_start + window_start, sentence_start + window_end)
+
+
+def line_boxes_between(block: TextBlock, start: int, end: int) -> List[List[float]]:
+    """Boxes ([page, x0, y0, x1, y1]) of the block's lines overlapping text[start:end]"""
+    boxes = []
+    for i, (line_start, bbox) in enumerate(block.line_boxes):
+        line_end = block.line_boxes[i + 1][0] if i + 1 < len(block.line_boxes) else len(block.text)
+        if line_start < end and line_end > start:
+            boxes.append([block.page, *bbox])
+    return boxes
+
+
+def chunk_blocks(
+    blocks: List[TextBlock],
+    max_tokens: int = None,
+    overlap_tokens: int = None
+) -> List[Dict[str, any]]:
+    """
+    Group blocks into section-aligned chunks
+    
+    Args:
+        blocks: Text blocks in reading order
+        max_tokens: Chunk size limit (defaults to CHUNK_MAX_TOKENS)
+        overlap_tokens: Sentences carried over between chunks of a section
+    
+    Returns:
+        List of chunks with text, page number and line boxes for highlighting
+    """
+    max_tokens = max_tokens or config.CHUNK_MAX_TOKENS
+    overlap_tokens = config.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    body_size = body_font_size(blocks)
+    
+    chunks = []
+    # Sentences of the chunk being built: (text, tokens, page, boxes)
+    current: List[Tuple[str, int, int, List[List[float]]]] = []
+    current_tokens = 0
+    carried = 0  # Leading sentences carried over from the previous chunk
+    has_body = False
+
+    def flush(carry: bool) -> None:
+        nonlocal current, current_tokens, carried, has_body
+        if has_body:
+            # Sentences sharing a line contribute its box once
+            boxes = list({tuple(box): box for unit in current for box in unit[3]}.values())
+            chunks.append({
+                "text": " ".join(unit[0] for unit in current),
+                "page": current[0][2],
+                "boxes": boxes
+            })
+        
+        # Start the next chunk with the tail sentences of this one
+        tail = []
+        tail_tokens = 0
+        if carry and has_body:
+            for unit in reversed(current):
+                if tail_tokens + unit[1] > overlap_tokens:
+                    break
+                tail.insert(0, unit)
+                tail_tokens += unit[1]
+        
+        current, current_tokens, carried, has_body = tail, tail_tokens, len(tail), False
+
+    def drop_carried() -> None:
+        nonlocal current_tokens, carried
+        current_tokens -= current.pop(0)[1]
+        carried -= 1
+    
+    for block in blocks:
+        if is_heading(block, body_size):
+            # A section starts here: no overlap across it, consecutive headings stay together
+            if has_body:
+                flush(carry=False)
+            while carried:
+                drop_carried()
+            current.append((
+                block.text,
+                count_tokens(block.text),
+                block.page,
+                line_boxes_between(block, 0, len(block.text))
+            ))
+            current_tokens += current[-1][1]
+            continue
+        
+        for text, tokens, start, end in split_units(block.text, max_tokens):
+            if has_body and current_tokens + tokens > max_tokens:
+                flush(carry=True)
+            
+            # Overlap never pushes a chunk over the limit
+            while carried and current_tokens + tokens > max_tokens:
+                drop_carried()
+            
+            current.append((text, tokens, block.page, line_boxes_between(block, start, end)))
+            current_tokens += tokens
+            has_body = True
+    
+    flush(carry=False)
+    return chunks
+
@@ -0,0 +1,129 @@
+"""
+Context packing for chat prompts: merge, deduplicate and budget retrieved chunks
+"""
+from typing import List, Dict, Optional
+import config
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate token count of text
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Approximate number of tokens
+    """
+    return (len(text) + config.CHARS_PER_TOKEN - 1) // config.CHARS_PER_TOKEN
+
+
+def find_overlap(left: str, right: str) -> int:
+    """
+    Find the length of the longest suffix of left that is a prefix of right
+
+    Args:
+        left: Earlier chunk text
+        right: Following chunk text
+
+    Returns:
+        Number of overlapping characters (0 if below MIN_OVERLAP_CHARS)
+    """
+    max_overlap = max(config.CHUNK_OVERLAP, config.CHUNK_OVERLAP_TOKENS * config.CHARS_PER_TOKEN)
+    max_len = min(len(left), len(right), max_overlap * 2)
+
+    for size in range(max_len, config.MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+
+    return 0
+
+
+def merge_chunks(chunks: List[Dict]) -> List[Dict]:
+    """
+    Merge adjacent or overlapping chunks from the same page
+
+    Args:
+        chunks: Retrieved chunks with text, page, relevance_score and chunk_index
+
+    Returns:
+        Merged chunk groups with overlap text removed
+    """
+    ordered = sorted(
+        chunks,
+        key=lambda c: (c["page"], c.get("chunk_index") or 0)
+    )
+
+    merged = []
+    for chunk in ordered:
+        previous = merged[-1] if merged else None
+        index = chunk.get("chunk_index")
+
+        adjacent = (
+            previous is not None
+            and index is not None
+            and previous["last_index"] is not None
+            and previous["page"] == chunk["page"]
+            and index - previous["last_index"] <= 1
+        )
+
+        if adjacent:
+            if index != previous["last_index"]:
+                overlap = find_overlap(previous["text"], chunk["text"])
+                separator = "" if overlap else " "
+                previous["text"] += separator + chunk["text"][overlap:]
+            previous["last_index"] = index
+            previous["relevance_score"] = max(
+                previous["relevance_score"], chunk["relevance_score"]
+            )
+            continue
+
+        merged.append({
+            "text": chunk["text"],
+            "page": chunk["page"],
+            "relevance_score": chunk["relevance_score"],
+            "first_index": index,
+            "last_index": index,
+        })
+
+    return merged
+
+
+def pack_context(
+    chunks: List[Dict],
+    token_budget: Optional[int] = None
+) -> List[Dict]:
+    """
+    Select merged chunks by relevance until the token budget is filled
+
+    Args:
+        chunks: Retrieved chunks from vector search
+        token_budget: Maximum context tokens (defaults to CONTEXT_TOKEN_BUDGET)
+
+    Returns:
+        Packed chunks in document order, each with page and text
+    """
+    budget = token_budget or config.CONTEXT_TOKEN_BUDGET
+    groups = merge_chunks(chunks)
+    groups.sort(key=lambda g: g["relevance_score"], reverse=True)
+
+    packed = []
+    used = 0
+    for group in groups:
+        remaining = budget - used
+        if remaining <= 0:
+            break
+
+        tokens = estimate_tokens(group["text"])
+        if tokens > remaining:
+            # Only trim the most relevant group; skip others that don't fit
+            if packed:
+                continue
+            group["text"] = group["text"][:remaining * config.CHARS_PER_TOKEN]
+            tokens = remaining
+
+        packed.append(group)
+        used += tokens
+
+    packed.sort(key=lambda g: (g["page"], g["first_index"] or 0))
+    return packed
@@ -0,0 +1,233 @@
+"""
+Content-addressed document store shared by projects
+
+A document holds everything derived from one PDF: extracted text, chunks
+(in a memory-mapped chunk store) and the FAISS index (which carries the
+embeddings). It is keyed by the PDF's
+SHA-256 plus the chunking and embedding settings, so uploading a known PDF
+to another project reuses it instead of processing it again. Documents are
+reference counted by project and deleted with their last reference.
+"""
+import asyncio
+import hashlib
+import json
+import weakref
+from typing import Dict, List, Optional, Sequence, Tuple
+import config
+from db import mongodb, file_manager
+from db.storage import get_storage
+from services import chunk_store, page_store, pdf_service, vector_service
+from utils.tracing import span
+
+# Per-document locks serializing ingestion and release within this process
+_document_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def get_document_lock(document_id: str) -> asyncio.Lock:
+    """Get the lock guarding a document's creation and deletion"""
+    lock = _document_locks.get(document_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _document_locks[document_id] = lock
+    return lock
+
+
+def processing_settings() -> Dict:
+    """Settings that change a document's chunks or embeddings"""
+    if config.CHUNKER == "layout":
+        chunking = {
+            "chunker": "layout",
+            "max_tokens": config.CHUNK_MAX_TOKENS,
+            "overlap_tokens": config.CHUNK_OVERLAP_TOKENS,
+            "heading_size_ratio": config.HEADING_SIZE_RATIO,
+            "heading_max_chars": config.HEADING_MAX_CHARS
+        }
+    else:
+        chunking = {
+            "chunker": "recursive",
+            "chunk_size": config.CHUNK_SIZE,
+            "chunk_overlap": config.CHUNK_OVERLAP,
+            "separators": config.TEXT_SEPARATORS
+        }
+    
+    return {**chunking, "embedding_model": config.EMBEDDING_MODEL}
+
+
+def build_document_id(pdf_sha256: str) -> str:
+    """
+    Build the content-addressed ID of a document
+    
+    Args:
+        pdf_sha256: SHA-256 of the PDF bytes
+    
+    Returns:
+        Document ID unique to the PDF and the current processing settings
+    """
+    settings = json.dumps(processing_settings(), sort_keys=True)
+    fingerprint = hashlib.sha256(settings.encode()).hexdigest()[:16]
+    return f"doc_{pdf_sha256}_{fingerprint}"
+
+
+async def store_pdf_blob(staging_path: str, pdf_sha256: str) -> str:
+    """Move an upload to its content-addressed key, dropping it if already stored"""
+    storage = get_storage()
+    blob_path = file_manager.get_pdf_blob_path(pdf_sha256)
+    
+    if await asyncio.to_thread(storage.exists, blob_path):
+        await asyncio.to_thread(storage.delete, staging_path)
+    else:
+        await asyncio.to_thread(storage.move, staging_path, blob_path)
+    
+    return blob_path
+
+
+async def process_document(document_id: str, staging_path: str, pdf_sha256: str, pdf_size: int) -> None:
+    """Extract, chunk, embed and index a new PDF and store it as a document"""
+    pdf_path = await store_pdf_blob(staging_path, pdf_sha256)
+    
+    # Process PDF (the page store lets other chunk settings skip parsing it)
+    page_store_path = file_manager.get_page_store_path(pdf_sha256)
+    with span("document.process_pdf"):
+        full_text, chunks, total_pages = await pdf_service.process_pdf(pdf_path, page_store_path)
+    
+    with span("document.index", chunks=len(chunks)):
+        # Build FAISS index
+        index, embeddings = vector_service.build_faiss_index(chunks)
+        
+        # Save FAISS index
+        index_path = vector_service.save_faiss_index(
+            index,
+            file_manager.get_document_index_path(document_id)
+        )
+        
+        # Save chunks next to it
+        store_path = chunk_store.save_chunk_store(
+            chunks,
+            file_manager.get_document_chunk_store_path(document_id)
+        )
+    
+    await mongodb.insert_document({
+        "document_id": document_id,
+        "pdf_sha256": pdf_sha256,
+        "pdf_size": pdf_size,
+        "pdf_path": pdf_path,
+        "page_store_path": page_store_path,
+        "processing": processing_settings(),
+        "pdf_text": full_text,
+        "chunk_store_path": store_path,
+        "faiss_index_path": index_path,
+        "total_pages": total_pages,
+        "total_chunks": len(chunks),
+        "word_count": len(full_text.split())
+    })
+
+
+async def ingest_pdf(
+    staging_path: str,
+    pdf_sha256: str,
+    pdf_size: int,
+    project_id: str
+) -> Tuple[dict, bool]:
+    """
+    Get or create the document for an uploaded PDF and reference it from a project
+    
+    Args:
+        staging_path: Storage key the upload was streamed to
+        pdf_sha256: SHA-256 of the upload
+        pdf_size: Upload size in bytes
+        project_id: Project taking a reference
+    
+    Returns:
+        Tuple of (document, reused) where reused means no processing was needed
+    """
+    document_id = build_document_id(pdf_sha256)
+    
+    # Concurrent uploads of the same new PDF wait here and then reuse it
+    async with get_document_lock(document_id):
+        try:
+            reused = await mongodb.get_document(document_id, ["document_id"]) is not None
+            if reused:
+                # Another worker may have released the document since: re-ingest it then
+                document = await mongodb.add_document_reference(document_id, project_id)
+                reused = document is not None
+            
+            if not reused:
+                await process_document(document_id, staging_path, pdf_sha256, pdf_size)
+                document = await mongodb.add_document_reference(document_id, project_id)
+        finally:
+            # Already moved to its blob key unless reused or processing failed early
+            file_manager.delete_pdf_file(staging_path)
+    
+    if document is None:
+        raise Exception(f"Document {document_id} was deleted while being ingested")
+    
+    if reused:
+        print(f"Reusing document {document_id} for project {project_id}")
+    
+    return document, reused
+
+
+async def release_document(document_id: str, project_id: str) -> None:
+    """
+    Drop a project's reference to a document, deleting it when unreferenced
+    
+    Args:
+        document_id: Document ID
+        project_id: Project releasing its reference
+    """
+    async with get_document_lock(document_id):
+        document = await mongodb.remove_document_reference(document_id, project_id)
+        
+        if not document:
+            return
+        
+        vector_service.evict_faiss_index(document["faiss_index_path"])
+        file_manager.delete_faiss_index(document["faiss_index_path"])
+        chunk_store.delete_chunk_store(document["chunk_store_path"])
+        file_manager.remove_empty_dir(file_manager.get_document_dir(document_id))
+        
+        # The PDF bytes may still back a document with other processing settings
+        if not await mongodb.count_documents_by_sha256(document["pdf_sha256"]):
+            file_manager.delete_pdf_file(document["pdf_path"])
+            if document.get("page_store_path"):
+                page_store.delete_page_store(document["page_store_path"])
+                file_manager.remove_empty_dir(document["page_store_path"])
+        
+        print(f"Deleted unreferenced document {document_id}")
+
+
+async def get_project_document(project: dict, fields: Optional[List[str]] = None) -> Optional[dict]:
+    """
+    Get the processed document (text, chunks, index) of a project
+    
+    Args:
+        project: Project record
+        fields: Optional document fields to fetch (e.g. to skip the full text)
+    
+    Returns:
+        The shared document, the project itself for projects processed before
+        the document store, or None if no PDF was processed
+    """
+    if project.get("document_id"):
+        return await mongodb.get_document(project["document_id"], fields)
+    
+    if project.get("faiss_index_path"):
+        return project
+    
+    return None
+
+
+def load_document_chunks(document: dict) -> Sequence[Dict]:
+    """
+    Get a document's chunks as an indexable sequence
+    
+    Args:
+        document: Document (or legacy project) record
+    
+    Returns:
+        Memory-mapped ChunkStore, or the inline chunk list of legacy records
+    """
+    if document.get("chunk_store_path"):
+        return chunk_store.load_chunk_store(document["chunk_store_path"])
+    
+    return document["chunks"]
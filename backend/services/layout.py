@@ -0,0 +1,164 @@
+"""
+PyMuPDF page extraction: text blocks, words and page records
+
+Kept free of application config and services so OCR worker processes can
+import it without loading the embedding model.
+"""
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+import fitz  # PyMuPDF
+
+BOLD_FLAG = 16
+
+
+@dataclass
+class TextBlock:
+    """A paragraph-like block of text on a page"""
+    text: str
+    page: int
+    size: float
+    bold: bool
+    lines: int
+    bbox: List[float] = field(default_factory=list)
+    # (offset in text, [x0, y0, x1, y1]) of each line, for highlighting
+    line_boxes: List[Tuple[int, List[float]]] = field(default_factory=list)
+
+
+def join_lines(lines: List[str]) -> Tuple[str, List[int]]:
+    """
+    Join wrapped lines of a block into one paragraph
+    
+    Returns:
+        Tuple of (text, offset of each line in text; -1 for empty lines)
+    """
+    text = ""
+    starts = []
+    for line in lines:
+        if not line:
+            starts.append(-1)
+            continue
+        if text and not text.endswith("-"):
+            text += " "
+        starts.append(len(text))
+        text += line
+    return text, starts
+
+
+def extract_page_blocks(
+    page: fitz.Page,
+    page_num: int,
+    textpage: Optional[fitz.TextPage] = None
+) -> List[TextBlock]:
+    """
+    Extract text blocks of a page with their font information
+    
+    Args:
+        page: PyMuPDF page
+        page_num: 1-based page number
+        textpage: Optional already parsed text page to reuse
+    
+    Returns:
+        Non-empty text blocks in reading order
+    """
+    blocks = []
+    for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT, textpage=textpage)["blocks"]:
+        lines = block.get("lines")
+        if not lines:
+            continue
+        
+        texts = []
+        size = 0.0
+        bold = True
+        for line in lines:
+            texts.append("".join(span["text"] for span in line["spans"]).strip())
+            for span in line["spans"]:
+                if span["text"].strip():
+                    size = max(size, span["size"])
+                    bold = bold and bool(span["flags"] & BOLD_FLAG)
+        
+        text, starts = join_lines(texts)
+        if text:
+            line_boxes = [
+                (start, [round(v, 2) for v in line["bbox"]])
+                for start, line in zip(starts, lines) if start >= 0
+            ]
+            blocks.append(TextBlock(
+                text,
+                page_num,
+                size,
+                bold,
+                len(lines),
+                [round(v, 2) for v in block["bbox"]],
+                line_boxes
+            ))
+    
+    return blocks
+
+
+def extract_page(page: fitz.Page, page_num: int, textpage: Optional[fitz.TextPage] = None) -> Dict:
+    """
+    Extract text, blocks and words of a page from a single parse
+    
+    Args:
+        page: PyMuPDF page
+        page_num: 1-based page number
+        textpage: Optional text page to use instead of the PDF's text (e.g. from OCR)
+    
+    Returns:
+        Page record
+    """
+    textpage = textpage or page.get_textpage(flags=fitz.TEXTFLAGS_TEXT)
+    blocks = extract_page_blocks(page, page_num, textpage=textpage)
+    words = [
+        [round(w[0], 2), round(w[1], 2), round(w[2], 2), round(w[3], 2), w[4], w[5], w[6], w[7]]
+        for w in page.get_text("words", textpage=textpage)
+    ]
+    
+    return {
+        "page": page_num,
+        "width": round(page.rect.width, 2),
+        "height": round(page.rect.height, 2),
+        "text": page.get_text("text", textpage=textpage),
+        "blocks": [asdict(block) for block in blocks],
+        # [x0, y0, x1, y1, word, block_no, line_no, word_no]
+        "words": words
+    }
+
+
+def init_ocr_worker() -> None:
+    """Keep Tesseract single-threaded: the pool already runs one page per core"""
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+def ocr_page(pdf_path: str, page_num: int, language: str, dpi: int, tessdata: str) -> Tuple[Dict, float]:
+    """
+    OCR a page with Tesseract (runs in an OCR worker process)
+    
+    Args:
+        pdf_path: Local path of the PDF
+        page_num: 1-based page number
+        language: Tesseract language(s), e.g. "eng" or "eng+deu"
+        dpi: Rendering resolution
+        tessdata: Tesseract language data folder
+    
+    Returns:
+        Tuple of (page record, seconds spent)
+    """
+    started = time.perf_counter()
+    doc = fitz.open(pdf_path)
+    try:
+        page = doc[page_num - 1]
+        textpage = page.get_textpage_ocr(
+            flags=fitz.TEXTFLAGS_TEXT,
+            language=language,
+            dpi=dpi,
+            full=True,
+            tessdata=tessdata
+        )
+        record = extract_page(page, page_num, textpage=textpage)
+    finally:
+        doc.close()
+    
+    return record, time.perf_counter() - started
@@ -0,0 +1,250 @@
+"""
+Gemini gateway with rate limiting, bounded concurrency, retries and request coalescing
+"""
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import Any, Dict, Optional
+from google.api_core import exceptions as google_exceptions
+import config
+from utils.singleflight import SingleFlight
+from utils.tracing import span
+from utils.metrics import (
+    LLM_REQUEST_SECONDS,
+    LLM_ATTEMPT_SECONDS,
+    LLM_TOKENS,
+    LLM_RETRIES,
+    LLM_COALESCED,
+    LLM_RATE_LIMIT_WAIT_SECONDS,
+    LLM_INFLIGHT,
+)
+
+# Errors worth retrying: rate limiting (429) and transient server failures (5xx)
+RATE_LIMIT_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+TRANSIENT_ERRORS = (
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    asyncio.TimeoutError,
+)
+
+
+class GatewayError(Exception):
+    """Raised when a Gemini request fails after its retries (the last error is its __cause__)"""
+
+
+class TokenBucket:
+    """
+    Async token bucket rate limiter
+    
+    Tokens refill continuously at `rate` per second up to `capacity`.
+    A cooldown can be imposed when the upstream reports rate limiting.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def cooldown(self, seconds: float) -> None:
+        """Block new acquisitions for a while and drain the bucket"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+# Gateway state (singleton pattern, shared by all requests of this worker)
+_bucket = TokenBucket(
+    rate=config.LLM_REQUESTS_PER_MINUTE / 60.0,
+    capacity=config.LLM_BURST
+)
+_semaphore = asyncio.Semaphore(config.LLM_MAX_CONCURRENCY)
+_inflight = SingleFlight()
+
+
+def _request_key(prompt: str, generation_config: Optional[Dict[str, Any]]) -> str:
+    """Build a coalescing key from the prompt and generation settings"""
+    payload = json.dumps(
+        {"prompt": prompt, "generation_config": generation_config},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    ceiling = min(
+        config.LLM_RETRY_MAX_DELAY_S,
+        config.LLM_RETRY_BASE_DELAY_S * (2 ** attempt)
+    )
+    return random.uniform(0, ceiling)
+
+
+def _record_usage(response: Any, operation: str) -> None:
+    """Export prompt/completion token counts if Gemini reported them"""
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return
+    
+    LLM_TOKENS.labels(operation, "prompt").observe(usage.prompt_token_count or 0)
+    LLM_TOKENS.labels(operation, "completion").observe(usage.candidates_token_count or 0)
+
+
+async def _attempt(
+    prompt: str,
+    generation_config: Optional[Dict[str, Any]],
+    operation: str,
+    timeout: float
+) -> Any:
+    """Run a single Gemini call once a rate-limit token and slot are available"""
+    wait_started = time.perf_counter()
+    await _bucket.acquire()
+    
+    async with _semaphore:
+        LLM_RATE_LIMIT_WAIT_SECONDS.labels(operation).observe(
+            time.perf_counter() - wait_started
+        )
+        LLM_INFLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(
+                config.gemini_model.generate_content_async(
+                    prompt,
+                    generation_config=generation_config
+                ),
+                timeout=timeout
+            )
+        finally:
+            LLM_INFLIGHT.dec()
+            LLM_ATTEMPT_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+
+async def _generate_with_retries(
+    prompt: str,
+    generation_config: Optional[Dict[str, Any]],
+    operation: str,
+    deadline_s: float
+) -> Any:
+    """Call Gemini, retrying transient failures until the deadline"""
+    deadline = time.monotonic() + deadline_s
+    started = time.perf_counter()
+    attempt = 0
+    
+    while True:
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            
+            response = await _attempt(
+                prompt,
+                generation_config,
+                operation,
+                timeout=min(config.LLM_ATTEMPT_TIMEOUT_S, remaining)
+            )
+            
+            LLM_REQUEST_SECONDS.labels(operation, "success").observe(
+                time.perf_counter() - started
+            )
+            _record_usage(response, operation)
+            return response
+        
+        except (RATE_LIMIT_ERRORS + TRANSIENT_ERRORS) as e:
+            rate_limited = isinstance(e, RATE_LIMIT_ERRORS)
+            if rate_limited:
+                _bucket.cooldown(config.LLM_RATE_LIMIT_COOLDOWN_S)
+            
+            delay = _backoff_delay(attempt)
+            remaining = deadline - time.monotonic()
+            
+            # Give up when out of attempts or when the retry cannot finish in time
+            if attempt >= config.LLM_MAX_RETRIES or delay >= remaining:
+                LLM_REQUEST_SECONDS.labels(operation, "error").observe(
+                    time.perf_counter() - started
+                )
+                raise GatewayError(
+                    f"Gemini request failed after {attempt + 1} attempts: {e or type(e).__name__}"
+                ) from e
+            
+            reason = "rate_limited" if rate_limited else type(e).__name__
+            LLM_RETRIES.labels(operation, reason).inc()
+            print(f"Gemini {operation} attempt {attempt + 1} failed ({reason}), retrying in {delay:.1f}s")
+            
+            await asyncio.sleep(delay)
+            attempt += 1
+        
+        except Exception:
+            LLM_REQUEST_SECONDS.labels(operation, "error").observe(
+                time.perf_counter() - started
+            )
+            raise
+
+
+async def generate(
+    prompt: str,
+    operation: str = "generate",
+    generation_config: Optional[Dict[str, Any]] = None,
+    deadline_s: Optional[float] = None,
+    coalesce: bool = True
+) -> Any:
+    """
+    Generate content with Gemini through the gateway
+    
+    Args:
+        prompt: Prompt text
+        operation: Label used for metrics (e.g. "chat", "podcast_script")
+        generation_config: Optional Gemini generation config
+        deadline_s: Overall deadline including retries (defaults to LLM_DEADLINE_S)
+        coalesce: Share the response with identical in-flight requests
+    
+    Returns:
+        Gemini response object
+    
+    Raises:
+        GatewayError: If retryable failures (rate limiting, server errors,
+            timeouts) outlast the retries or the deadline; other errors
+            (e.g. safety blocks, invalid requests) are raised as they are
+    """
+    deadline_s = deadline_s or config.LLM_DEADLINE_S
+
+    async def run():
+        with span(f"gemini.{operation}"):
+            return await _generate_with_retries(prompt, generation_config, operation, deadline_s)
+    
+    if not coalesce:
+        return await run()
+    
+    response, shared = await _inflight.do(_request_key(prompt, generation_config), run)
+    if shared:
+        LLM_COALESCED.labels(operation).inc()
+    
+    return response
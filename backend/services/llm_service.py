@@ -1,32 +1,100 @@
 """
 LLM service using Google Gemini for chat and podcast script generation
 """
-from typing import List, Dict, Optional
+import json
+from typing import List, Dict, Optional, Tuple, Union
+from pydantic import ValidationError
 import config
+from models import ChapterScript, PodcastScript, ScriptChapter, ScriptTurn
+from services import llm_gateway
+from services.context_service import pack_context
+from utils.metrics import LLM_RETRIES, LLM_STRUCTURED_OUTPUTS, PODCAST_SCRIPT_LINES
+from utils.text import script_line, speaker_key, truncate_text
 
 
-async def chat_with_context(query: str, context_chunks: List[Dict]) -> str:
+class ScriptValidationError(llm_gateway.GatewayError):
+    """Raised when a structured script is still invalid after its repairs (the ValidationError is its __cause__)"""
+
+
+def format_history(history: List[Dict]) -> str:
+    """
+    Format chat history turns for a prompt
+    
+    Args:
+        history: Previous turns with query and answer
+        
+    Returns:
+        History as alternating User/Assistant lines
+    """
+    return "\n".join([
+        f"User: {turn['query']}\nAssistant: {turn['answer']}"
+        for turn in history
+    ])
+
+
+async def condense_query(query: str, history: List[Dict]) -> str:
+    """
+    Rewrite a follow-up question into a standalone search query
+    
+    Args:
+        query: User's follow-up question
+        history: Previous turns of the chat session
+        
+    Returns:
+        Standalone query suitable for retrieval
+    """
+    if not history:
+        return query
+    
+    prompt = f"""Rewrite the follow-up question as a single standalone question that can be understood without the conversation. Resolve pronouns and references like "it", "that" or "the second one" using the conversation. Return only the rewritten question.
+
+CONVERSATION:
+{format_history(history)}
+
+FOLLOW-UP QUESTION: {query}
+
+STANDALONE QUESTION:"""
+
+    response = await llm_gateway.generate(prompt, operation="condense_query")
+    return response.text.strip() or query
+
+
+async def chat_with_context(
+    query: str,
+    context_chunks: List[Dict],
+    history: Optional[List[Dict]] = None
+) -> str:
     """
     Use Gemini to answer questions based on PDF context
     
     Args:
         query: User's question
         context_chunks: Relevant chunks from PDF with page numbers
+        history: Optional previous turns of the chat session
         
     Returns:
         AI-generated answer
     """
+    # Merge overlapping chunks and fit them into the token budget
+    packed_chunks = pack_context(context_chunks)
+    
     # Build context from chunks
     context = "\n\n".join([
         f"[Page {c['page']}]: {c['text']}" 
-        for c in context_chunks
+        for c in packed_chunks
     ])
     
+    # Previous turns help resolve follow-up questions
+    history_section = (
+        f"\nCONVERSATION SO FAR:\n{format_history(history)}\n"
+        if history else ""
+    )
+    
     prompt = f"""You are a helpful assistant analyzing a PDF document. Answer the user's question based on the provided context.
 
 CONTEXT FROM PDF:
 {context}
-
+{history_section}
 USER QUESTION: {query}
 
 Instructions:
@@ -37,15 +105,244 @@ Instructions:
 
 ANSWER:"""
 
-    response = config.gemini_model.generate_content(prompt)
+    response = await llm_gateway.generate(prompt, operation="chat")
     return response.text
 
 
+def sample_document(pdf_text: str) -> tuple[str, str]:
+    """
+    Fit document text into the LLM context
+    
+    Args:
+        pdf_text: Full text from PDF
+        
+    Returns:
+        Tuple of (text_sample, coverage_note)
+    """
+    if len(pdf_text) <= config.MAX_CONTEXT_CHARS:
+        return pdf_text, "(Full document included)"
+    
+    # Keep the beginning, middle and end of long documents
+    chunk_size = config.MAX_CONTEXT_CHARS // 3
+    text_sample = (
+        pdf_text[:chunk_size] + 
+        "\n\n[... middle section ...]\n\n" +
+        pdf_text[len(pdf_text)//2 - chunk_size//2 : len(pdf_text)//2 + chunk_size//2] +
+        "\n\n[... later section ...]\n\n" +
+        pdf_text[-chunk_size:]
+    )
+    return text_sample, f"(Covering key sections from {len(pdf_text)} characters total)"
+
+
+def describe_speakers(speakers: List[Dict]) -> str:
+    """Host lines of a script prompt, one per speaker of the roster"""
+    return "\n".join(
+        f"- Host {i + 1} ({speaker['name']}): {speaker['role']}"
+        for i, speaker in enumerate(speakers)
+    )
+
+
+def describe_turns(speakers: List[Dict]) -> str:
+    """Prompt lines describing the turns of a structured script"""
+    return (
+        f"Every turn has the speaker (one of {', '.join(speaker['name'] for speaker in speakers)}), "
+        f"the words they say as text (no stage directions or markdown) and optionally "
+        f"the emotion of their voice ({', '.join(config.TTS_EMOTIONS)})."
+    )
+
+
+def script_schema(speakers: List[Dict], chaptered: bool = True) -> Dict:
+    """
+    Gemini response schema of a podcast script for a roster
+    
+    Args:
+        speakers: Roster of the podcast
+        chaptered: Whole script in chapters, or the turns of one chapter
+    
+    Returns:
+        Schema of a PodcastScript (chaptered) or ChapterScript
+    """
+    turns = {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "speaker": {"type": "string", "enum": [speaker["name"] for speaker in speakers]},
+                "text": {"type": "string"},
+                "emotion": {"type": "string", "enum": config.TTS_EMOTIONS, "nullable": True},
+            },
+            "required": ["speaker", "text"],
+        },
+    }
+    if not chaptered:
+        return {"type": "object", "properties": {"turns": turns}, "required": ["turns"]}
+    
+    chapter = {
+        "type": "object",
+        "properties": {"title": {"type": "string"}, "turns": turns},
+        "required": ["title", "turns"],
+    }
+    return {"type": "object", "properties": {"chapters": {"type": "array", "items": chapter}}, "required": ["chapters"]}
+
+
+def describe_errors(error: ValidationError) -> str:
+    """Validation errors as prompt lines: where, what is wrong and the value found"""
+    return "\n".join(
+        f"- {'.'.join(str(part) for part in e['loc']) or 'output'}: {e['msg']} "
+        f"(found {truncate_text(repr(e.get('input')), 80)})"
+        for e in error.errors(include_url=False)[:20]
+    )
+
+
+def script_turns(script: Union[PodcastScript, ChapterScript]) -> List[ScriptTurn]:
+    """All turns of a structured script, in order"""
+    if isinstance(script, ChapterScript):
+        return script.turns
+    return [turn for chapter in script.chapters for turn in chapter.turns]
+
+
+def salvage_script(text: str, chaptered: bool, context: Dict) -> Tuple[Optional[Union[PodcastScript, ChapterScript]], int]:
+    """
+    Keep the valid turns of structured output that still fails validation
+    
+    Args:
+        text: JSON output
+        chaptered: Whether the output is a whole script in chapters
+        context: Validation context with the roster's speaker names
+    
+    Returns:
+        Tuple of (script of the valid turns, or None if none are left; number of turns dropped)
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None, 0
+    
+    dropped = 0
+    
+    def valid_turns(turns) -> List[ScriptTurn]:
+        nonlocal dropped
+        kept = []
+        for turn in turns if isinstance(turns, list) else []:
+            try:
+                kept.append(ScriptTurn.model_validate(turn, context=context))
+            except ValidationError:
+                dropped += 1
+        return kept
+    
+    try:
+        if not chaptered:
+            return ChapterScript(turns=valid_turns(data.get("turns"))), dropped
+        
+        chapters = []
+        for i, chapter in enumerate(data.get("chapters") or []):
+            turns = valid_turns(chapter.get("turns"))
+            if turns:
+                chapters.append(ScriptChapter(title=str(chapter.get("title") or f"Part {i + 1}"), turns=turns))
+        return PodcastScript(chapters=chapters), dropped
+    
+    except (AttributeError, ValidationError):
+        # Not the expected objects, or no valid turn left
+        return None, dropped
+
+
+async def generate_script(
+    prompt: str,
+    speakers: List[Dict],
+    operation: str,
+    chaptered: bool = True
+) -> Union[PodcastScript, ChapterScript]:
+    """
+    Generate a script with Gemini's structured output and validate it
+    
+    Output that fails validation is sent back with its errors to be
+    repaired, without the document, so formatting never costs a new
+    script (up to LLM_SCRIPT_REPAIR_ATTEMPTS times). If it is still
+    invalid, its valid turns are kept.
+    
+    Args:
+        prompt: Prompt asking for the script
+        speakers: Roster of the podcast
+        operation: Operation name for metrics
+        chaptered: Whole script in chapters, or the turns of one chapter
+    
+    Returns:
+        The validated PodcastScript (chaptered) or ChapterScript
+    
+    Raises:
+        ScriptValidationError: If no valid turn is left after the repairs
+    """
+    model = PodcastScript if chaptered else ChapterScript
+    context = {"speakers": [speaker["name"] for speaker in speakers]}
+    generation_config = {
+        "response_mime_type": "application/json",
+        "response_schema": script_schema(speakers, chaptered),
+    }
+    
+    response = await llm_gateway.generate(prompt, operation=operation, generation_config=generation_config)
+    for attempt in range(config.LLM_SCRIPT_REPAIR_ATTEMPTS + 1):
+        try:
+            script = model.model_validate_json(response.text, context=context)
+            LLM_STRUCTURED_OUTPUTS.labels(operation, "repaired" if attempt else "valid").inc()
+            PODCAST_SCRIPT_LINES.labels(operation, "dialogue").inc(len(script_turns(script)))
+            return script
+        except ValidationError as e:
+            error = e
+        
+        if attempt == config.LLM_SCRIPT_REPAIR_ATTEMPTS:
+            break
+        
+        LLM_RETRIES.labels(operation, "invalid_output").inc()
+        repair_prompt = f"""The JSON below is a podcast script that failed validation. Fix ONLY the problems listed and keep everything else exactly as it is.
+
+SPEAKERS: {', '.join(context['speakers'])}
+
+PROBLEMS:
+{describe_errors(error)}
+
+JSON:
+{response.text}"""
+        response = await llm_gateway.generate(
+            repair_prompt,
+            operation=f"{operation}_repair",
+            generation_config=generation_config
+        )
+    
+    script, dropped = salvage_script(response.text, chaptered, context)
+    if script is None:
+        LLM_STRUCTURED_OUTPUTS.labels(operation, "failed").inc()
+        raise ScriptValidationError(
+            f"Invalid {operation} output after {config.LLM_SCRIPT_REPAIR_ATTEMPTS} repairs:\n{describe_errors(error)}"
+        ) from error
+    
+    LLM_STRUCTURED_OUTPUTS.labels(operation, "salvaged").inc()
+    PODCAST_SCRIPT_LINES.labels(operation, "dialogue").inc(len(script_turns(script)))
+    PODCAST_SCRIPT_LINES.labels(operation, "invalid").inc(dropped)
+    return script
+
+
+def turn_lines(turns: List[ScriptTurn]) -> str:
+    """Turns of a structured script as stored script lines (for display and storage)"""
+    return "\n".join(script_line(turn.speaker, turn.text, turn.emotion) for turn in turns)
+
+
+def turn_segments(turns: List[ScriptTurn]) -> List[Dict[str, str]]:
+    """Turns of a structured script as segments to synthesize (speaker key, text and emotion if any)"""
+    segments = []
+    for turn in turns:
+        segment = {"speaker": speaker_key(turn.speaker), "text": turn.text}
+        if turn.emotion:
+            segment["emotion"] = turn.emotion
+        segments.append(segment)
+    return segments
+
+
 async def generate_podcast_script(
     pdf_text: str,
     topic: Optional[str],
-    duration: str
-) -> str:
+    duration: str,
+    speakers: List[Dict]
+) -> List[Dict[str, str]]:
     """
     Generate conversational podcast script from PDF content
     
@@ -53,41 +350,34 @@ async def generate_podcast_script(
         pdf_text: Full text from PDF
         topic: Optional specific topic to focus on
         duration: Podcast duration (short/medium/long)
+        speakers: Roster of the podcast with name and role
         
     Returns:
-        Generated podcast script
+        Chapters of the script with title, script (dialogue lines) and
+        segments (the validated turns to synthesize)
+    
+    Raises:
+        ScriptValidationError: If the script is still invalid after its repairs
     """
     # Get duration description
     duration_desc = config.DURATION_MAP[duration]
     
     # Truncate text if too long
-    if len(pdf_text) > config.MAX_CONTEXT_CHARS:
-        chunk_size = config.MAX_CONTEXT_CHARS // 3
-        text_sample = (
-            pdf_text[:chunk_size] + 
-            "\n\n[... middle section ...]\n\n" +
-            pdf_text[len(pdf_text)//2 - chunk_size//2 : len(pdf_text)//2 + chunk_size//2] +
-            "\n\n[... later section ...]\n\n" +
-            pdf_text[-chunk_size:]
-        )
-        coverage_note = f"(Covering key sections from {len(pdf_text)} characters total)"
-    else:
-        text_sample = pdf_text
-        coverage_note = "(Full document included)"
+    text_sample, coverage_note = sample_document(pdf_text)
     
     # Build prompt
-    prompt = f"""Create an engaging podcast script between two hosts discussing this ENTIRE document {coverage_note}.
+    prompt = f"""Create an engaging podcast script between {len(speakers)} hosts discussing this ENTIRE document {coverage_note}.
 
 DOCUMENT:
 {text_sample}
 
 PODCAST REQUIREMENTS:
 - Duration: {duration_desc}
-- Host 1 (Alex): Curious, asks insightful questions, reacts naturally
-- Host 2 (Sam): Knowledgeable, explains concepts clearly, uses analogies
+{describe_speakers(speakers)}
 {f'- Special focus on: {topic}' if topic else ''}
 - COVER THE WHOLE DOCUMENT systematically from beginning to end
 - Discuss all major topics, sections, and key points
+- Divide the episode into {config.CHAPTER_MAP[duration]} chapters that follow the document's sections
 
 STYLE GUIDELINES:
 ✓ Natural conversation with interruptions ("Oh!", "Wait, that's interesting!", "So you're saying...")
@@ -97,13 +387,85 @@ STYLE GUIDELINES:
 ✓ Ask clarifying questions
 ✓ Summarize key insights
 
-FORMAT (STRICT):
-Alex: [dialogue]
-Sam: [dialogue]
-Alex: [dialogue]
-...
+OUTPUT:
+JSON in the response schema: the chapters in order, each with a short title and its turns of dialogue.
+{describe_turns(speakers)}
 
-Make it feel like two friends excitedly discussing fascinating ideas from the ENTIRE document!"""
+Make it feel like friends excitedly discussing fascinating ideas from the ENTIRE document!"""
 
-    response = config.gemini_model.generate_content(prompt)
-    return response.text
+    script = await generate_script(prompt, speakers, "podcast_script")
+    return [
+        {
+            "title": chapter.title.strip() or f"Part {i + 1}",
+            "script": turn_lines(chapter.turns),
+            "segments": turn_segments(chapter.turns)
+        }
+        for i, chapter in enumerate(script.chapters)
+    ]
+
+
+async def generate_chapter_script(
+    pdf_text: str,
+    chapters: List[Dict],
+    index: int,
+    speakers: List[Dict],
+    instructions: Optional[str] = None
+) -> Dict:
+    """
+    Rewrite one chapter of a podcast script
+    
+    Args:
+        pdf_text: Full text from PDF
+        chapters: All chapters of the podcast with title and script
+        index: Index of the chapter to rewrite
+        speakers: Roster of the podcast with name and role
+        instructions: Optional guidance for the new version
+        
+    Returns:
+        New dialogue of the chapter with script (lines of the roster's
+        speakers) and segments (the validated turns to synthesize)
+    
+    Raises:
+        ScriptValidationError: If the chapter is still invalid after its repairs
+    """
+    text_sample, coverage_note = sample_document(pdf_text)
+    chapter = chapters[index]
+    
+    # Neighbouring chapters keep the hand-over lines consistent
+    previous_section = (
+        f"END OF PREVIOUS CHAPTER ({chapters[index - 1]['title']}):\n"
+        + "\n".join(chapters[index - 1]["script"].split("\n")[-4:])
+        if index > 0 else "This is the first chapter: open the episode."
+    )
+    next_section = (
+        f"START OF NEXT CHAPTER ({chapters[index + 1]['title']}):\n"
+        + "\n".join(chapters[index + 1]["script"].split("\n")[:4])
+        if index + 1 < len(chapters) else "This is the last chapter: close the episode."
+    )
+    
+    prompt = f"""You are editing a podcast script between {len(speakers)} hosts discussing a document {coverage_note}. Rewrite ONE chapter so it still fits between its neighbours.
+
+DOCUMENT:
+{text_sample}
+
+EPISODE CHAPTERS:
+{chr(10).join(f"{i + 1}. {c['title']}" for i, c in enumerate(chapters))}
+
+{previous_section}
+
+CHAPTER TO REWRITE ({index + 1}. {chapter['title']}):
+{chapter['script']}
+
+{next_section}
+
+REQUIREMENTS:
+{describe_speakers(speakers)}
+- Keep roughly the same length and the chapter's subject
+{f'- {instructions}' if instructions else '- Make it clearer and more engaging'}
+
+OUTPUT:
+JSON in the response schema: the turns of dialogue of the new chapter, in order.
+{describe_turns(speakers)}"""
+
+    script = await generate_script(prompt, speakers, "chapter_script", chaptered=False)
+    return {"script": turn_lines(script.turns), "segments": turn_segments(script.turns)}
@@ -0,0 +1,249 @@
+"""
+Loudness normalization of podcast audio (ITU-R BS.1770 / EBU R128)
+
+Every segment is measured with K-weighted, gated integrated loudness and
+brought to LOUDNESS_TARGET_LUFS, so both voices sit at the same level; the
+programme as a whole is then measured and corrected. All gains are applied
+in one pass over the samples, followed by a true-peak limiter.
+"""
+import math
+from typing import Dict, List, Tuple
+import numpy as np
+from scipy.ndimage import minimum_filter1d, uniform_filter1d
+from scipy.signal import resample_poly, sosfilt
+import config
+
+BLOCK_S = 0.4            # Gating block length
+HOP_S = 0.1              # Gating block step (75% overlap)
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+OVERSAMPLING = 4         # True-peak measurement
+PEAK_BLOCK = 1024        # Samples per block checked for inter-sample peaks
+PEAK_MARGIN = 32         # Context samples around a block for the interpolation filter
+INTERSAMPLE_HEADROOM_DB = 3.0  # How far below the ceiling blocks are still oversampled
+ANTI_DENORMAL = 1e-10    # Inaudible Nyquist-rate signal that keeps the filter state out of denormals
+
+
+def k_weighting(sample_rate: int) -> np.ndarray:
+    """
+    Get the BS.1770 K-weighting filter (high shelf and high-pass) as second-order sections
+    
+    Args:
+        sample_rate: Sample rate in Hz
+    
+    Returns:
+        SOS array for scipy.signal.sosfilt
+    """
+    # Stage 1: head-related high shelf
+    k = math.tan(math.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [
+        (vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+        1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0
+    ]
+    
+    # Stage 2: RLB high-pass
+    k = math.tan(math.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    high_pass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    
+    return np.array([shelf, high_pass])
+
+
+def k_weighted_power(samples: np.ndarray, sos: np.ndarray) -> np.ndarray:
+    """Squared K-weighted signal of float32 samples"""
+    # In silence the IIR state decays into denormal floats, which are very slow
+    x = samples.copy()
+    x[::2] += ANTI_DENORMAL
+    x[1::2] -= ANTI_DENORMAL
+    
+    weighted = sosfilt(sos, x)
+    return weighted * weighted
+
+
+def block_powers(weighted_power: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Mean K-weighted power of overlapping 400 ms gating blocks"""
+    hop = int(sample_rate * HOP_S)
+    hops_per_block = round(BLOCK_S / HOP_S)
+    hops = len(weighted_power) // hop
+    if hops < hops_per_block:
+        # Shorter than one block: measure what there is
+        return np.array([weighted_power.mean()]) if len(weighted_power) else np.array([])
+    
+    hop_sums = weighted_power[:hops * hop].reshape(hops, hop).sum(axis=1, dtype=np.float64)
+    block_sums = np.convolve(hop_sums, np.ones(hops_per_block), mode="valid")
+    return block_sums / (hop * hops_per_block)
+
+
+def to_lufs(power):
+    """Loudness of a mean K-weighted power (mono)"""
+    with np.errstate(divide="ignore"):
+        return -0.691 + 10 * np.log10(power)
+
+
+def gated_loudness(powers: np.ndarray) -> float:
+    """
+    Integrated loudness from gating block powers
+    
+    Args:
+        powers: Block powers from block_powers
+    
+    Returns:
+        Loudness in LUFS, or -inf for silence
+    """
+    loudness = to_lufs(powers)
+    gated = powers[loudness > ABSOLUTE_GATE_LUFS]
+    if not len(gated):
+        return -math.inf
+    
+    relative_gate = float(to_lufs(gated.mean())) + RELATIVE_GATE_LU
+    gated = powers[(loudness > ABSOLUTE_GATE_LUFS) & (loudness > relative_gate)]
+    return float(to_lufs(gated.mean()))
+
+
+def integrated_loudness(samples: np.ndarray, sample_rate: int) -> float:
+    """Integrated loudness in LUFS of float samples in [-1, 1]"""
+    sos = k_weighting(sample_rate).astype(np.float32)
+    return gated_loudness(block_powers(k_weighted_power(samples.astype(np.float32), sos), sample_rate))
+
+
+def block_windows(padded: np.ndarray, blocks: np.ndarray, margin: int) -> np.ndarray:
+    """Copies of the given PEAK_BLOCK blocks with margin samples of context on each side"""
+    return np.lib.stride_tricks.sliding_window_view(padded, PEAK_BLOCK + 2 * margin)[blocks * PEAK_BLOCK]
+
+
+def true_peak_blocks(samples: np.ndarray, floor: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-sample maximum of the 4x oversampled signal's magnitude, by block
+    
+    Only blocks whose sample peak exceeds floor are oversampled (in one
+    batch); elsewhere the envelope is the sample magnitude.
+    
+    Args:
+        samples: Float samples
+        floor: Sample level below which inter-sample peaks are not looked for
+    
+    Returns:
+        Tuple of (envelope as (blocks, PEAK_BLOCK) array, indices of oversampled blocks)
+    """
+    n = len(samples)
+    blocks = -(-n // PEAK_BLOCK)
+    padded = np.zeros(blocks * PEAK_BLOCK + 2 * PEAK_MARGIN, dtype=np.float32)
+    padded[PEAK_MARGIN:PEAK_MARGIN + n] = samples
+    
+    envelope = np.abs(padded[PEAK_MARGIN:PEAK_MARGIN + blocks * PEAK_BLOCK]).reshape(blocks, PEAK_BLOCK)
+    hot = np.flatnonzero(envelope.max(axis=1) > floor)
+    if len(hot):
+        upsampled = resample_poly(block_windows(padded, hot, PEAK_MARGIN), OVERSAMPLING, 1, axis=1)
+        inner = np.abs(upsampled[:, PEAK_MARGIN * OVERSAMPLING:(PEAK_MARGIN + PEAK_BLOCK) * OVERSAMPLING])
+        
+        # Elementwise maxima of the phases are much faster than max() over a short axis
+        peaks = envelope[hot]
+        for phase in range(OVERSAMPLING):
+            np.maximum(peaks, inner[:, phase::OVERSAMPLING], out=peaks)
+        envelope[hot] = peaks
+    
+    return envelope, hot
+
+
+def true_peak_envelope(samples: np.ndarray) -> np.ndarray:
+    """Per-sample maximum of the 4x oversampled signal's magnitude"""
+    envelope, _ = true_peak_blocks(samples, 0.0)
+    return envelope.reshape(-1)[:len(samples)]
+
+
+def limit_true_peak(samples: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, float]:
+    """
+    Keep the true peak below TRUE_PEAK_LIMIT_DBTP with a look-ahead limiter
+    
+    The gain at each sample is the minimum required within LIMITER_WINDOW_MS
+    around it, smoothed by a moving average over half that span, so it
+    ramps down before a peak and back up after it without overshooting.
+    Only blocks near a peak above the ceiling are processed.
+    
+    Args:
+        samples: Float samples
+        sample_rate: Sample rate in Hz
+    
+    Returns:
+        Tuple of (limited samples, largest gain reduction in dB)
+    """
+    ceiling = 10 ** (config.TRUE_PEAK_LIMIT_DBTP / 20)
+    envelope, hot = true_peak_blocks(samples, ceiling * 10 ** (-INTERSAMPLE_HEADROOM_DB / 20))
+    over = hot[envelope[hot].max(axis=1) > ceiling] if len(hot) else hot
+    if not len(over):
+        return samples, 0.0
+    
+    # Blocks whose gain can be pulled down by a peak in or next to them
+    window = max(1, int(sample_rate * config.LIMITER_WINDOW_MS / 1000))
+    margin = 2 * window
+    reach = -(-margin // PEAK_BLOCK)
+    affected = np.unique((over[:, None] + np.arange(-reach, reach + 1)).clip(0, len(envelope) - 1))
+    
+    required = np.ones(len(envelope) * PEAK_BLOCK + 2 * margin, dtype=np.float32)
+    required[margin:margin + envelope.size] = np.minimum(1.0, ceiling / np.maximum(envelope.reshape(-1), 1e-9))
+    windows = block_windows(required, affected, margin)
+    gain = uniform_filter1d(minimum_filter1d(windows, size=2 * window + 1, axis=1), size=window, axis=1)
+    gain = np.minimum(gain, windows)[:, margin:margin + PEAK_BLOCK]
+    
+    output = np.zeros(len(envelope) * PEAK_BLOCK, dtype=np.float32)
+    output[:len(samples)] = samples
+    output = output.reshape(-1, PEAK_BLOCK)
+    output[affected] *= gain
+    return output.reshape(-1)[:len(samples)], float(-20 * np.log10(gain.min()))
+
+
+def normalize_programme(segments: List[bytes], sample_rate: int = config.SAMPLE_RATE) -> Tuple[bytes, Dict]:
+    """
+    Level segments to the target loudness and join them into one programme
+    
+    Args:
+        segments: Mono 16-bit PCM of each segment, in playback order
+        sample_rate: Sample rate in Hz
+    
+    Returns:
+        Tuple of (normalized 16-bit PCM, loudness statistics)
+    """
+    sos = k_weighting(sample_rate).astype(np.float32)
+    max_gain = config.LOUDNESS_MAX_GAIN_DB
+    
+    samples = [np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768 for pcm in segments]
+    blocks, loudness, gains_db = [], [], []
+    for x in samples:
+        blocks.append(block_powers(k_weighted_power(x, sos), sample_rate))
+        loudness.append(gated_loudness(blocks[-1]))
+        
+        # Silent segments keep their level
+        gain = config.LOUDNESS_TARGET_LUFS - loudness[-1] if math.isfinite(loudness[-1]) else 0.0
+        gains_db.append(min(max(gain, -max_gain), max_gain))
+    
+    # Measure the levelled programme from the segments' gating blocks and correct what is left
+    all_blocks = np.concatenate(blocks) if blocks else np.array([])
+    levelled = np.concatenate([b * 10 ** (g / 10) for b, g in zip(blocks, gains_db)]) if blocks else all_blocks
+    programme = gated_loudness(levelled)
+    correction = config.LOUDNESS_TARGET_LUFS - programme if math.isfinite(programme) else 0.0
+    
+    # One pass over all samples with a per-sample gain
+    gains = np.repeat(
+        (10 ** ((np.array(gains_db) + correction) / 20)).astype(np.float32),
+        [len(x) for x in samples]
+    )
+    output = np.concatenate(samples) * gains if samples else np.array([], dtype=np.float32)
+    output, limited_db = limit_true_peak(output, sample_rate)
+    
+    # Output loudness is measured before the limiter, which only touches peaks
+    audible = [l for l in loudness if math.isfinite(l)]
+    stats = {
+        "segments": len(segments),
+        "input_lufs": round(gated_loudness(all_blocks), 2) if audible else None,
+        "output_lufs": round(programme + correction, 2) if audible else None,
+        "segment_spread_lu": round(float(np.ptp(audible)), 2) if audible else 0.0,
+        "limited_db": round(limited_db, 2)
+    }
+    
+    pcm = (np.clip(output, -1.0, 32767 / 32768) * 32768).astype("<i2").tobytes()
+    return pcm, stats
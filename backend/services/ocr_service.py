@@ -0,0 +1,196 @@
+"""
+OCR fallback for scanned PDF pages
+
+Pages with (almost) no extractable text that carry images are rendered and
+read by Tesseract through PyMuPDF in a pool of worker processes. Results
+are cached by page hash (content stream, images, OCR language and DPI), so
+a scan that is uploaded again, or embedded in another PDF, is read once.
+"""
+import hashlib
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Dict, List, Optional
+import fitz  # PyMuPDF
+import config
+from db.file_manager import get_ocr_cache_path
+from db.storage import get_storage
+from services.layout import init_ocr_worker, ocr_page
+from utils.metrics import OCR_PAGES, OCR_PAGE_SECONDS, OCR_PAGES_PER_SECOND
+from utils.tracing import span
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+@lru_cache(maxsize=1)
+def get_tessdata() -> Optional[str]:
+    """Get the Tesseract language data folder, or None if OCR is unavailable"""
+    try:
+        return fitz.get_tessdata(config.OCR_TESSDATA)
+    except Exception as e:
+        print(f"OCR unavailable, scanned pages keep their PDF text: {e}")
+        return None
+
+
+def get_ocr_pool() -> ProcessPoolExecutor:
+    """Get the shared OCR worker pool"""
+    global _pool
+    if _pool is None:
+        # Spawned workers import only PyMuPDF and services.layout, not the app
+        _pool = ProcessPoolExecutor(
+            max_workers=config.OCR_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_ocr_worker
+        )
+    return _pool
+
+
+def reset_ocr_pool(pool: Optional[ProcessPoolExecutor] = None, terminate: bool = False) -> None:
+    """
+    Drop a pool, e.g. after a worker crashed; running pages are abandoned
+    
+    Args:
+        pool: Pool to drop, default the current one (a newer pool that
+            replaced it is kept)
+        terminate: Also kill the workers, freeing them from pages still running
+    """
+    global _pool
+    pool = pool or _pool
+    if pool is None:
+        return
+    if _pool is pool:
+        _pool = None
+    
+    if terminate:
+        # Python 3.14+ does this itself; earlier versions only track the processes
+        if hasattr(pool, "terminate_workers"):
+            pool.terminate_workers()
+            return
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+    
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def needs_ocr(page: fitz.Page, record: Dict) -> bool:
+    """Pages with little extractable text that show images are likely scans"""
+    return len(record["text"].strip()) < config.OCR_MIN_CHARS and bool(page.get_images())
+
+
+def page_hash(doc: fitz.Document, page: fitz.Page) -> str:
+    """Hash of what OCR would see on the page, plus the OCR settings"""
+    digest = hashlib.sha256(
+        f"{config.OCR_LANGUAGE}:{config.OCR_DPI}:{tuple(page.rect)}:{page.rotation}".encode("utf-8")
+    )
+    digest.update(page.read_contents())
+    for image in page.get_images(full=True):
+        digest.update(doc.xref_stream_raw(image[0]) or b"")
+    return digest.hexdigest()
+
+
+def renumber(record: Dict, page_num: int) -> Dict:
+    """Move a cached page record to the page it was found on"""
+    for block in record["blocks"]:
+        block["page"] = page_num
+    return {**record, "page": page_num}
+
+
+def apply_ocr(doc: fitz.Document, pdf_path: str, pages: List[Dict]) -> List[Dict]:
+    """
+    Replace the records of scanned pages with OCR results
+    
+    Pages are OCR'd in parallel within OCR_TIMEOUT_S; pages that fail or do
+    not finish in time keep their PDF text. Tesseract cannot be interrupted,
+    so when pages are still running at the timeout the pool's workers are
+    killed and a fresh pool serves later PDFs (pages of other PDFs running
+    in it at that moment fail and keep their PDF text too).
+    
+    Args:
+        doc: Open PyMuPDF document
+        pdf_path: Local path of the PDF (opened again by the workers)
+        pages: Page records in page order, updated in place
+    
+    Returns:
+        The page records
+    """
+    if not config.OCR_ENABLED:
+        return pages
+    
+    candidates = [record["page"] for record in pages if needs_ocr(doc[record["page"] - 1], record)]
+    if not candidates:
+        return pages
+    
+    tessdata = get_tessdata()
+    if tessdata is None:
+        OCR_PAGES.labels("unavailable").inc(len(candidates))
+        return pages
+    
+    storage = get_storage()
+    with span("pdf.ocr", pages=len(candidates)) as ocr_span:
+        started = time.perf_counter()
+        
+        # Serve pages seen before from the cache, OCR the rest
+        pool = get_ocr_pool()
+        futures = {}
+        for page_num in candidates:
+            cache_key = get_ocr_cache_path(page_hash(doc, doc[page_num - 1]))
+            if storage.exists(cache_key):
+                cached = json.loads(b"".join(storage.open_read(cache_key)))
+                pages[page_num - 1] = renumber(cached, page_num)
+                OCR_PAGES.labels("cached").inc()
+                continue
+            
+            future = pool.submit(
+                ocr_page, pdf_path, page_num, config.OCR_LANGUAGE, config.OCR_DPI, tessdata
+            )
+            futures[future] = (page_num, cache_key)
+        
+        done, not_done = wait(futures, timeout=config.OCR_TIMEOUT_S)
+        
+        recognized = 0
+        for future in done:
+            page_num, cache_key = futures[future]
+            try:
+                record, seconds = future.result()
+            except BrokenProcessPool as e:
+                # A worker died (e.g. out of memory); start a fresh pool next time
+                print(f"OCR failed for page {page_num}: {e}")
+                OCR_PAGES.labels("failed").inc()
+                reset_ocr_pool(pool)
+                continue
+            except Exception as e:
+                print(f"OCR failed for page {page_num}: {e}")
+                OCR_PAGES.labels("failed").inc()
+                continue
+            
+            OCR_PAGE_SECONDS.observe(seconds)
+            OCR_PAGES.labels("ocr").inc()
+            pages[page_num - 1] = record
+            storage.put_bytes(cache_key, json.dumps(record, ensure_ascii=False).encode("utf-8"))
+            recognized += 1
+        
+        if not_done:
+            print(f"OCR timed out after {config.OCR_TIMEOUT_S}s, {len(not_done)} pages keep their PDF text")
+            OCR_PAGES.labels("timeout").inc(len(not_done))
+            
+            # Queued pages are cancelled; running ones would keep their workers busy
+            running = [future for future in not_done if not future.cancel()]
+            if running:
+                reset_ocr_pool(pool, terminate=True)
+        
+        elapsed = time.perf_counter() - started
+        if recognized:
+            OCR_PAGES_PER_SECOND.set(recognized / elapsed)
+            print(f"OCR: {recognized} pages in {elapsed:.1f}s ({recognized / elapsed:.2f} pages/s)")
+        
+        if ocr_span is not None:
+            ocr_span["attributes"].update(
+                recognized=recognized,
+                cached=len(candidates) - len(futures),
+                timed_out=len(not_done)
+            )
+    
+    return pages
@@ -0,0 +1,142 @@
+"""
+Per-page text and layout store
+
+Each PDF is parsed once; for every page the store keeps the extracted text,
+the text blocks (with fonts and line boxes) and word bounding boxes. It is
+keyed by the PDF's SHA-256, so re-chunking or re-embedding with other
+settings, the viewer and chat references never re-open the PDF.
+
+Layout (under {UPLOAD_DIR}/pages/{sha256}/):
+    pages.jsonl  one JSON record per page
+    pages.json   manifest with the page count and byte offsets of the records
+"""
+import json
+from typing import Dict, List, Optional
+import fitz  # PyMuPDF
+from db.storage import get_storage, get_local_path
+from services import ocr_service
+from services.layout import TextBlock, extract_page
+from utils.tracing import traced
+
+RECORDS_FILE = "pages.jsonl"
+MANIFEST_FILE = "pages.json"
+
+
+@traced("pdf.extract_pages")
+def extract_pages(file_path: str) -> List[Dict]:
+    """
+    Parse every page of a stored PDF
+    
+    Args:
+        file_path: Storage key of PDF file
+    
+    Returns:
+        Page records in page order
+    """
+    local_path = get_local_path(file_path)
+    doc = fitz.open(local_path)
+    try:
+        pages = [extract_page(page, page_num) for page_num, page in enumerate(doc, 1)]
+        
+        # Scanned pages have no text layer; read them with OCR
+        return ocr_service.apply_ocr(doc, local_path, pages)
+    finally:
+        doc.close()
+
+
+@traced("pages.save")
+def save_page_store(pages: List[Dict], store_path: str) -> str:
+    """
+    Write page records to storage
+    
+    Args:
+        pages: Page records
+        store_path: Storage key prefix of the store
+    
+    Returns:
+        The store path
+    """
+    offsets = [0]
+    records = []
+    for page in pages:
+        record = (json.dumps(page, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8")
+        records.append(record)
+        offsets.append(offsets[-1] + len(record))
+    
+    storage = get_storage()
+    storage.put_stream(f"{store_path}/{RECORDS_FILE}", records)
+    
+    # Manifest goes last: a store without it is incomplete
+    manifest = {"page_count": len(pages), "offsets": offsets}
+    storage.put_bytes(f"{store_path}/{MANIFEST_FILE}", json.dumps(manifest).encode("utf-8"))
+    return store_path
+
+
+def page_store_exists(store_path: str) -> bool:
+    """Check if a complete page store exists"""
+    return get_storage().exists(f"{store_path}/{MANIFEST_FILE}")
+
+
+@traced("pages.load")
+def load_pages(store_path: str) -> List[Dict]:
+    """
+    Load all page records
+    
+    Args:
+        store_path: Storage key prefix of the store
+    
+    Returns:
+        Page records in page order
+    """
+    with open(get_local_path(f"{store_path}/{RECORDS_FILE}"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@traced("pages.load_page")
+def load_page(store_path: str, page_num: int) -> Optional[Dict]:
+    """
+    Load a single page record with a ranged read
+    
+    Args:
+        store_path: Storage key prefix of the store
+        page_num: 1-based page number
+    
+    Returns:
+        Page record, or None if the page does not exist
+    """
+    storage = get_storage()
+    manifest = json.loads(b"".join(storage.open_read(f"{store_path}/{MANIFEST_FILE}")))
+    if not 1 <= page_num <= manifest["page_count"]:
+        return None
+    
+    start = manifest["offsets"][page_num - 1]
+    end = manifest["offsets"][page_num] - 1
+    return json.loads(b"".join(storage.open_read(f"{store_path}/{RECORDS_FILE}", start, end)))
+
+
+def delete_page_store(store_path: str) -> None:
+    """Delete a page store"""
+    for name in (MANIFEST_FILE, RECORDS_FILE):
+        try:
+            get_storage().delete(f"{store_path}/{name}")
+        except Exception as e:
+            print(f"Error deleting page store: {e}")
+
+
+def pages_to_text(pages: List[Dict]) -> str:
+    """
+    Build the full document text with page markers
+    
+    Returns:
+        Text in the "[PAGE n]" format used for chunking and podcast scripts
+    """
+    return "\n\n".join(f"[PAGE {page['page']}]\n{page['text']}" for page in pages)
+
+
+def pages_to_blocks(pages: List[Dict]) -> List[TextBlock]:
+    """Rebuild text blocks for the layout chunker"""
+    return [
+        TextBlock(**{**block, "line_boxes": [tuple(line) for line in block["line_boxes"]]})
+        for page in pages
+        for block in page["blocks"]
+    ]
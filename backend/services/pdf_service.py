@@ -1,37 +1,30 @@
 """
 PDF text extraction and chunking service
 """
-import fitz  # PyMuPDF
+import asyncio
 import re
-from typing import List, Dict
+from functools import lru_cache
+from typing import List, Dict, Optional
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import config
+from services import chunker, page_store
+from utils.tracing import span, traced
 
 
-def extract_text_from_pdf(file_path: str) -> str:
-    """
-    Extract text from PDF with page numbers
-    
-    Args:
-        file_path: Path to PDF file
-        
-    Returns:
-        Extracted text with page markers
-    """
-    doc = fitz.open(file_path)
-    text_with_pages = []
-    
-    for page_num, page in enumerate(doc, 1):
-        page_text = page.get_text()
-        text_with_pages.append(f"[PAGE {page_num}]\n{page_text}")
-    
-    doc.close()
-    return "\n\n".join(text_with_pages)
+@lru_cache(maxsize=1)
+def get_text_splitter() -> RecursiveCharacterTextSplitter:
+    """Get the shared character splitter"""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=config.CHUNK_SIZE,
+        chunk_overlap=config.CHUNK_OVERLAP,
+        separators=config.TEXT_SEPARATORS
+    )
 
 
+@traced("pdf.chunk")
 def chunk_text(text: str) -> List[Dict[str, any]]:
     """
-    Split text into chunks with metadata
+    Split text into fixed-size character chunks with metadata
     
     Args:
         text: Full text to chunk
@@ -39,14 +32,8 @@ def chunk_text(text: str) -> List[Dict[str, any]]:
     Returns:
         List of chunks with text and page number
     """
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=config.CHUNK_SIZE,
-        chunk_overlap=config.CHUNK_OVERLAP,
-        separators=config.TEXT_SEPARATORS
-    )
-    
     chunks = []
-    for chunk_text in splitter.split_text(text):
+    for chunk_text in get_text_splitter().split_text(text):
         # Extract page number from chunk
         page_match = re.search(r'\[PAGE (\d+)\]', chunk_text)
         page_num = int(page_match.group(1)) if page_match else 1
@@ -62,23 +49,33 @@ def chunk_text(text: str) -> List[Dict[str, any]]:
     return chunks
 
 
-async def process_pdf(file_path: str) -> tuple[str, List[Dict], int]:
+async def process_pdf(file_path: str, page_store_path: Optional[str] = None) -> tuple[str, List[Dict], int]:
     """
     Process PDF: extract text and create chunks
     
     Args:
         file_path: Path to PDF file
+        page_store_path: Optional page store to reuse, or to fill when missing
         
     Returns:
         Tuple of (full_text, chunks, total_pages)
     """
-    # Extract text
-    full_text = extract_text_from_pdf(file_path)
+    # Extract text and layout (once per PDF when a page store is used)
+    if page_store_path and page_store.page_store_exists(page_store_path):
+        pages = page_store.load_pages(page_store_path)
+    else:
+        # Off the event loop: scanned pages can take a while to OCR
+        pages = await asyncio.to_thread(page_store.extract_pages, file_path)
+        if page_store_path:
+            page_store.save_page_store(pages, page_store_path)
     
-    # Create chunks
-    chunks = chunk_text(full_text)
+    full_text = page_store.pages_to_text(pages)
     
-    # Get total pages
-    total_pages = max(c["page"] for c in chunks) if chunks else 0
+    # Create chunks
+    if config.CHUNKER == "layout":
+        with span("pdf.chunk_layout"):
+            chunks = chunker.chunk_blocks(page_store.pages_to_blocks(pages))
+    else:
+        chunks = chunk_text(full_text)
     
-    return full_text, chunks, total_pages
+    return full_text, chunks, len(pages)
@@ -0,0 +1,365 @@
+"""
+Chaptered podcasts: chapter audio, assembly and per-chapter regeneration
+
+A podcast is a list of chapters, each a section of the script plus the
+stored audio of its segments (raw PCM per dialogue line). The podcast
+master is the concatenation of all segment audio at a common loudness
+(services/loudness.py): it is assembled once, and re-assembled from the
+stored segments when a chapter or the script is edited. Renditions for
+listeners are encoded from it (audio_export).
+
+Each podcast has a roster of speakers (stored with it): their names are
+the ones its script is written and parsed with, and their voices and
+provider routes voice its lines.
+"""
+import asyncio
+import difflib
+import hashlib
+import os
+import re
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+from weakref import WeakValueDictionary
+import config
+from db import mongodb, file_manager
+from db.storage import get_storage
+from services import audio_export, llm_service, loudness, tts_service
+from services.tts_providers import get_tts_provider
+from utils.text import (
+    parse_podcast, parse_podcast_script, join_podcast_chapters, speaker_key
+)
+from utils.tracing import span, traced
+
+# Names the script parser can tell apart from other text
+SPEAKER_NAME_PATTERN = re.compile(rf"^[^\W\d_][\w.' -]{{0,{config.MAX_SPEAKER_NAME_LENGTH - 1}}}$")
+
+# One chapter edit at a time per podcast
+_podcast_locks: "WeakValueDictionary[str, asyncio.Lock]" = WeakValueDictionary()
+
+
+def get_podcast_lock(podcast_id: str) -> asyncio.Lock:
+    """Get the lock serializing changes to a podcast"""
+    lock = _podcast_locks.get(podcast_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _podcast_locks[podcast_id] = lock
+    return lock
+
+
+def build_roster(speakers: Optional[List[Dict]] = None) -> List[Dict]:
+    """
+    Complete the speakers of a podcast with default roles, voices and routes
+    
+    Args:
+        speakers: Speakers with name and optional role, voices (provider to
+            voice) and route (provider names); default config.DEFAULT_SPEAKERS
+    
+    Returns:
+        Speakers with name, key, role, voices and route
+    
+    Raises:
+        ValueError: If the number of speakers, a name, a provider or a voice is invalid
+    """
+    speakers = speakers or config.DEFAULT_SPEAKERS
+    if not config.MIN_SPEAKERS <= len(speakers) <= config.MAX_SPEAKERS:
+        raise ValueError(f"A podcast needs {config.MIN_SPEAKERS} to {config.MAX_SPEAKERS} speakers")
+    
+    roster = []
+    for i, speaker in enumerate(speakers):
+        name = " ".join(speaker["name"].split())
+        if not SPEAKER_NAME_PATTERN.match(name) or speaker_key(name) == "chapter":
+            raise ValueError(f"Invalid speaker name: {speaker['name']!r}")
+        if any(other["key"] == speaker_key(name) for other in roster):
+            raise ValueError(f"Speaker {name} appears twice")
+        
+        # Speakers beyond the defaults reuse their voices, in turn
+        default = config.DEFAULT_SPEAKERS[i % len(config.DEFAULT_SPEAKERS)]
+        route = [provider.strip() for provider in speaker.get("route") or default["route"] if provider.strip()]
+        voices = {**default["voices"], **(speaker.get("voices") or {})}
+        for provider in {*route, *voices}:
+            get_tts_provider(provider)
+        
+        # Voices are passed to providers (Piper runs a model file): only configured ones
+        for provider, voice in (speaker.get("voices") or {}).items():
+            if voice and voice not in config.SPEAKER_VOICES.get(provider, []):
+                raise ValueError(f"Voice {voice!r} is not available for {provider}")
+        
+        roster.append({
+            "name": name,
+            "key": speaker_key(name),
+            "role": speaker.get("role") or (default["role"] if i < len(config.DEFAULT_SPEAKERS) else config.GUEST_ROLE),
+            "voices": voices,
+            "route": route
+        })
+    
+    return roster
+
+
+def get_roster(podcast: Dict) -> List[Dict]:
+    """Roster of a stored podcast (podcasts from before rosters have the default one)"""
+    return podcast.get("speakers") or build_roster()
+
+
+def speaker_names(speakers: List[Dict]) -> List[str]:
+    """Names of a roster's speakers, as the script parser takes them"""
+    return [speaker["name"] for speaker in speakers]
+
+
+def segment_audio_paths(chapters: List[Dict]) -> List[str]:
+    """Storage keys of all segment audio in playback order"""
+    return [
+        segment["audio_path"]
+        for chapter in chapters
+        for segment in chapter["segments"]
+        if segment.get("audio_path")
+    ]
+
+
+def podcast_revision(chapters: List[Dict]) -> str:
+    """Short hash identifying the audio a set of chapters assembles to"""
+    return hashlib.sha256("\n".join(segment_audio_paths(chapters)).encode("utf-8")).hexdigest()[:12]
+
+
+def count_segments(chapters: List[Dict]) -> int:
+    """Number of dialogue segments in all chapters"""
+    return sum(len(chapter["segments"]) for chapter in chapters)
+
+
+async def create_chapters_audio(
+    chapters: List[Dict[str, str]],
+    podcast_id: str,
+    speakers: List[Dict],
+    on_audio: Optional[Callable[[bytes], Awaitable[None]]] = None
+) -> tuple[List[Dict], int]:
+    """
+    Synthesize the audio of every chapter, in order
+    
+    Args:
+        chapters: Chapters with title, script and segments to synthesize
+            (from llm_service.generate_podcast_script or parse_podcast)
+        podcast_id: Podcast the audio belongs to
+        speakers: Roster of the podcast
+        on_audio: Optional callback receiving each segment's MP3 frames in order
+    
+    Returns:
+        Tuple of (chapters with title, script and segments; number of segments synthesized)
+    """
+    records = []
+    synthesized = 0
+    for chapter in chapters:
+        segments, count = await tts_service.synthesize_segments(
+            chapter["segments"],
+            podcast_id,
+            speakers,
+            on_audio
+        )
+        records.append({"title": chapter["title"], "script": chapter["script"], "segments": segments})
+        synthesized += count
+    
+    return records, synthesized
+
+
+def render_pcm(chapters: List[Dict]) -> bytes:
+    """
+    Join the stored segment audio of chapters at a consistent loudness
+    
+    Args:
+        chapters: Chapters with segments
+        
+    Returns:
+        Loudness-normalized PCM in playback order
+    """
+    storage = get_storage()
+    segments = [b"".join(storage.open_read(path)) for path in segment_audio_paths(chapters)]
+    
+    with span("audio.loudness", segments=len(segments)) as loudness_span:
+        pcm, stats = loudness.normalize_programme(segments)
+        if loudness_span is not None:
+            loudness_span["attributes"].update(stats)
+    
+    print(
+        f"Loudness: {stats['input_lufs']} -> {stats['output_lufs']} LUFS over {stats['segments']} segments "
+        f"(spread {stats['segment_spread_lu']} LU, limited {stats['limited_db']} dB)"
+    )
+    return pcm
+
+
+@traced("podcast.assemble")
+def assemble_podcast_audio(chapters: List[Dict], audio_path: str) -> str:
+    """
+    Encode the stored segment audio of all chapters into the podcast master
+    
+    Args:
+        chapters: Chapters with segments
+        audio_path: Storage key of the master
+        
+    Returns:
+        The audio path
+    """
+    if not segment_audio_paths(chapters):
+        raise Exception("TTS failed for every segment")
+    
+    return audio_export.write_master([render_pcm(chapters)], audio_path)
+
+
+def encode_chapter_audio(chapter: Dict, audio_format: str, bitrate: str) -> bytes:
+    """Encode one chapter's audio in a rendition format (blocking)"""
+    return audio_export.encode_pcm([render_pcm([chapter])], audio_format, bitrate)
+
+
+def audio_filename(audio_path: str) -> str:
+    """Name under which /audio serves a podcast (a master is served in negotiated renditions)"""
+    if audio_path.endswith(".flac"):
+        return os.path.splitext(os.path.basename(audio_path))[0]
+    return os.path.basename(audio_path)
+
+
+async def regenerate_chapter(
+    podcast: Dict,
+    pdf_text: str,
+    index: int,
+    instructions: Optional[str] = None
+) -> tuple[Dict, int]:
+    """
+    Rewrite and re-synthesize one chapter, reusing the audio of all others
+    
+    Call with the podcast's lock held.
+    
+    Args:
+        podcast: Podcast record with project_id and chapters
+        pdf_text: Document text the podcast is based on
+        index: Index of the chapter to regenerate
+        instructions: Optional guidance for the new version
+    
+    Returns:
+        Tuple of (updated podcast, number of segments synthesized)
+    """
+    podcast_id = podcast["podcast_id"]
+    chapters = podcast["chapters"]
+    speakers = get_roster(podcast)
+    
+    # The chapter keeps its title
+    chapter = await llm_service.generate_chapter_script(pdf_text, chapters, index, speakers, instructions)
+    
+    segments, synthesized = await tts_service.synthesize_segments(
+        chapter["segments"],
+        podcast_id,
+        speakers
+    )
+    new_chapters = [
+        *chapters[:index],
+        {"title": chapters[index]["title"], "script": chapter["script"], "segments": segments},
+        *chapters[index + 1:]
+    ]
+    
+    return await save_chapters(podcast, new_chapters), synthesized
+
+
+def diff_segments(old_chapters: List[Dict], new_chapters: List[Dict], speakers: List[Dict]) -> Dict[str, int]:
+    """
+    Compare the dialogue lines of two versions of a script
+    
+    Args:
+        old_chapters: Chapters of the stored version
+        new_chapters: Chapters of the edited version
+        speakers: Roster of the podcast
+    
+    Returns:
+        Counts of unchanged, changed, added and removed lines
+    """
+    def lines(chapters: List[Dict]) -> List[tuple]:
+        return [
+            (segment["speaker"], segment["text"])
+            for chapter in chapters
+            for segment in chapter.get("segments") or parse_podcast_script(chapter["script"], speaker_names(speakers))
+        ]
+    
+    counts = {"unchanged": 0, "changed": 0, "added": 0, "removed": 0}
+    matcher = difflib.SequenceMatcher(a=lines(old_chapters), b=lines(new_chapters), autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            counts["unchanged"] += i2 - i1
+        elif tag == "insert":
+            counts["added"] += j2 - j1
+        elif tag == "delete":
+            counts["removed"] += i2 - i1
+        else:
+            changed = min(i2 - i1, j2 - j1)
+            counts["changed"] += changed
+            counts["added"] += j2 - j1 - changed
+            counts["removed"] += i2 - i1 - changed
+    
+    return counts
+
+
+async def update_script(podcast: Dict, script: str) -> tuple[Dict, Dict[str, int], int]:
+    """
+    Replace a podcast's script, re-synthesizing only lines that changed
+    
+    Segment audio is stored under content keys, so every line whose speaker
+    and text already have audio in this podcast is reused, wherever it moved.
+    Call with the podcast's lock held.
+    
+    Args:
+        podcast: Podcast record with project_id
+        script: Edited script, optionally with "CHAPTER:" lines
+    
+    Returns:
+        Tuple of (updated podcast, line diff counts and lines ignored, number of segments synthesized)
+    """
+    speakers = get_roster(podcast)
+    parsed = parse_podcast(script, speaker_names(speakers))
+    chapters = parsed["chapters"]
+    if not chapters:
+        raise Exception("Script has no dialogue lines")
+    
+    # Podcasts from before chapters count as a single chapter
+    old_chapters = podcast.get("chapters") or [{"title": "Full episode", "script": podcast.get("script", "")}]
+    diff = diff_segments(old_chapters, chapters, speakers)
+    
+    # Lines that are not dialogue of the podcast's speakers are not voiced
+    diff["ignored"] = len(parsed["dropped"])
+    
+    new_chapters, synthesized = await create_chapters_audio(chapters, podcast["podcast_id"], speakers)
+    
+    return await save_chapters(podcast, new_chapters), diff, synthesized
+
+
+async def save_chapters(podcast: Dict, new_chapters: List[Dict]) -> Dict:
+    """
+    Assemble and store a new version of a podcast's chapters
+    
+    Args:
+        podcast: Current podcast record with project_id
+        new_chapters: Chapters with synthesized segments
+    
+    Returns:
+        The updated podcast record
+    """
+    project_id = podcast["project_id"]
+    podcast_id = podcast["podcast_id"]
+    
+    # A new file name, since podcast audio URLs are cached as immutable
+    audio_path = file_manager.get_podcast_audio_path(project_id, podcast_id, podcast_revision(new_chapters))
+    if not await asyncio.to_thread(get_storage().exists, audio_path):
+        await asyncio.to_thread(assemble_podcast_audio, new_chapters, audio_path)
+    
+    fields = {
+        "chapters": new_chapters,
+        "script": join_podcast_chapters(new_chapters),
+        "audio_path": audio_path,
+        "audio_filename": audio_filename(audio_path),
+        "segments_count": count_segments(new_chapters),
+        "updated_at": datetime.utcnow()
+    }
+    await mongodb.update_podcast(project_id, podcast_id, fields)
+    
+    # Drop audio only the previous version used
+    unused = set(segment_audio_paths(podcast.get("chapters", []))) - set(segment_audio_paths(new_chapters))
+    for path in unused:
+        await asyncio.to_thread(file_manager.delete_audio_file, path)
+    
+    if podcast["audio_path"] != audio_path:
+        await asyncio.to_thread(file_manager.delete_podcast_audio, podcast["audio_path"])
+    
+    return {**podcast, **fields}
@@ -0,0 +1,428 @@
+"""
+Text-to-speech providers
+
+A provider synthesizes a line of text in one of its voices and returns WAV
+audio. Cartesia is the hosted provider; Piper and espeak-ng run locally on
+CPU, so podcasts can still be voiced during Cartesia outages and without
+network access. tts_service routes each speaker through the providers of
+its route (see config.DEFAULT_SPEAKERS) and fails over between them.
+
+The lines of a podcast are synthesized through a conversation per provider,
+which streams each line as PCM chunks in the podcast's layout. Cartesia
+conversations keep one pooled WebSocket connection and send a speaker's
+lines as continuations of one context, so delivery carries over between
+lines; other providers synthesize each line on its own.
+"""
+import io
+import os
+import shutil
+import subprocess
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from pydub import AudioSegment
+import config
+from db.storage import new_scratch_path
+from services import audio_export
+from utils.metrics import TTS_CONNECTIONS
+
+# Cartesia WebSocket output in the layout of stored segments (see audio_export)
+PCM_OUTPUT_FORMAT = {
+    "container": "raw",
+    "encoding": config.AUDIO_ENCODING,
+    "sample_rate": config.SAMPLE_RATE,
+}
+
+
+def wav_to_pcm(wav: bytes) -> bytes:
+    """Convert WAV audio at any rate and layout to segment PCM"""
+    return AudioSegment.from_wav(io.BytesIO(wav)).set_frame_rate(
+        config.SAMPLE_RATE
+    ).set_channels(
+        audio_export.PCM_CHANNELS
+    ).set_sample_width(
+        audio_export.PCM_SAMPLE_WIDTH
+    ).raw_data
+
+
+def generation_options(emotion: Optional[str]) -> Dict[str, Dict[str, str]]:
+    """Cartesia request options rendering a line's emotion (none for neutral delivery)"""
+    return {"generation_config": {"emotion": emotion}} if emotion else {}
+
+
+class Conversation:
+    """
+    Lines of one podcast synthesized by a provider, one request per line
+    
+    Used from one thread at a time.
+    """
+
+    def __init__(self, provider: "TTSProvider"):
+        self.provider = provider
+        self.aborted = False
+
+    def stream(self, text: str, voice: str, emotion: Optional[str] = None) -> Iterator[bytes]:
+        """Synthesize a line as segment PCM chunks (blocking)"""
+        yield wav_to_pcm(self.provider.synthesize(text, voice, emotion))
+
+    def close(self) -> None:
+        """Release what the conversation holds once all lines are done"""
+
+    def abort(self) -> None:
+        """
+        Give up on a line still streaming in another thread (after a timeout)
+        
+        Called from the event loop: only flags the conversation, and the
+        thread streaming the line stops and cleans up at its next chunk.
+        """
+        self.aborted = True
+
+
+class TTSProvider(ABC):
+    """
+    Interface implemented by TTS providers
+    
+    Providers also track their health: after TTS_FAILURE_THRESHOLD failures
+    in a row a provider is skipped for TTS_COOLDOWN_S.
+    """
+    
+    name = ""
+    emotions = False  # Whether the provider renders the emotion of a line
+
+    def __init__(self):
+        self.failures = 0
+        self.skipped_until = 0.0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def model(self) -> str:
+        """Model identifier that, with the voice and text, determines the audio"""
+        return self.name
+
+    @abstractmethod
+    def available(self) -> bool:
+        """Check if the provider can be used on this node"""
+
+    @abstractmethod
+    def synthesize(self, text: str, voice: str, emotion: Optional[str] = None) -> bytes:
+        """Synthesize text in a voice, and emotion if supported, as WAV bytes (blocking)"""
+
+    def conversation(self) -> Conversation:
+        """Start synthesizing the lines of a podcast"""
+        return Conversation(self)
+
+    def executor(self) -> ThreadPoolExecutor:
+        """
+        Get the threads the provider's calls block in
+        
+        A call abandoned after a timeout keeps its thread until it returns;
+        with a pool per provider, calls hanging during an outage hold up
+        neither the fallback providers nor the default executor.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=config.TTS_PROVIDER_WORKERS,
+                thread_name_prefix=f"tts-{self.name}"
+            )
+        return self._executor
+
+    def healthy(self) -> bool:
+        """Check if the provider is not being skipped after repeated failures"""
+        return time.monotonic() >= self.skipped_until
+
+    def record_success(self) -> None:
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= config.TTS_FAILURE_THRESHOLD:
+            self.failures = 0
+            self.skipped_until = time.monotonic() + config.TTS_COOLDOWN_S
+            print(f"TTS provider {self.name} is failing, skipping it for {config.TTS_COOLDOWN_S}s")
+
+
+class CartesiaSocketPool:
+    """Open Cartesia WebSocket connections kept for reuse across podcasts"""
+
+    def __init__(self, size: int, idle_s: float):
+        self.size = size
+        self.idle_s = idle_s
+        self._idle: List[Tuple[object, float]] = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take an idle connection, or open one"""
+        with self._lock:
+            while self._idle:
+                connection, released_at = self._idle.pop()
+                if time.monotonic() - released_at < self.idle_s:
+                    TTS_CONNECTIONS.labels("reused").inc()
+                    return connection
+                
+                TTS_CONNECTIONS.labels("expired").inc()
+                self._close(connection)
+        
+        connection = config.cartesia_client.tts.websocket_connect().enter()
+        TTS_CONNECTIONS.labels("opened").inc()
+        return connection
+
+    def release(self, connection) -> None:
+        """Return a connection in a clean state (no open contexts)"""
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                return
+        
+        self._close(connection)
+
+    def discard(self, connection) -> None:
+        """Close a connection that failed or was left mid-line"""
+        TTS_CONNECTIONS.labels("discarded").inc()
+        self._close(connection)
+
+    def _close(self, connection) -> None:
+        try:
+            connection.close()
+        except Exception as e:
+            print(f"Error closing Cartesia WebSocket: {e}")
+
+
+class CartesiaConversation(Conversation):
+    """
+    Lines of one podcast on a pooled Cartesia WebSocket connection
+    
+    Each voice gets a context on the connection and its lines are sent as
+    continuations of it. Every line is flushed and read up to its
+    flush_done, so each line's audio stays separate (segments are stored
+    per line) and is streamed as it is generated.
+    """
+
+    def __init__(self, provider: "CartesiaProvider", pool: CartesiaSocketPool):
+        super().__init__(provider)
+        self.pool = pool
+        self.connection = None
+        self.contexts: Dict[str, object] = {}
+
+    def open_context(self, voice: str):
+        """Start a context for a voice on the conversation's connection"""
+        if self.connection is None:
+            self.connection = self.pool.acquire()
+        
+        context = self.connection.context(
+            timeout=config.TTS_ATTEMPT_TIMEOUT_S,
+            model_id=config.TTS_MODEL,
+            voice={
+                "mode": "id",
+                "id": voice,
+            },
+            output_format=PCM_OUTPUT_FORMAT,
+        )
+        self.contexts[voice] = context
+        return context
+
+    def stream(self, text: str, voice: str, emotion: Optional[str] = None) -> Iterator[bytes]:
+        try:
+            # A continued context the server has already expired fails
+            # before any audio; the line is then sent on a fresh context
+            for attempt in range(2):
+                continued = voice in self.contexts
+                context = self.contexts[voice] if continued else self.open_context(voice)
+                
+                # Continuations are joined as text: keep words apart
+                context.push(text + " ", flush=True, **generation_options(emotion))
+                
+                error = None
+                received = False
+                for event in context.receive():
+                    if self.aborted:
+                        break
+                    if event.type == "chunk" and event.audio:
+                        received = True
+                        yield event.audio
+                    elif event.type == "flush_done":
+                        break
+                    elif event.type in ("error", "done"):
+                        del self.contexts[voice]
+                        error = event.error if event.type == "error" else "context closed before the line was done"
+                        break
+                
+                if self.aborted:
+                    raise Exception("Line abandoned after a timeout")
+                if error is None:
+                    return
+                if received or not continued or attempt:
+                    raise Exception(f"Cartesia error: {error}")
+        
+        except BaseException:
+            # Failed or abandoned mid-line: the connection may still hold
+            # audio of this line, so it is not reused. Abandoned lines are
+            # discarded here, in the thread reading the connection, as
+            # closing it blocks until the server answers
+            self.discard()
+            raise
+
+    def close(self) -> None:
+        if self.connection is None:
+            return
+        
+        try:
+            # Drain every context to its done so the connection is clean for reuse
+            for context in self.contexts.values():
+                context.no_more_inputs()
+                for event in context.receive():
+                    if event.type in ("done", "error"):
+                        break
+        except Exception as e:
+            print(f"Error closing Cartesia contexts: {e}")
+            self.discard()
+            return
+        
+        self.pool.release(self.connection)
+        self.connection = None
+        self.contexts = {}
+
+    def discard(self) -> None:
+        """Drop the connection and its contexts; the next line starts on a new one"""
+        if self.connection is not None:
+            self.pool.discard(self.connection)
+        self.connection = None
+        self.contexts = {}
+
+
+class CartesiaProvider(TTSProvider):
+    """Cartesia Sonic (hosted)"""
+    
+    name = "cartesia"
+    emotions = True
+
+    def __init__(self):
+        super().__init__()
+        self.pool = CartesiaSocketPool(config.CARTESIA_WS_POOL_SIZE, config.CARTESIA_WS_IDLE_S)
+
+    @property
+    def model(self) -> str:
+        return config.TTS_MODEL
+
+    def available(self) -> bool:
+        return config.check_cartesia_setup()
+
+    def synthesize(self, text: str, voice: str, emotion: Optional[str] = None) -> bytes:
+        chunk_iter = config.cartesia_client.tts.bytes(
+            model_id=config.TTS_MODEL,
+            transcript=text,
+            voice={
+                "mode": "id",
+                "id": voice,
+            },
+            output_format={
+                "container": config.AUDIO_FORMAT,
+                "sample_rate": config.SAMPLE_RATE,
+                "encoding": config.AUDIO_ENCODING,
+            },
+            **generation_options(emotion),
+        )
+        return b"".join(chunk_iter)
+
+    def conversation(self) -> Conversation:
+        if config.CARTESIA_WEBSOCKET:
+            return CartesiaConversation(self, self.pool)
+        return Conversation(self)
+
+
+class PiperProvider(TTSProvider):
+    """Piper neural TTS on CPU; a voice is the path of an .onnx model"""
+    
+    name = "piper"
+
+    def __init__(self, binary: str):
+        super().__init__()
+        self.binary = binary
+
+    def available(self) -> bool:
+        return shutil.which(self.binary) is not None
+
+    def synthesize(self, text: str, voice: str, emotion: Optional[str] = None) -> bytes:
+        output_path = new_scratch_path(".wav")
+        try:
+            result = subprocess.run(
+                [self.binary, "--model", voice, "--output_file", output_path],
+                input=text.encode("utf-8"),
+                capture_output=True,
+                timeout=config.TTS_ATTEMPT_TIMEOUT_S
+            )
+            if result.returncode != 0:
+                raise Exception(f"piper failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+            
+            with open(output_path, "rb") as f:
+                return f.read()
+        except subprocess.TimeoutExpired:
+            # run() has killed the process, freeing the provider's thread
+            raise Exception(f"piper timed out after {config.TTS_ATTEMPT_TIMEOUT_S}s")
+        finally:
+            os.remove(output_path)
+
+
+class EspeakProvider(TTSProvider):
+    """espeak-ng formant synthesis on CPU; a voice is an espeak voice name"""
+    
+    name = "espeak"
+
+    def __init__(self, binary: str, words_per_minute: int):
+        super().__init__()
+        self.binary = binary
+        self.words_per_minute = words_per_minute
+
+    def available(self) -> bool:
+        return shutil.which(self.binary) is not None
+
+    def synthesize(self, text: str, voice: str, emotion: Optional[str] = None) -> bytes:
+        try:
+            result = subprocess.run(
+                [self.binary, "-v", voice, "-s", str(self.words_per_minute), "--stdin", "--stdout"],
+                input=text.encode("utf-8"),
+                capture_output=True,
+                timeout=config.TTS_ATTEMPT_TIMEOUT_S
+            )
+        except subprocess.TimeoutExpired:
+            raise Exception(f"espeak-ng timed out after {config.TTS_ATTEMPT_TIMEOUT_S}s")
+        
+        if result.returncode != 0 or not result.stdout:
+            raise Exception(f"espeak-ng failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+        
+        return result.stdout
+
+
+_providers: Dict[str, TTSProvider] = {}
+
+
+def get_tts_provider(name: str) -> TTSProvider:
+    """Get or create a TTS provider by name"""
+    provider: Optional[TTSProvider] = _providers.get(name)
+    
+    if provider is None:
+        if name == "cartesia":
+            provider = CartesiaProvider()
+        elif name == "piper":
+            provider = PiperProvider(config.PIPER_BINARY)
+        elif name == "espeak":
+            provider = EspeakProvider(config.ESPEAK_BINARY, config.ESPEAK_WORDS_PER_MINUTE)
+        else:
+            raise ValueError(f"Unknown TTS provider: {name}")
+        _providers[name] = provider
+    
+    return provider
+
+
+def get_provider_status() -> Dict[str, Dict[str, bool]]:
+    """Availability and health of every provider used by a default route"""
+    routes = [config.TTS_DEFAULT_ROUTE.split(","), *(speaker["route"] for speaker in config.DEFAULT_SPEAKERS)]
+    names = {name.strip() for route in routes for name in route if name.strip()}
+    return {
+        name: {
+            "available": get_tts_provider(name).available(),
+            "healthy": get_tts_provider(name).healthy()
+        }
+        for name in sorted(names)
+    }
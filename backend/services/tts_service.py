@@ -1,151 +1,335 @@
 """
-Text-to-Speech service using Cartesia and audio merging with pydub
+Text-to-Speech service: provider routing with failover and segment processing with pydub
 """
-import os
-from typing import List, Dict
+import asyncio
+import hashlib
+import io
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
 from pydub import AudioSegment
 import config
-from utils.text import parse_podcast_script
+from db import file_manager
+from db.storage import get_storage
+from services import audio_export, loudness
+from services.tts_providers import Conversation, TTSProvider, get_tts_provider
+from utils.metrics import TTS_REQUEST_SECONDS, TTS_FIRST_AUDIO_SECONDS, TTS_REQUESTS, TTS_FAILOVERS
+from utils.tracing import span
 
 
-async def generate_speech(text: str, voice_id: str, output_path: str) -> str:
+# MP3 frames of separately encoded segments concatenate into one playable
+# stream as long as no per-file headers (ID3 tag, Xing/LAME frame) are written
+MP3_STREAM_PARAMETERS = ["-id3v2_version", "0", "-write_xing", "0"]
+
+
+def get_voice_route(speaker: Dict) -> List[Tuple[TTSProvider, str]]:
     """
-    Generate speech audio using Cartesia TTS
+    Get the providers that can voice a speaker, in order of preference
     
     Args:
-        text: Text to convert to speech
-        voice_id: Cartesia voice ID
-        output_path: Path to save audio file
+        speaker: Speaker of the podcast's roster with voices and route
         
     Returns:
-        Path to generated audio file
+        (provider, voice) pairs of the speaker's route that are available here
+        and have a voice for the speaker
     """
-    try:
-        # Generate audio chunks using Cartesia Sonic-3
-        chunk_iter = config.cartesia_client.tts.bytes(
-            model_id=config.TTS_MODEL,
-            transcript=text,
-            voice={
-                "mode": "id",
-                "id": voice_id,
-            },
-            output_format={
-                "container": config.AUDIO_FORMAT,
-                "sample_rate": config.SAMPLE_RATE,
-                "encoding": config.AUDIO_ENCODING,
-            },
-        )
-        
-        # Write audio chunks to file
-        with open(output_path, "wb") as f:
-            for chunk in chunk_iter:
-                f.write(chunk)
-        
-        return output_path
+    route = []
+    for name in speaker["route"]:
+        name = name.strip()
+        if not name or not speaker["voices"].get(name):
+            continue
         
-    except Exception as e:
-        print(f"Cartesia TTS error: {e}")
-        raise Exception(f"TTS generation failed: {str(e)}")
+        provider = get_tts_provider(name)
+        if provider.available():
+            route.append((provider, speaker["voices"][name]))
+    
+    return route
 
 
-async def create_podcast_audio(script: str, project_id: str) -> tuple[str, int]:
+async def generate_speech(
+    text: str,
+    route: List[Tuple[TTSProvider, str]],
+    podcast_id: str,
+    conversations: Dict[str, Conversation],
+    emotion: Optional[str] = None
+) -> Tuple[str, TTSProvider]:
     """
-    Create complete podcast audio from script
+    Synthesize a line into a podcast's segment audio with the first provider of a route that succeeds
+    
+    Providers skipped after repeated failures are only tried when no other
+    is left. An attempt that fails or takes longer than TTS_ATTEMPT_TIMEOUT_S
+    fails over to the next provider, and the line fails when the last one
+    does, so a hung provider cannot hold up the podcast.
     
     Args:
-        script: Podcast script with Alex/Sam dialogue
-        project_id: Project ID for temp files
+        text: Text to convert to speech
+        route: (provider, voice) pairs from get_voice_route
+        podcast_id: Podcast the audio belongs to
+        conversations: Conversation per provider name, started on first use
+        emotion: Optional emotion of the line (see config.TTS_EMOTIONS)
         
     Returns:
-        Tuple of (final_audio_path, segment_count)
+        Tuple of (storage key of the segment audio, provider used)
     """
-    # Parse script into segments
-    segments = parse_podcast_script(script)
-    
-    if not segments:
-        raise Exception("Failed to parse script into segments")
-    
-    # Generate audio for each segment
-    audio_files = []
-    
-    for i, segment in enumerate(segments):
-        temp_path = os.path.join(config.AUDIO_DIR, f"{project_id}_temp_{i}.wav")
+    candidates = [entry for entry in route if entry[0].healthy()] or route
+    if not candidates:
+        raise Exception("TTS generation failed: no TTS provider available")
+        
+    errors = []
+    for i, (provider, voice) in enumerate(candidates):
+        audio_path = file_manager.get_podcast_segment_path(podcast_id, segment_key(provider, voice, text, emotion))
+        conversation = conversations.get(provider.name)
+        if conversation is None:
+            conversation = conversations[provider.name] = provider.conversation()
         
+        started = time.perf_counter()
         try:
-            # Determine voice ID
-            voice_id = (
-                config.CARTESIA_VOICE_ALEX 
-                if segment["speaker"] == "alex" 
-                else config.CARTESIA_VOICE_SAM
-            )
-            
-            # Generate TTS
-            actual_path = await generate_speech(
-                text=segment["text"],
-                voice_id=voice_id,
-                output_path=temp_path
+            # Providers block while audio arrives; keep the event loop free
+            # for streaming listeners and other requests
+            attempt = asyncio.get_running_loop().run_in_executor(
+                provider.executor(),
+                write_segment,
+                conversation,
+                text,
+                voice,
+                audio_path,
+                emotion
             )
-            audio_files.append(actual_path)
-            
+            await asyncio.wait_for(attempt, config.TTS_ATTEMPT_TIMEOUT_S)
+        
         except Exception as e:
-            print(f"TTS error for segment {i}: {e}")
+            result = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            detail = str(e) or f"no audio after {config.TTS_ATTEMPT_TIMEOUT_S}s"
+            print(f"{provider.name} TTS {result}: {detail}")
+            TTS_REQUESTS.labels(provider.name, result).inc()
+            provider.record_failure()
+            errors.append(f"{provider.name}: {detail}")
+            if result == "timeout":
+                # The line may still be streaming in its thread
+                conversations.pop(provider.name).abort()
+            if i < len(candidates) - 1:
+                TTS_FAILOVERS.labels(provider.name).inc()
             continue
+        
+        TTS_REQUEST_SECONDS.labels(provider.name).observe(time.perf_counter() - started)
+        TTS_REQUESTS.labels(provider.name, "ok").inc()
+        provider.record_success()
+        return audio_path, provider
+    
+    raise Exception(f"TTS generation failed: {'; '.join(errors)}")
+
+
+def fade(pcm: bytes, rising: bool) -> bytes:
+    """Apply a linear fade in or out over the whole of a PCM block"""
+    samples = np.frombuffer(pcm, dtype="<i2")
+    ramp = np.linspace(0.0, 1.0, len(samples), endpoint=False, dtype=np.float32)
+    if not rising:
+        ramp = ramp[::-1]
+    return (samples * ramp).astype("<i2").tobytes()
+
+
+def shape_segment(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Prepare a segment for the podcast while its audio arrives
+    
+    Args:
+        chunks: Segment PCM as it is synthesized
+        
+    Yields:
+        PCM faded in and out, followed by the pause between segments
+    """
+    fade_bytes = int(config.SAMPLE_RATE * config.FADE_DURATION_MS / 1000) * audio_export.PCM_SAMPLE_WIDTH
+    pending = b""
+    faded_in = False
     
-    # Merge audio files
-    final_path = await merge_audio_segments(audio_files, project_id)
+    # Loudness is levelled across the podcast when it is assembled (services/loudness.py)
+    for chunk in chunks:
+        pending += chunk
+        if not faded_in:
+            if len(pending) < 2 * fade_bytes:
+                continue
+            pending = fade(pending[:fade_bytes], rising=True) + pending[fade_bytes:]
+            faded_in = True
     
-    # Cleanup temp files
-    for temp_file in audio_files:
-        try:
-            os.remove(temp_file)
-        except:
-            pass
+        # Hold back the tail, which is faded out once the line is complete
+        ready = len(pending) - fade_bytes
+        ready -= ready % audio_export.PCM_SAMPLE_WIDTH
+        if ready > 0:
+            yield pending[:ready]
+            pending = pending[ready:]
+    
+    pending = pending[:len(pending) - len(pending) % audio_export.PCM_SAMPLE_WIDTH]
+    if not pending:
+        raise Exception("TTS returned no audio")
+    
+    tail = fade_bytes
+    if not faded_in:
+        # Shorter than both fades: fade in over the first half, out over the rest
+        tail = len(pending) // 2 - len(pending) // 2 % audio_export.PCM_SAMPLE_WIDTH
+        head = len(pending) - tail
+        pending = fade(pending[:head], rising=True) + pending[head:]
     
-    return final_path, len(segments)
+    if tail:
+        pending = pending[:-tail] + fade(pending[-tail:], rising=False)
+    
+    pause_frames = int(config.SAMPLE_RATE * config.PAUSE_DURATION_MS / 1000)
+    yield pending + bytes(pause_frames * audio_export.PCM_SAMPLE_WIDTH * audio_export.PCM_CHANNELS)
+
+
+def write_segment(
+    conversation: Conversation,
+    text: str,
+    voice: str,
+    audio_path: str,
+    emotion: Optional[str] = None
+) -> None:
+    """Stream a line's audio from a conversation into segment storage (blocking)"""
+    started = time.perf_counter()
+    
+    def timed(chunks: Iterable[bytes]) -> Iterator[bytes]:
+        first = True
+        for chunk in chunks:
+            if conversation.aborted:
+                raise Exception("Line abandoned after a timeout")
+            if first:
+                TTS_FIRST_AUDIO_SECONDS.labels(conversation.provider.name).observe(time.perf_counter() - started)
+                first = False
+            yield chunk
+    
+    # Storage writes are atomic: a line that fails midway leaves no audio
+    stream = conversation.stream(text, voice, emotion)
+    try:
+        get_storage().put_stream(audio_path, shape_segment(timed(stream)))
+    finally:
+        # Clean up a line given up midway in this thread, not wherever the
+        # generator would be collected (possibly the event loop)
+        stream.close()
+
+
+def encode_stream_mp3(audio_path: str) -> bytes:
+    """Level stored segment audio and encode it as MP3 frames for listeners of a podcast being generated"""
+    pcm = b"".join(get_storage().open_read(audio_path))
+    levelled, _ = loudness.normalize_programme([pcm])
+    audio = AudioSegment(
+        data=levelled,
+        sample_width=audio_export.PCM_SAMPLE_WIDTH,
+        frame_rate=config.SAMPLE_RATE,
+        channels=audio_export.PCM_CHANNELS
+    )
+    
+    buffer = io.BytesIO()
+    audio.export(buffer, format="mp3", bitrate=config.STREAM_BITRATE, parameters=MP3_STREAM_PARAMETERS)
+    return buffer.getvalue()
+
+
+def segment_key(provider: TTSProvider, voice: str, text: str, emotion: Optional[str] = None) -> str:
+    """Content key of a segment's audio: the same line in the same voice sounds the same"""
+    content = f"{provider.model}\n{voice}\n{text}"
+    if emotion and provider.emotions:
+        content += f"\n{emotion}"
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:24]
 
 
-async def merge_audio_segments(audio_files: List[str], project_id: str) -> str:
+def find_segment_audio(
+    route: List[Tuple[TTSProvider, str]],
+    podcast_id: str,
+    text: str,
+    emotion: Optional[str] = None
+) -> Optional[str]:
+    """
+    Find stored audio of a line worth reusing (blocking)
+    
+    Audio of the preferred provider is reused; audio a fallback produced is
+    only reused while the providers before it are being skipped, so lines
+    voiced during an outage are re-synthesized once the provider is back.
+    
+    Returns:
+        Storage key of the audio, or None if the line should be synthesized
     """
-    Merge multiple audio segments into one podcast
+    storage = get_storage()
+    for provider, voice in route:
+        audio_path = file_manager.get_podcast_segment_path(podcast_id, segment_key(provider, voice, text, emotion))
+        if storage.exists(audio_path):
+            return audio_path
+        if provider.healthy():
+            return None
+    
+    return None
+
+
+async def synthesize_segments(
+    segments: List[Dict[str, str]],
+    podcast_id: str,
+    speakers: List[Dict],
+    on_audio: Optional[Callable[[bytes], Awaitable[None]]] = None
+) -> tuple[List[Dict], int]:
+    """
+    Synthesize and store the audio of script segments
+    
+    Segments are processed in order and stored under content keys within
+    the podcast, so audio that already exists (an unchanged line) is reused
+    instead of synthesized again. Each segment's MP3 frames are handed to
+    on_audio as soon as they are ready, so the podcast can be played while
+    the rest is generated. Stored segment audio is raw PCM (see audio_export).
+    
+    Lines go through one conversation per provider (see tts_providers):
+    with Cartesia, a speaker's lines are continuations on one pooled
+    WebSocket connection, and audio is written to the segment as it arrives.
     
     Args:
-        audio_files: List of audio file paths to merge
-        project_id: Project ID for output filename
+        segments: Segments with speaker, text and optional emotion (from llm_service.turn_segments or parse_podcast)
+        podcast_id: Podcast the audio belongs to
+        speakers: Roster of the podcast (see podcast_service.build_roster)
+        on_audio: Optional callback receiving each segment's MP3 frames in order
         
     Returns:
-        Path to final merged audio file
+        Tuple of (segments with audio_path, None where TTS failed; number synthesized)
     """
-    combined = AudioSegment.empty()
-    pause = AudioSegment.silent(duration=config.PAUSE_DURATION_MS)
+    records = []
+    synthesized = 0
+    conversations: Dict[str, Conversation] = {}
+    roster = {speaker["key"]: speaker for speaker in speakers}
     
-    for audio_file in audio_files:
-        try:
-            # Load audio
-            audio = AudioSegment.from_wav(audio_file)
-            
-            # Normalize volume
-            audio = audio.normalize()
-            
-            # Add fade in/out
-            audio = audio.fade_in(
-                duration=config.FADE_DURATION_MS
-            ).fade_out(
-                duration=config.FADE_DURATION_MS
-            )
-            
-            # Add to combined with pause
-            combined += audio + pause
+    try:
+        for i, segment in enumerate(segments):
+            records.append({**segment, "audio_path": None})
+        
+            try:
+                if segment["speaker"] not in roster:
+                    raise Exception(f"{segment['speaker']} is not a speaker of this podcast")
+                
+                route = get_voice_route(roster[segment["speaker"]])
+                audio_path = await asyncio.to_thread(
+                    find_segment_audio,
+                    route,
+                    podcast_id,
+                    segment["text"],
+                    segment.get("emotion")
+                )
+                if not audio_path:
+                    # Generate TTS, streamed into the segment's audio
+                    with span("tts.segment", index=i, chars=len(segment["text"])) as tts_span:
+                        audio_path, provider = await generate_speech(
+                            segment["text"],
+                            route,
+                            podcast_id,
+                            conversations,
+                            segment.get("emotion")
+                        )
+                        if tts_span is not None:
+                            tts_span["attributes"]["provider"] = provider.name
+                    synthesized += 1
+                    
+            except Exception as e:
+                print(f"TTS error for segment {i}: {e}")
+                continue
+                
+            records[-1]["audio_path"] = audio_path
+            if on_audio:
+                await on_audio(await asyncio.to_thread(encode_stream_mp3, audio_path))
             
-        except Exception as e:
-            print(f"Error loading audio {audio_file}: {e}")
-    
-    # Export final podcast
-    final_path = os.path.join(config.AUDIO_DIR, f"{project_id}_podcast.mp3")
-    combined.export(
-        final_path,
-        format="mp3",
-        bitrate=config.EXPORT_BITRATE,
-        parameters=["-q:a", "0"]
-    )
+    finally:
+        for conversation in conversations.values():
+            await asyncio.get_running_loop().run_in_executor(conversation.provider.executor(), conversation.close)
     
-    return final_path
+    return records, synthesized
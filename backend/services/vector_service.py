@@ -1,11 +1,24 @@
 """
 FAISS vector store service for semantic search
 """
+import os
+import time
+from collections import OrderedDict
 import faiss
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Optional, Sequence
 import config
-from db.file_manager import get_faiss_index_path
+from db.storage import get_storage, get_local_path, new_scratch_path
+from utils.metrics import FAISS_INDEX_LOADS, FAISS_INDEXES_OPEN
+from utils.tracing import span, traced
+
+# Map flat index vectors straight from the file instead of copying them into
+# process memory; the page cache is then shared by every worker on the host
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+# Open indexes by storage key with the (size, mtime) they were mapped at and
+# when that was last checked against storage, LRU order
+_index_cache: "OrderedDict[str, tuple[tuple[int, int], faiss.Index, float]]" = OrderedDict()
 
 
 def build_faiss_index(chunks: List[Dict[str, any]]) -> tuple[faiss.Index, np.ndarray]:
@@ -22,80 +35,174 @@ def build_faiss_index(chunks: List[Dict[str, any]]) -> tuple[faiss.Index, np.nda
     chunk_texts = [c["text"] for c in chunks]
     
     # Generate embeddings
-    embeddings = config.embedder.encode(chunk_texts, show_progress_bar=True)
+    with span("embedding.encode", chunks=len(chunk_texts)):
+        embeddings = config.embedder.encode(chunk_texts, show_progress_bar=True)
     
     # Create FAISS index
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings.astype('float32'))
+    with span("faiss.build"):
+        dimension = embeddings.shape[1]
+        index = faiss.IndexFlatL2(dimension)
+        index.add(embeddings.astype('float32'))
     
     return index, embeddings
 
 
-def save_faiss_index(index: faiss.Index, project_id: str) -> str:
+@traced("faiss.save")
+def save_faiss_index(index: faiss.Index, index_path: str) -> str:
     """
-    Save FAISS index to disk
+    Save FAISS index to storage
     
     Args:
         index: FAISS index to save
-        project_id: Project ID for filename
+        index_path: Storage key to save the index under
         
     Returns:
         Path where index was saved
     """
-    index_path = get_faiss_index_path(project_id)
-    faiss.write_index(index, index_path)
+    # Write locally, then hand the file to the storage backend
+    local_path = new_scratch_path(suffix=".faiss")
+    try:
+        faiss.write_index(index, local_path)
+        get_storage().put_file(index_path, local_path)
+    finally:
+        os.remove(local_path)
+    
     return index_path
 
 
+@traced("faiss.load")
 def load_faiss_index(index_path: str) -> faiss.Index:
     """
-    Load FAISS index from disk
+    Load FAISS index from storage, memory-mapped and cached per worker
     
     Args:
-        index_path: Path to saved index
+        index_path: Storage key of saved index
         
     Returns:
-        Loaded FAISS index
+        Loaded FAISS index (read-only)
     """
-    return faiss.read_index(index_path)
+    # Storage is only asked (a HEAD request on S3) once the entry is due for revalidation
+    cached = _index_cache.get(index_path)
+    if cached and time.monotonic() - cached[2] < config.FAISS_INDEX_REVALIDATE_S:
+        _index_cache.move_to_end(index_path)
+        FAISS_INDEX_LOADS.labels("hit").inc()
+        return cached[1]
+    
+    # Remote backends serve this from the local read-through cache
+    local_path = get_local_path(index_path)
+    stat = os.stat(local_path)
+    version = (stat.st_size, stat.st_mtime_ns)
+    
+    if cached and cached[0] == version:
+        _index_cache[index_path] = (version, cached[1], time.monotonic())
+        _index_cache.move_to_end(index_path)
+        FAISS_INDEX_LOADS.labels("hit").inc()
+        return cached[1]
+    
+    # Files are replaced atomically, so a mapping stays valid after an update
+    index = faiss.read_index(local_path, MMAP_FLAGS)
+    _index_cache[index_path] = (version, index, time.monotonic())
+    _index_cache.move_to_end(index_path)
+    while len(_index_cache) > config.FAISS_INDEX_CACHE_SIZE:
+        _index_cache.popitem(last=False)
+    
+    FAISS_INDEX_LOADS.labels("miss").inc()
+    FAISS_INDEXES_OPEN.set(len(_index_cache))
+    return index
+
+
+def evict_faiss_index(index_path: str) -> None:
+    """Unmap a cached index (e.g. before its file is deleted)"""
+    if _index_cache.pop(index_path, None) is not None:
+        FAISS_INDEXES_OPEN.set(len(_index_cache))
+
+
+def embed_query(query: str) -> np.ndarray:
+    """Encode a search query with the embedding model of the indexes"""
+    with span("embedding.query"):
+        return config.embedder.encode([query])[0]
+
+
+def query_similarity(a: Sequence[float], b: Sequence[float]) -> float:
+    """Cosine similarity of two query embeddings"""
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    norm = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(np.dot(a, b)) / norm if norm else 0.0
 
 
 def search_similar_chunks(
     index: faiss.Index,
-    chunks: List[Dict[str, any]],
+    chunks: Sequence[Dict[str, any]],
     query: str,
-    top_k: int = 3
+    top_k: int = 3,
+    query_embedding: Optional[np.ndarray] = None
 ) -> List[Dict[str, any]]:
     """
     Search for similar chunks using FAISS
     
     Args:
         index: FAISS index
-        chunks: Original chunks with metadata
+        chunks: Original chunks with metadata (list or ChunkStore; only hits are read)
         query: Search query
         top_k: Number of results to return
+        query_embedding: Embedding of the query, if already computed (see embed_query)
         
     Returns:
         List of relevant chunks with relevance scores
     """
-    # Encode query
-    query_embedding = config.embedder.encode([query])[0]
+    if query_embedding is None:
+        query_embedding = embed_query(query)
     
     # Search FAISS
-    distances, indices = index.search(
-        query_embedding.reshape(1, -1).astype('float32'),
-        top_k
-    )
+    with span("faiss.search", top_k=top_k):
+        distances, indices = index.search(
+            query_embedding.reshape(1, -1).astype('float32'),
+            top_k
+        )
     
     # Build results with relevance scores
     results = []
     for idx, distance in zip(indices[0], distances[0]):
+        # FAISS pads with -1 when top_k exceeds the number of vectors
+        if idx < 0:
+            continue
+        
         chunk = chunks[idx]
         results.append({
             "text": chunk["text"],
             "page": chunk["page"],
+            "boxes": chunk.get("boxes", []),
+            "chunk_index": int(idx),
             "relevance_score": float(1 / (1 + distance))  # Convert distance to similarity
         })
     
     return results
+
+
+def get_chunks_by_hits(
+    chunks: Sequence[Dict[str, any]],
+    hits: List[Dict[str, any]]
+) -> List[Dict[str, any]]:
+    """
+    Rebuild search results from previously retrieved chunk indexes
+    
+    Args:
+        chunks: Original chunks with metadata
+        hits: Cached hits with chunk_index and relevance_score
+        
+    Returns:
+        List of chunks in the same format as search_similar_chunks
+    """
+    results = []
+    for hit in hits:
+        chunk = chunks[hit["chunk_index"]]
+        results.append({
+            "text": chunk["text"],
+            "page": chunk["page"],
+            "boxes": chunk.get("boxes", []),
+            "chunk_index": hit["chunk_index"],
+            "relevance_score": hit["relevance_score"]
+        })
+    
+    return results
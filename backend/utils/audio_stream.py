@@ -0,0 +1,61 @@
+"""
+In-memory audio stream for progressive delivery of a file being generated
+"""
+import asyncio
+from typing import AsyncIterator, List, Optional
+
+
+class AudioStream:
+    """
+    Growing buffer of encoded audio
+    
+    The producer appends chunks in playback order and then finishes the
+    stream. Every listener replays it from the first chunk and waits for
+    new ones, so listeners joining late still receive the whole file.
+    """
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.error: Optional[str] = None
+        self._changed = asyncio.Condition()
+
+    async def append(self, chunk: bytes) -> None:
+        """Add the next chunk and wake up listeners"""
+        async with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def finish(self, error: Optional[str] = None) -> None:
+        """Mark the stream complete (or failed) and wake up listeners"""
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        """
+        Yield all chunks from the start, waiting for new ones until the stream is done
+        
+        Yields:
+            Encoded audio chunks in playback order
+        
+        Raises:
+            Exception: If the stream finished with an error
+        """
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self.chunks) or self.done)
+                chunks = self.chunks[index:]
+                done = self.done
+            
+            for chunk in chunks:
+                yield chunk
+            index += len(chunks)
+            
+            if done and index == len(self.chunks):
+                if self.error:
+                    # Abort the response so listeners can tell it from a complete file
+                    raise Exception(f"Podcast generation failed: {self.error}")
+                return
@@ -0,0 +1,157 @@
+"""
+HTTP file delivery with ETags, conditional requests and byte ranges
+
+ETags are the storage backend's validators (see StoredObject): opaque
+values that change with the content, compared byte for byte.
+"""
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+import config
+from db.storage import get_storage
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range
+    
+    Args:
+        header: Range header value (e.g. "bytes=0-1023")
+        size: Total file size
+    
+    Returns:
+        Inclusive (start, end) tuple, or None if the range is not satisfiable
+    
+    Raises:
+        ValueError: If the header is malformed or asks for multiple ranges
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        raise ValueError(f"Unsupported range: {header}")
+    
+    start, end = match.groups()
+    if not start and not end:
+        raise ValueError(f"Unsupported range: {header}")
+    
+    if not start:
+        # Suffix range: last N bytes
+        length = int(end)
+        if length == 0:
+            return None
+        return max(size - length, 0), size - 1
+    
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    
+    if start >= size or start > end:
+        return None
+    
+    return start, end
+
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    
+    return False
+
+
+def range_allowed(request: Request, etag: str, last_modified: str) -> bool:
+    """Evaluate If-Range: serve the range only if the representation is unchanged"""
+    if_range = request.headers.get("if-range")
+    if not if_range:
+        return True
+    
+    return if_range.strip() in (etag, last_modified)
+
+
+def file_response(
+    request: Request,
+    key: str,
+    media_type: str,
+    immutable: bool = False
+) -> Response:
+    """
+    Serve a stored file with HTTP caching and byte-range support
+    
+    Args:
+        request: Incoming request (for conditional and Range headers)
+        key: Storage key of the file
+        media_type: Content type
+        immutable: File content never changes under this URL
+    
+    Returns:
+        200, 206, 304 or 416 response
+    """
+    storage = get_storage()
+    stored = storage.stat(key)
+    if stored is None:
+        raise FileNotFoundError(key)
+    
+    size = stored.size
+    etag = stored.etag
+    last_modified = formatdate(stored.mtime, usegmt=True)
+    
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": (
+            f"public, max-age={config.IMMUTABLE_MAX_AGE_S}, immutable"
+            if immutable else "no-cache"
+        ),
+    }
+    
+    if is_not_modified(request, etag, stored.mtime):
+        return Response(status_code=304, headers=headers)
+    
+    range_header = request.headers.get("range")
+    byte_range = (0, size - 1)
+    partial = False
+    
+    if range_header and range_allowed(request, etag, last_modified):
+        try:
+            byte_range = parse_range(range_header, size)
+            partial = True
+        except ValueError:
+            # Malformed or multi-range requests get the full file
+            byte_range = (0, size - 1)
+    
+    if byte_range is None:
+        return Response(
+            status_code=416,
+            headers={**headers, "Content-Range": f"bytes */{size}"}
+        )
+    
+    if partial:
+        start, end = byte_range
+        return StreamingResponse(
+            storage.open_read(key, start, end),
+            status_code=206,
+            media_type=media_type,
+            headers={
+                **headers,
+                "Content-Range": f"bytes {start}-{end}/{size}",
+                "Content-Length": str(end - start + 1),
+            }
+        )
+    
+    return StreamingResponse(
+        storage.open_read(key),
+        media_type=media_type,
+        headers={**headers, "Content-Length": str(size)}
+    )
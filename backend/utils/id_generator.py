@@ -23,3 +23,13 @@ def generate_podcast_id() -> str:
         Unique podcast ID string
     """
     return str(uuid.uuid4())
+
+
+def generate_session_id() -> str:
+    """
+    Generate unique chat session ID
+    
+    Returns:
+        Unique chat session ID string
+    """
+    return f"session_{uuid.uuid4().hex}"
@@ -0,0 +1,186 @@
+"""
+Prometheus metrics shared across services
+"""
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+
+# ========== HTTP & Pipeline Stages ==========
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Latency of HTTP requests",
+    ["method", "route", "status"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+)
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_duration_seconds",
+    "Latency of pipeline stages (PDF, embedding, FAISS, Gemini, TTS, audio, Mongo)",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+
+STAGE_TOTAL = Counter(
+    "pipeline_stage_total",
+    "Pipeline stage executions by outcome",
+    ["stage", "outcome"]
+)
+
+# ========== LLM Gateway ==========
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds",
+    "Latency of Gemini calls including retries",
+    ["operation", "outcome"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+)
+
+LLM_ATTEMPT_SECONDS = Histogram(
+    "llm_attempt_duration_seconds",
+    "Latency of individual Gemini attempts",
+    ["operation"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+)
+
+LLM_TOKENS = Histogram(
+    "llm_tokens",
+    "Tokens per Gemini call",
+    ["operation", "kind"],
+    buckets=(64, 256, 1024, 4096, 16384, 32768, 65536, 131072)
+)
+
+LLM_RETRIES = Counter(
+    "llm_retries_total",
+    "Gemini attempts retried after a transient error or invalid structured output",
+    ["operation", "reason"]
+)
+
+LLM_COALESCED = Counter(
+    "llm_coalesced_total",
+    "Gemini calls served by an identical in-flight request",
+    ["operation"]
+)
+
+LLM_RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "llm_rate_limit_wait_seconds",
+    "Time spent waiting for the rate limiter and concurrency slots",
+    ["operation"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30)
+)
+
+LLM_INFLIGHT = Gauge(
+    "llm_inflight_requests",
+    "Gemini requests currently being executed"
+)
+
+LLM_STRUCTURED_OUTPUTS = Counter(
+    "llm_structured_outputs_total",
+    "Structured Gemini outputs by operation and result (valid, repaired, salvaged, failed)",
+    ["operation", "result"]
+)
+
+# ========== Vector Index ==========
+FAISS_INDEX_LOADS = Counter(
+    "faiss_index_loads_total",
+    "FAISS index lookups by result (hit: already mapped in this worker)",
+    ["result"]
+)
+
+FAISS_INDEXES_OPEN = Gauge(
+    "faiss_indexes_open",
+    "Memory-mapped FAISS indexes held open by this worker"
+)
+
+
+# ========== Podcast ==========
+PODCAST_FIRST_AUDIO_SECONDS = Histogram(
+    "podcast_time_to_first_audio_seconds",
+    "Time from the start of a podcast job until its first audio can be streamed",
+    buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
+)
+
+PODCAST_SCRIPT_LINES = Counter(
+    "podcast_script_lines_total",
+    "Lines of LLM-written scripts by operation and result (dialogue, invalid)",
+    ["operation", "result"]
+)
+
+# ========== TTS ==========
+TTS_REQUEST_SECONDS = Histogram(
+    "tts_request_duration_seconds",
+    "Time to synthesize one line by provider",
+    ["provider"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+)
+
+TTS_REQUESTS = Counter(
+    "tts_requests_total",
+    "TTS attempts by provider and result (ok, error, timeout)",
+    ["provider", "result"]
+)
+
+TTS_FIRST_AUDIO_SECONDS = Histogram(
+    "tts_first_audio_seconds",
+    "Time from sending a line to its first audio chunk, by provider",
+    ["provider"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 2, 4, 8)
+)
+
+TTS_CONNECTIONS = Counter(
+    "tts_websocket_connections_total",
+    "Cartesia WebSocket connections by event (opened, reused, expired, discarded)",
+    ["event"]
+)
+
+TTS_FAILOVERS = Counter(
+    "tts_failovers_total",
+    "Lines handed to the next provider of their route, by the provider that failed",
+    ["provider"]
+)
+
+# ========== Audio Export ==========
+AUDIO_ENCODE_SECONDS = Histogram(
+    "audio_encode_duration_seconds",
+    "Time to encode a podcast rendition from its master",
+    ["format", "bitrate"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+)
+
+AUDIO_RENDITION_BYTES = Histogram(
+    "audio_rendition_bytes",
+    "Size of encoded podcast renditions",
+    ["format", "bitrate"],
+    buckets=(250e3, 500e3, 1e6, 2.5e6, 5e6, 10e6, 25e6, 50e6, 100e6)
+)
+
+AUDIO_RENDITION_REQUESTS = Counter(
+    "audio_rendition_requests_total",
+    "Podcast audio requests by format and whether the rendition was cached",
+    ["format", "result"]
+)
+
+# ========== OCR ==========
+OCR_PAGES = Counter(
+    "ocr_pages_total",
+    "Scanned pages by OCR result (ocr, cached, failed, timeout, unavailable)",
+    ["result"]
+)
+
+OCR_PAGE_SECONDS = Histogram(
+    "ocr_page_duration_seconds",
+    "Tesseract time per page in an OCR worker",
+    buckets=(0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+)
+
+OCR_PAGES_PER_SECOND = Gauge(
+    "ocr_pages_per_second",
+    "OCR throughput of the last PDF with scanned pages (wall clock, all workers)"
+)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Render all metrics in Prometheus text format
+    
+    Returns:
+        Tuple of (payload, content_type)
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,66 @@
+"""
+Single-flight execution: concurrent callers with the same key share one run
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent async calls by key
+    
+    The first caller for a key starts the work as a task; callers arriving
+    while it is in flight await the same task instead of starting another.
+    The task is shielded so a cancelled caller does not cancel the others.
+    """
+    
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+    
+    def start(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]]
+    ) -> tuple[asyncio.Task, bool]:
+        """
+        Start fn for key, or get the task already running for it
+        
+        Callbacks added to a started task run right after the task leaves
+        the in-flight set, before any other caller can start a new one.
+        
+        Args:
+            key: Deduplication key
+            fn: Zero-argument coroutine function producing the result
+        
+        Returns:
+            Tuple of (task, shared) where shared is True if the task was
+            already running
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            return task, True
+        
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task, False
+    
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]]
+    ) -> tuple[Any, bool]:
+        """
+        Run fn once per key among concurrent callers
+        
+        Args:
+            key: Deduplication key
+            fn: Zero-argument coroutine function producing the result
+        
+        Returns:
+            Tuple of (result, shared) where shared is True for callers
+            that attached to an already running task
+        """
+        task, shared = self.start(key, fn)
+        result = await asyncio.shield(task)
+        return result, shared
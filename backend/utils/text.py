@@ -2,47 +2,173 @@
 Text processing utilities
 """
 import re
-from typing import List, Dict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 import config
 
 
-def parse_podcast_script(script: str) -> List[Dict[str, str]]:
+# Markdown around speaker names: list bullets, quotes, numbering, emphasis
+SPEAKER_PREFIX = r"(?:[>+\-]\s*|\*\s+|\d+[.)]\s+)*[*_]*"
+# Emphasis, an optional (direction), the colon and emphasis closed after it
+SPEAKER_DIRECTION = r"[*_]*\s*(?:\((?P<direction>[^)\n]*)\))?"
+SPEAKER_COLON = r"\s*[*_]*\s*:(?:[*_]+(?=\s|$))?\s*"
+SPEAKER_SUFFIX = r"[*_]*\s*(?:\([^)\n]*\))?" + SPEAKER_COLON
+
+# Stage directions and markdown emphasis inside dialogue; emphasis is only
+# paired markers around text ("**really**", "_so_"), so "3*4" and
+# "__init__" are left as they are
+STAGE_DIRECTION_PATTERN = re.compile(r'\[.*?\]')
+EMPHASIS_PATTERN = re.compile(r'(?<!\w)(\*{1,3}|_)(?=[^\s*_])(.+?)(?<=[^\s*_])\1(?!\w)')
+
+
+def speaker_key(name: str) -> str:
+    """Key of a speaker in segments and voice maps (lowercased name)"""
+    return " ".join(name.split()).lower()
+
+
+@lru_cache(maxsize=64)
+def script_line_pattern(names: Tuple[str, ...]) -> re.Pattern:
+    """
+    Compile the pattern classifying podcast script lines for a roster
+    
+    Args:
+        names: Speaker names of the podcast
+    
+    Returns:
+        Pattern matching a line with one of the groups chapter, speaker
+        (with direction and text, possibly empty), other (a speaker not in
+        the roster) or none of them (headings, rules, stage directions)
+    """
+    alternation = "|".join(
+        r"\s+".join(re.escape(part) for part in name.split())
+        for name in sorted(names, key=len, reverse=True)
+    )
+    return re.compile(
+        rf"""^\s*(?:
+            (?:\#+\s*)?\**chapter\b[^:\n]*:\s*(?P<chapter>.+?)\**
+          | {SPEAKER_PREFIX}(?P<speaker>{alternation}){SPEAKER_DIRECTION}(?:{SPEAKER_COLON}(?P<text>.*?)|[*_]*)
+          | {SPEAKER_PREFIX}(?P<other>[^\W\d_][\w.' -]{{0,{config.MAX_SPEAKER_NAME_LENGTH}}}?){SPEAKER_SUFFIX}\S.*?
+          | \#.* | [-*_=]{{3,}} | \[[^\]]*\] | \([^)]*\) | [*_]+[^*_]+[*_]+
+        )\s*$""",
+        re.IGNORECASE | re.VERBOSE
+    )
+
+
+def script_line(name: str, text: str, emotion: Optional[str] = None) -> str:
+    """Format a line of dialogue as stored in podcast scripts"""
+    return f"{name} ({emotion}): {text}" if emotion else f"{name}: {text}"
+
+
+def clean_dialogue(text: str) -> str:
+    """Remove stage directions and markdown emphasis from a line of dialogue"""
+    return clean_text(EMPHASIS_PATTERN.sub(r'\2', STAGE_DIRECTION_PATTERN.sub('', text)))
+
+
+def parse_podcast(script: str, speakers: Optional[List[str]] = None) -> Dict[str, List[Dict]]:
+    """
+    Parse a podcast script into chapters of dialogue in a single pass
+    
+    Each line is classified by one compiled pattern. Dialogue is recognized
+    in the markdown variants LLMs produce ("**Alex:**", "- *Sam*:",
+    "> ALEX (laughing):", a name on its own line before its text), and a
+    line without speaker right after dialogue continues it. A direction
+    naming one of config.TTS_EMOTIONS ("Sam (curious):") sets the line's
+    emotion. Lines that are neither dialogue of a known speaker nor markup
+    are reported as dropped.
+    
+    Args:
+        script: Raw script text, optionally with "CHAPTER: <title>" lines
+        speakers: Speaker names of the podcast (default: config.DEFAULT_SPEAKERS)
+    
+    Returns:
+        Dict with chapters (title, script as "Name: text" lines, segments with
+        speaker key, text and emotion if any; chapters without dialogue are left out) and
+        dropped lines (line and reason: unknown_speaker or unformatted)
+    """
+    names = speakers or [speaker["name"] for speaker in config.DEFAULT_SPEAKERS]
+    display_names = {speaker_key(name): name for name in names}
+    pattern = script_line_pattern(tuple(names))
+    
+    chapters = [{"title": None, "segments": []}]
+    dropped = []
+    current = None  # Segment that lines without speaker continue
+    
+    for line in script.split('\n'):
+        if not line.strip():
+            # A blank line ends a speech, but not a name waiting for its text
+            if current is not None and current["text"]:
+                current = None
+            continue
+        
+        match = pattern.match(line)
+        if match and match.group("chapter"):
+            chapters.append({"title": match.group("chapter").strip(), "segments": []})
+            current = None
+        elif match and match.group("speaker"):
+            current = {
+                "speaker": speaker_key(match.group("speaker")),
+                "text": clean_dialogue(match.group("text") or "")
+            }
+            emotion = (match.group("direction") or "").strip().lower()
+            if emotion in config.TTS_EMOTIONS:
+                current["emotion"] = emotion
+            chapters[-1]["segments"].append(current)
+        elif match and match.group("other"):
+            dropped.append({"line": line.strip(), "reason": "unknown_speaker"})
+            current = None
+        elif match:
+            continue
+        elif current is not None:
+            current["text"] = clean_text(f"{current['text']} {clean_dialogue(line)}")
+        else:
+            dropped.append({"line": line.strip(), "reason": "unformatted"})
+    
+    parsed = []
+    for chapter in chapters:
+        segments = [segment for segment in chapter["segments"] if segment["text"]]
+        if not segments:
+            continue
+        
+        # Dialogue before the first chapter line opens the episode
+        title = chapter["title"] or ("Full episode" if len(chapters) == 1 else "Introduction")
+        script_lines = [
+            script_line(display_names[segment["speaker"]], segment["text"], segment.get("emotion"))
+            for segment in segments
+        ]
+        parsed.append({"title": title, "script": "\n".join(script_lines), "segments": segments})
+    
+    return {"chapters": parsed, "dropped": dropped}
+
+
+def parse_podcast_script(script: str, speakers: Optional[List[str]] = None) -> List[Dict[str, str]]:
     """
     Parse podcast script into speaker segments
     
     Args:
-        script: Raw script text with Alex/Sam dialogue
+        script: Raw script text with dialogue of the speakers
+        speakers: Speaker names of the podcast (default: config.DEFAULT_SPEAKERS)
         
     Returns:
         List of segments with speaker and text
     """
-    segments = []
-    lines = script.strip().split('\n')
+    return [
+        segment
+        for chapter in parse_podcast(script, speakers)["chapters"]
+        for segment in chapter["segments"]
+    ]
+
+
+def join_podcast_chapters(chapters: List[Dict]) -> str:
+    """
+    Build the full script of a chaptered podcast
     
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
+    Args:
+        chapters: Chapters with title and script
         
-        # Match pattern: "Alex: text" or "Sam: text"
-        match = re.match(r'^(Alex|Sam):\s*(.+)$', line, re.IGNORECASE)
-        if match:
-            speaker = match.group(1).lower()
-            text = match.group(2).strip()
-            
-            # Remove stage directions in brackets
-            text = re.sub(r'\[.*?\]', '', text)
-            
-            # Clean up whitespace
-            text = re.sub(r'\s+', ' ', text).strip()
-            
-            if text:
-                segments.append({
-                    "speaker": speaker,
-                    "text": text
-                })
-    
-    return segments
+    Returns:
+        Script with a "CHAPTER: <title>" line before each chapter
+    """
+    return "\n\n".join(f"CHAPTER: {c['title']}\n{c['script']}" for c in chapters)
 
 
 def clean_text(text: str) -> str:
@@ -64,6 +190,35 @@ def clean_text(text: str) -> str:
     return text
 
 
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query for cache lookups
+    
+    Args:
+        query: Raw query text
+        
+    Returns:
+        Lowercased query with collapsed whitespace and no trailing punctuation
+    """
+    return clean_text(query).lower().rstrip("?!. ")
+
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens the way word-piece tokenizers split text (words and punctuation)
+    
+    Args:
+        text: Text to measure
+        
+    Returns:
+        Approximate number of tokens
+    """
+    return sum(1 for _ in TOKEN_PATTERN.finditer(text))
+
+
 def truncate_text(text: str, max_length: int = 200, suffix: str = "...") -> str:
     """
     Truncate text to maximum length
@@ -0,0 +1,170 @@
+"""
+Lightweight request tracing: per-request traces with nested, timed spans
+"""
+import asyncio
+import functools
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+import config
+from utils.metrics import STAGE_SECONDS, STAGE_TOTAL
+
+
+class Trace:
+    """A request trace collecting the spans recorded while it is active"""
+
+    def __init__(self, name: str, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.name = name
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.status: Optional[int] = None
+        self.spans: List[Dict[str, Any]] = []
+
+    def offset_ms(self) -> float:
+        """Milliseconds elapsed since the trace started"""
+        return (time.perf_counter() - self.started) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize trace for the API"""
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "spans": self.spans
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[int]] = ContextVar("current_span", default=None)
+
+# Recently finished traces, oldest first
+_recent_traces: "OrderedDict[str, Trace]" = OrderedDict()
+
+
+def start_trace(name: str, trace_id: Optional[str] = None) -> Trace:
+    """
+    Start a trace and make it current for this context
+    
+    Args:
+        name: Trace name (e.g. "POST /generate_podcast")
+        trace_id: Optional incoming trace ID to continue
+    
+    Returns:
+        The new trace
+    """
+    trace = Trace(name, trace_id)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def finish_trace(trace: Trace, status: Optional[int] = None) -> None:
+    """
+    Finish a trace and keep it in the recent traces buffer
+    
+    Args:
+        trace: Trace to finish
+        status: Optional HTTP status code
+    """
+    trace.duration_ms = trace.offset_ms()
+    trace.status = status
+    
+    _recent_traces[trace.trace_id] = trace
+    while len(_recent_traces) > config.TRACE_HISTORY_SIZE:
+        _recent_traces.popitem(last=False)
+    
+    if trace.duration_ms >= config.TRACE_SLOW_REQUEST_MS:
+        breakdown = ", ".join(
+            f"{s['name']}={s['duration_ms'] or 0:.0f}ms" for s in trace.spans
+        )
+        print(f"Slow request {trace.name} [{trace.trace_id}] {trace.duration_ms:.0f}ms: {breakdown}")
+
+
+def get_current_trace() -> Optional[Trace]:
+    """Get the trace active in this context"""
+    return _current_trace.get()
+
+
+def get_trace(trace_id: str) -> Optional[Trace]:
+    """Get a recently finished trace by ID"""
+    return _recent_traces.get(trace_id)
+
+
+def get_recent_traces(limit: int = 50) -> List[Trace]:
+    """Get recently finished traces, newest first"""
+    return list(reversed(_recent_traces.values()))[:limit]
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """
+    Time a pipeline stage, record its metrics and attach it to the current trace
+    
+    Args:
+        stage: Stage name (e.g. "pdf.chunk", "tts.segment")
+        **attributes: Extra attributes stored on the span
+    """
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    record = None
+    token = None
+    
+    if trace is not None:
+        record = {
+            "id": len(trace.spans),
+            "parent": parent,
+            "name": stage,
+            "start_ms": trace.offset_ms(),
+            "duration_ms": None,
+            "attributes": attributes
+        }
+        trace.spans.append(record)
+        token = _current_span.set(record["id"])
+    
+    started = time.perf_counter()
+    outcome = "success"
+    try:
+        yield record
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        STAGE_TOTAL.labels(stage, outcome).inc()
+        
+        if record is not None:
+            record["duration_ms"] = elapsed * 1000
+            record["outcome"] = outcome
+            _current_span.reset(token)
+
+
+def traced(stage: str):
+    """
+    Decorator running a sync or async function inside a span
+    
+    Args:
+        stage: Stage name for the span
+    """
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    
+    return decorator
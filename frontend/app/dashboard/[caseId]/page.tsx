@@ -109,7 +109,7 @@ export default function CasePage() {
 
               <TabsContent value="pdf" className="flex-1 flex flex-col mt-4 overflow-hidden px-4 sm:px-6 lg:px-8 pb-8">
                 <PDFViewer 
-                  pdfUrl={api.getPDFUrl(pdfFilename)} 
+                  pdfUrl={api.getPDFUrl(caseId, pdfFilename)} 
                   fileName={pdfFilename}
                 />
               </TabsContent>
@@ -29,10 +29,27 @@ export interface Podcast {
   created_at: string;
   topic?: string;
   duration: string;
+  speakers?: PodcastSpeaker[];
   script: string;
   audio_path: string;
   audio_filename: string;
   segments_count: number;
+  chapters?: PodcastChapter[];
+}
+
+/**
+ * Speaker of a podcast; role and voices default to those of the built-in hosts
+ */
+export interface PodcastSpeaker {
+  name: string;
+  role?: string;
+  voices?: Record<string, string>;  // TTS provider -> voice (one the server is configured with)
+  route?: string[];                 // TTS providers in order of preference
+}
+
+export interface PodcastChapter {
+  title: string;
+  script: string;
 }
 
 export interface ChatMessage {
@@ -40,11 +57,33 @@ export interface ChatMessage {
   content: string;
   references?: Array<{
     page: number;
+    boxes: PageBox[];
     text_preview: string;
     relevance: number;
   }>;
 }
 
+// [page, x0, y0, x1, y1] in PDF points
+export type PageBox = [number, number, number, number, number];
+
+export interface PageLayout {
+  page: number;
+  width: number;
+  height: number;
+  text: string;
+  blocks: Array<{
+    text: string;
+    page: number;
+    size: number;
+    bold: boolean;
+    lines: number;
+    bbox: [number, number, number, number];
+    line_boxes: Array<[number, [number, number, number, number]]>;
+  }>;
+  // [x0, y0, x1, y1, word, block_no, line_no, word_no]
+  words: Array<[number, number, number, number, string, number, number, number]>;
+}
+
 // ========== API Functions ==========
 
 /**
@@ -153,6 +192,7 @@ export async function chatWithPDF(
   answer: string;
   references: Array<{
     page: number;
+    boxes: PageBox[];
     text_preview: string;
     relevance: number;
   }>;
@@ -181,12 +221,14 @@ export async function chatWithPDF(
 export async function generatePodcast(
   projectId: string,
   topic?: string,
-  duration: 'short' | 'medium' | 'long' = 'medium'
+  duration: 'short' | 'medium' | 'long' = 'medium',
+  speakers?: PodcastSpeaker[]
 ): Promise<{
   status: string;
   podcast_id: string;
   podcast_url: string;
   script: string;
+  speakers: string[];
   segments_count: number;
 }> {
   const response = await fetch(`${API_BASE_URL}/generate_podcast`, {
@@ -196,6 +238,7 @@ export async function generatePodcast(
       project_id: projectId,
       topic,
       duration,
+      speakers,
     }),
   });
   
@@ -207,6 +250,118 @@ export async function generatePodcast(
   return response.json();
 }
 
+/**
+ * Start podcast generation; audio can be played from stream_url right away
+ */
+export async function startPodcastStream(
+  projectId: string,
+  topic?: string,
+  duration: 'short' | 'medium' | 'long' = 'medium',
+  speakers?: PodcastSpeaker[]
+): Promise<{
+  status: string;
+  podcast_id: string;
+  stream_url: string;
+  deduplicated: boolean;
+}> {
+  const response = await fetch(`${API_BASE_URL}/generate_podcast/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({
+      project_id: projectId,
+      topic,
+      duration,
+      speakers,
+    }),
+  });
+  
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to start podcast');
+  }
+  
+  return response.json();
+}
+
+/**
+ * Get the streaming audio URL of a podcast (works during and after generation)
+ */
+export function getPodcastStreamUrl(podcastId: string): string {
+  return `${API_BASE_URL}/podcasts/${podcastId}/stream`;
+}
+
+/**
+ * Get the audio URL of one podcast chapter
+ */
+export function getChapterAudioUrl(podcastId: string, chapterIndex: number): string {
+  return `${API_BASE_URL}/podcasts/${podcastId}/chapters/${chapterIndex}/audio`;
+}
+
+/**
+ * Rewrite one chapter of a podcast; only its audio is re-synthesized
+ */
+export async function regenerateChapter(
+  podcastId: string,
+  chapterIndex: number,
+  instructions?: string
+): Promise<{
+  podcast_id: string;
+  podcast_url: string;
+  chapter: { index: number; title: string; script: string };
+  chapters: Array<{ index: number; title: string; segments_count: number }>;
+  synthesized_segments: number;
+  reused_segments: number;
+}> {
+  const response = await fetch(
+    `${API_BASE_URL}/podcasts/${podcastId}/chapters/${chapterIndex}/regenerate`,
+    {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ instructions }),
+    }
+  );
+  
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to regenerate chapter');
+  }
+  
+  return response.json();
+}
+
+/**
+ * Replace a podcast's script; only changed lines are re-synthesized
+ */
+export async function updatePodcastScript(
+  podcastId: string,
+  script: string
+): Promise<{
+  podcast_id: string;
+  podcast_url: string;
+  script: string;
+  chapters: Array<{ index: number; title: string; segments_count: number }>;
+  diff: { unchanged: number; changed: number; added: number; removed: number };
+  synthesized_segments: number;
+  reused_segments: number;
+}> {
+  const response = await fetch(`${API_BASE_URL}/podcasts/${podcastId}/script`, {
+    method: 'PUT',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ script }),
+  });
+  
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to update script');
+  }
+  
+  return response.json();
+}
+
 /**
  * Get all podcasts for a project
  */
@@ -223,15 +378,37 @@ export async function getProjectPodcasts(projectId: string): Promise<Podcast[]>
 }
 
 /**
- * Get audio URL for a podcast
+ * Get audio URL for a podcast; without a format the server negotiates one
  */
-export function getAudioUrl(filename: string): string {
-  return `${API_BASE_URL}/audio/${filename}`;
+export function getAudioUrl(
+  filename: string,
+  format?: 'mp3' | 'opus' | 'aac',
+  bitrate?: string
+): string {
+  const params = new URLSearchParams();
+  if (format) params.set('format', format);
+  if (bitrate) params.set('bitrate', bitrate);
+  const query = params.toString();
+  return `${API_BASE_URL}/audio/${filename}${query ? `?${query}` : ''}`;
+}
+
+/**
+ * Get text, block layout and word boxes of a PDF page
+ */
+export async function getPageLayout(projectId: string, page: number): Promise<PageLayout> {
+  const response = await fetch(`${API_BASE_URL}/projects/${projectId}/pages/${page}`);
+  
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to load page layout');
+  }
+  
+  return response.json();
 }
 
 /**
  * Get PDF URL for viewing
  */
-export function getPDFUrl(filename: string): string {
-  return `${API_BASE_URL}/pdf/${filename}`;
+export function getPDFUrl(projectId: string, filename: string): string {
+  return `${API_BASE_URL}/pdf/${projectId}/${encodeURIComponent(filename)}`;
 }